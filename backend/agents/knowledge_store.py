@@ -0,0 +1,240 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config.settings import settings
+from services.llm.embeddings import default_embeddings
+from agents.prompts.prompts import KnowledgeNugget, KnowledgeNuggetUpdate
+
+logger = logging.getLogger(__name__)
+
+NUGGET_ID_PREFIX = "K"
+MAX_SESSIONS = 64  # Knowledge stores kept in memory; evicted ones are rebuilt from graph state
+
+
+class KnowledgeStore:
+    """
+    Knowledge nuggets of one research session, indexed by embedding.
+
+    Nuggets get stable sequential IDs (K1, K2, ...) assigned by the store, so
+    IDs never collide and updates are dictionary lookups. A new nugget that is
+    nearly identical (cosine similarity >= merge_threshold) to a stored one is
+    merged into it instead of being added. Prompts use search() and
+    retrieve() to carry only the nuggets relevant to them.
+    """
+
+    def __init__(self, embeddings: Optional[Embeddings] = None, merge_threshold: Optional[float] = None):
+        self.embeddings = embeddings or default_embeddings()
+        self.merge_threshold = settings.KB_MERGE_SIMILARITY if merge_threshold is None else merge_threshold
+        self._nuggets: Dict[str, KnowledgeNugget] = {}
+        self._index: Optional[faiss.IndexIDMap2] = None
+        # faiss needs int64 IDs; nugget IDs may be strings from older sessions
+        self._vector_ids: Dict[str, int] = {}
+        self._nugget_ids: Dict[int, str] = {}
+        self._next_vector_id = 1
+        self._next_nugget = 1
+
+    @classmethod
+    def from_nuggets(cls, nuggets: Iterable[KnowledgeNugget], embeddings: Optional[Embeddings] = None) -> "KnowledgeStore":
+        """Rebuild a store (and its index) from the nuggets saved in graph state"""
+        store = cls(embeddings)
+        nuggets = list(nuggets)
+        for nugget in nuggets:
+            match = re.fullmatch(rf"{NUGGET_ID_PREFIX}(\d+)", nugget.nugget_id)
+            if match:
+                store._next_nugget = max(store._next_nugget, int(match.group(1)) + 1)
+        vectors = store._embed([nugget.content for nugget in nuggets])
+        for nugget, vector in zip(nuggets, vectors):
+            if nugget.nugget_id in store._nuggets:
+                # Random IDs from older sessions can collide
+                nugget = nugget.copy(update={"nugget_id": store._new_nugget_id()})
+            store._insert(nugget, vector)
+        return store
+
+    def __len__(self) -> int:
+        return len(self._nuggets)
+
+    @property
+    def nuggets(self) -> List[KnowledgeNugget]:
+        return list(self._nuggets.values())
+
+    def get(self, nugget_id: str) -> Optional[KnowledgeNugget]:
+        return self._nuggets.get(nugget_id)
+
+    def matches(self, nuggets: Sequence[KnowledgeNugget]) -> bool:
+        """Whether the store holds exactly these nuggets (by ID and content)"""
+        return [(nugget.nugget_id, nugget.content) for nugget in nuggets] == \
+            [(nugget.nugget_id, nugget.content) for nugget in self._nuggets.values()]
+
+    def add_many(self, nuggets: Sequence[KnowledgeNugget]) -> List[KnowledgeNugget]:
+        """
+        Add nuggets, merging near-duplicates into the nuggets they repeat.
+
+        Returns:
+            The stored nugget for each input (the existing one when merged)
+        """
+        stored = []
+        vectors = self._embed([nugget.content for nugget in nuggets])
+        for nugget, vector in zip(nuggets, vectors):
+            duplicate = self._nearest(vector)
+            if duplicate is not None and duplicate[1] >= self.merge_threshold:
+                existing = self._nuggets[duplicate[0]]
+                self._merge(existing, nugget)
+                stored.append(existing)
+                continue
+            nugget = nugget.copy(update={"nugget_id": self._new_nugget_id()})
+            self._insert(nugget, vector)
+            stored.append(nugget)
+        return stored
+
+    def add(self, nugget: KnowledgeNugget) -> KnowledgeNugget:
+        return self.add_many([nugget])[0]
+
+    def update(self, update: KnowledgeNuggetUpdate) -> bool:
+        """
+        Apply an update to a stored nugget.
+
+        Returns:
+            False if no nugget has the update's ID
+        """
+        nugget = self._nuggets.get(update.nugget_id)
+        if nugget is None:
+            return False
+        if update.content is not None and update.content != nugget.content:
+            nugget.content = update.content
+            vector_id = self._vector_ids[nugget.nugget_id]
+            self._index.remove_ids(np.array([vector_id], dtype=np.int64))
+            self._index.add_with_ids(self._embed([nugget.content]), np.array([vector_id], dtype=np.int64))
+        if update.confidence is not None:
+            nugget.confidence = update.confidence
+        if update.conflicts_with is not None:
+            nugget.conflicts_with = [nugget_id for nugget_id in update.conflicts_with if nugget_id in self._nuggets]
+        return True
+
+    def search(self, query: str, k: int) -> List[Tuple[KnowledgeNugget, float]]:
+        """Return up to k (nugget, cosine similarity) pairs most similar to query"""
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: Sequence[str], k: int) -> List[List[Tuple[KnowledgeNugget, float]]]:
+        if not queries:
+            return []
+        if self._index is None or not self._nuggets:
+            return [[] for _ in queries]
+        return self._search_vectors(self._embed(list(queries)), k)
+
+    def _search_vectors(self, vectors: np.ndarray, k: int) -> List[List[Tuple[KnowledgeNugget, float]]]:
+        scores, vector_ids = self._index.search(vectors, min(k, len(self._nuggets)))
+        return [
+            [
+                (self._nuggets[self._nugget_ids[vector_id]], float(score))
+                for score, vector_id in zip(row_scores, row_ids) if vector_id != -1
+            ]
+            for row_scores, row_ids in zip(scores, vector_ids)
+        ]
+
+    def retrieve(self,
+                 queries: Sequence[str],
+                 k_per_query: Optional[int] = None,
+                 limit: Optional[int] = None,
+                 query_vectors: Optional[Sequence[Sequence[float]]] = None) -> List[KnowledgeNugget]:
+        """
+        Nuggets relevant to any of the queries (e.g. checklist items): the top
+        k_per_query for each query, best first and without repeats, capped at
+        limit nuggets. query_vectors are further queries that are already
+        embedded (normalized), such as the passages from select_passages.
+        """
+        k_per_query = k_per_query or settings.KB_TOP_K_PER_ITEM
+        limit = limit or settings.KB_MAX_PROMPT_NUGGETS
+        results_per_query = self.search_many(queries, k_per_query)
+        if query_vectors and self._index is not None and self._nuggets:
+            results_per_query += self._search_vectors(np.asarray(query_vectors, dtype=np.float32), k_per_query)
+        best: Dict[str, float] = {}
+        for results in results_per_query:
+            for nugget, score in results:
+                best[nugget.nugget_id] = max(score, best.get(nugget.nugget_id, -1.0))
+        ranked = sorted(best, key=best.get, reverse=True)[:limit]
+        return [self._nuggets[nugget_id] for nugget_id in ranked]
+
+    def _new_nugget_id(self) -> str:
+        nugget_id = f"{NUGGET_ID_PREFIX}{self._next_nugget}"
+        self._next_nugget += 1
+        return nugget_id
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        # Normalized vectors make inner product equal to cosine similarity
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _nearest(self, vector: np.ndarray) -> Optional[Tuple[str, float]]:
+        if self._index is None or not self._nuggets:
+            return None
+        scores, vector_ids = self._index.search(vector.reshape(1, -1), 1)
+        if vector_ids[0][0] == -1:
+            return None
+        return self._nugget_ids[int(vector_ids[0][0])], float(scores[0][0])
+
+    def _insert(self, nugget: KnowledgeNugget, vector: np.ndarray) -> None:
+        if self._index is None:
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[-1]))
+        vector_id = self._next_vector_id
+        self._next_vector_id += 1
+        self._index.add_with_ids(vector.reshape(1, -1), np.array([vector_id], dtype=np.int64))
+        self._vector_ids[nugget.nugget_id] = vector_id
+        self._nugget_ids[vector_id] = nugget.nugget_id
+        self._nuggets[nugget.nugget_id] = nugget
+
+    def _merge(self, existing: KnowledgeNugget, duplicate: KnowledgeNugget) -> None:
+        existing.confidence = max(existing.confidence, duplicate.confidence)
+        for nugget_id in duplicate.conflicts_with:
+            if nugget_id in self._nuggets and nugget_id != existing.nugget_id \
+                    and nugget_id not in existing.conflicts_with:
+                existing.conflicts_with.append(nugget_id)
+
+
+class KnowledgeStoreRegistry:
+    """
+    Knowledge stores by graph thread ID.
+
+    The nuggets themselves live in graph state (and so in checkpoints); a store
+    missing here, e.g. after a restart or on another worker, or out of step
+    with the state, is rebuilt from the state's nuggets.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._stores: "OrderedDict[str, KnowledgeStore]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, thread_id: str, nuggets: Sequence[KnowledgeNugget]) -> KnowledgeStore:
+        with self._lock:
+            store = self._stores.get(thread_id)
+            if store is not None and store.matches(nuggets):
+                self._stores.move_to_end(thread_id)
+                return store
+
+        store = KnowledgeStore.from_nuggets(nuggets)
+        with self._lock:
+            self._stores[thread_id] = store
+            self._stores.move_to_end(thread_id)
+            while len(self._stores) > self.max_sessions:
+                self._stores.popitem(last=False)
+        return store
+
+    def discard(self, thread_id: str) -> None:
+        with self._lock:
+            self._stores.pop(thread_id, None)
+
+
+# Create a singleton instance
+knowledge_stores = KnowledgeStoreRegistry()
+
+__all__ = ['knowledge_stores', 'KnowledgeStore', 'KnowledgeStoreRegistry']
@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from config.settings import settings
+from services.llm.router import LatencyTracker
+from services.llm.scheduler import DEFAULT_OUTPUT_TOKENS, llm_scheduler
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_WINDOW = 50  # Recent call outcomes kept per (node, model) for the success rate
+MIN_OUTCOME_SAMPLES = 10  # Below this many outcomes a model is not demoted for failures
+DECISION_HISTORY = 200  # Recent routing decisions kept for inspection
+
+# Why a model was chosen
+PREFERRED = "preferred"
+LATENCY_SLO = "latency_slo"
+LOAD = "load"
+QUALITY = "quality"
+COST = "cost"
+PROBE = "probe"
+
+
+@dataclass
+class NodePolicy:
+    """
+    Model choice for one RAVE node (by its model config key, e.g. answer_model).
+
+    models: Models in order of preference; later ones are the faster or
+        cheaper fallbacks the node is demoted to.
+    latency_slo_seconds: A model whose rolling p95 call latency is above this
+        is skipped.
+    max_cost_per_call: A model whose average call costs more (USD) is skipped.
+    """
+    models: List[str]
+    latency_slo_seconds: Optional[float] = None
+    max_cost_per_call: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "NodePolicy":
+        return cls(
+            models=list(data["models"]),
+            latency_slo_seconds=data.get("latency_slo_seconds"),
+            max_cost_per_call=data.get("max_cost_per_call")
+        )
+
+
+@dataclass
+class RoutingDecision:
+    node: str
+    model: str
+    reason: str
+    skipped: Dict[str, str] = field(default_factory=dict)  # Model -> why it was passed over
+    at: float = field(default_factory=time.time)
+
+
+@dataclass
+class _ModelStats:
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=OUTCOME_WINDOW))
+    calls_with_usage: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        if len(self.outcomes) < MIN_OUTCOME_SAMPLES:
+            return None
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def average_cost(self, model: str) -> Optional[float]:
+        prices = settings.LLM_MODEL_COSTS.get(model)
+        if not prices or not self.calls_with_usage:
+            return None
+        return (self.prompt_tokens * prices["input"] + self.completion_tokens * prices["output"]) \
+            / self.calls_with_usage / 1_000_000
+
+
+class NodeModelRouter:
+    """
+    Picks the model for each RAVE node from its policy (RAVE_NODE_MODELS).
+
+    The node's preferred model is used unless the calls it made recently
+    show a problem: p95 latency above the node's SLO, too many failures, an
+    average cost above the node's limit, or (at the time of the call) a
+    scheduler queue for the model longer than RAVE_ROUTING_LOAD_WAIT_SECONDS.
+    The node is then demoted to the next model of its policy. Every
+    RAVE_ROUTING_PROBE_EVERY-th call of a node ignores past latency, failures
+    and cost, so a demoted model is tried again once it recovers.
+
+    Latency, failures and token usage are observed with a LangChain callback
+    attached to the models this router picks.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.policies = {
+            node: NodePolicy.from_dict(policy)
+            for node, policy in (settings.RAVE_NODE_MODELS if policies is None else policies).items()
+        }
+        self.latency = LatencyTracker()
+        self._stats: Dict[Tuple[str, str], _ModelStats] = {}
+        self._calls: Dict[str, int] = {}
+        self._decisions: Deque[RoutingDecision] = deque(maxlen=DECISION_HISTORY)
+        self._lock = threading.Lock()
+
+    def choose(self, node: str) -> Optional[RoutingDecision]:
+        """
+        Pick the model for the next call of node.
+
+        Returns:
+            The decision, or None if node has no policy
+        """
+        policy = self.policies.get(node)
+        if policy is None or not policy.models:
+            return None
+
+        with self._lock:
+            self._calls[node] = self._calls.get(node, 0) + 1
+            probe = self._calls[node] % settings.RAVE_ROUTING_PROBE_EVERY == 0
+
+        skipped: Dict[str, str] = {}
+        for model in policy.models[:-1]:
+            reason = self._demotion_reason(node, model, policy, probe)
+            if reason is None:
+                break
+            skipped[model] = reason
+        else:
+            model = policy.models[-1]
+
+        if skipped:
+            reason = next(iter(skipped.values()))
+        else:
+            reason = PROBE if probe and len(policy.models) > 1 else PREFERRED
+        decision = RoutingDecision(node=node, model=model, reason=reason, skipped=skipped)
+
+        with self._lock:
+            self._decisions.append(decision)
+        metrics.increment("rave_model_routes", node=node, model=model, reason=reason)
+        if skipped:
+            logger.info(f"Routing {node} to {model}, skipped {skipped}")
+        return decision
+
+    def callback(self, node: str, model: str) -> BaseCallbackHandler:
+        """Callback handler recording the outcome of calls node makes to model"""
+        return _RoutingCallback(self, node, model)
+
+    def record(self,
+               node: str,
+               model: str,
+               seconds: float,
+               ok: bool,
+               prompt_tokens: Optional[int] = None,
+               completion_tokens: Optional[int] = None) -> None:
+        with self._lock:
+            stats = self._stats.setdefault((node, model), _ModelStats())
+            stats.outcomes.append(ok)
+            if ok:
+                self.latency.record((node, model), seconds)
+            if prompt_tokens is not None or completion_tokens is not None:
+                stats.calls_with_usage += 1
+                stats.prompt_tokens += prompt_tokens or 0
+                stats.completion_tokens += completion_tokens or 0
+        metrics.observe("rave_model_call_seconds", seconds, node=node, model=model)
+        if not ok:
+            metrics.increment("rave_model_call_failures", node=node, model=model)
+
+    def recent_decisions(self) -> List[RoutingDecision]:
+        with self._lock:
+            return list(self._decisions)
+
+    def _demotion_reason(self, node: str, model: str, policy: NodePolicy, probe: bool) -> Optional[str]:
+        # Queued calls are a fact of the moment, so load demotes even probes
+        if llm_scheduler.estimated_wait(model, DEFAULT_OUTPUT_TOKENS * 2) > settings.RAVE_ROUTING_LOAD_WAIT_SECONDS:
+            return LOAD
+        if probe:
+            return None
+        with self._lock:
+            stats = self._stats.get((node, model))
+            p95 = self.latency.p95((node, model))
+        if stats is not None:
+            success_rate = stats.success_rate
+            if success_rate is not None and success_rate < settings.RAVE_ROUTING_MIN_SUCCESS_RATE:
+                return QUALITY
+        if policy.latency_slo_seconds is not None and p95 is not None and p95 > policy.latency_slo_seconds:
+            return LATENCY_SLO
+        if policy.max_cost_per_call is not None and stats is not None:
+            cost = stats.average_cost(model)
+            if cost is not None and cost > policy.max_cost_per_call:
+                return COST
+        return None
+
+
+class _RoutingCallback(BaseCallbackHandler):
+    """Reports the latency, outcome and token usage of model calls to the router"""
+
+    def __init__(self, router: NodeModelRouter, node: str, model: str):
+        self.router = router
+        self.node = node
+        self.model = model
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.monotonic()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.monotonic()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        if not response.llm_output:
+            # Answered from the response cache, so it says nothing about the model's latency or cost
+            return
+        usage = response.llm_output.get("token_usage") or {}
+        self.router.record(
+            self.node,
+            self.model,
+            time.monotonic() - started,
+            ok=True,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens")
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.router.record(self.node, self.model, time.monotonic() - started, ok=False)
+
+
+# Create a singleton instance
+node_model_router = NodeModelRouter()
+
+__all__ = ['node_model_router', 'NodeModelRouter', 'NodePolicy', 'RoutingDecision']
@@ -0,0 +1,100 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config.settings import settings
+from services.llm.embeddings import default_embeddings
+from services.llm.scheduler import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+
+def split_passages(docs: Sequence[Document],
+                   chunk_chars: Optional[int] = None,
+                   overlap_chars: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Split scraped pages into passages of about chunk_chars characters.
+
+    Returns:
+        Passages as {"content", "source_url"} dicts; repeated passages (e.g.
+        navigation text shared by pages of one site) are kept once
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_chars or settings.PASSAGE_CHUNK_CHARS,
+        chunk_overlap=overlap_chars if overlap_chars is not None else settings.PASSAGE_CHUNK_OVERLAP
+    )
+    passages = []
+    seen = set()
+    for doc in docs:
+        source_url = doc.metadata.get("source", "")
+        for text in splitter.split_text(doc.page_content or ""):
+            text = " ".join(text.split())
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            passages.append({"content": text, "source_url": source_url})
+    return passages
+
+
+def estimate_passage_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def select_passages(docs: Sequence[Document],
+                    queries: Sequence[str],
+                    token_budget: Optional[int] = None,
+                    max_per_source: Optional[int] = None,
+                    embeddings: Optional[Embeddings] = None) -> List[Dict[str, Any]]:
+    """
+    Pick the passages of the scraped pages most relevant to the queries.
+
+    Each passage is scored by its best cosine similarity to any query (the
+    question and the checklist items the answer is still weak on). Passages
+    are taken best first until token_budget is used, with at most
+    max_per_source passages from one page so one long page cannot crowd out
+    the others.
+
+    Returns:
+        Selected passages as {"content", "source_url", "score", "vector"} dicts,
+        best first; "vector" is the passage's normalized embedding, so later
+        steps can search with it instead of embedding the passage again
+    """
+    token_budget = token_budget or settings.PASSAGE_TOKEN_BUDGET
+    max_per_source = max_per_source or settings.PASSAGE_MAX_PER_SOURCE
+
+    passages = split_passages(docs)
+    queries = [query for query in queries if query]
+    if not passages or not queries:
+        return []
+
+    embeddings = embeddings or default_embeddings()
+    passage_vectors = np.asarray(embeddings.embed_documents([p["content"] for p in passages]), dtype=np.float32)
+    query_vectors = np.asarray(embeddings.embed_documents(list(queries)), dtype=np.float32)
+    faiss.normalize_L2(passage_vectors)
+    faiss.normalize_L2(query_vectors)
+    scores = (passage_vectors @ query_vectors.T).max(axis=1)
+
+    selected = []
+    used_tokens = 0
+    per_source: Dict[str, int] = {}
+    for index in np.argsort(-scores):
+        passage = passages[index]
+        tokens = estimate_passage_tokens(passage["content"])
+        if used_tokens + tokens > token_budget:
+            continue
+        if per_source.get(passage["source_url"], 0) >= max_per_source:
+            continue
+        per_source[passage["source_url"]] = per_source.get(passage["source_url"], 0) + 1
+        used_tokens += tokens
+        selected.append({**passage, "score": round(float(scores[index]), 4), "vector": passage_vectors[index].tolist()})
+
+    logger.info(f"Selected {len(selected)} of {len(passages)} passages ({used_tokens} tokens)")
+    return selected
+
+
+__all__ = ['select_passages', 'split_passages']
@@ -20,7 +20,6 @@ from langchain_community.document_loaders import WebBaseLoader
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import StreamWriter, Send, Command
 
 
@@ -29,6 +28,9 @@ import os
 
 from agents.prompts.mission_definition import MissionDefinitionPrompt, MissionProposal
 from agents.prompts.supervisor_prompt import SupervisorPrompt, SupervisorResponse
+from services.llm.streaming_json import StreamingJSONParser
+from services.llm.scheduler import rate_limiter_for
+from services.graph_checkpointer import checkpointer
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
@@ -48,6 +50,8 @@ class State(TypedDict):
     supervisor_response: SupervisorResponse
     next_node: str
 
+SUPERVISOR_RESPONSE_TYPES = {"FINAL_ANSWER", "MISSION_SPECIALIST", "WORKFLOW_SPECIALIST"}
+
 def validate_state(state: State) -> bool:
     """Validate the state before processing"""
     return True
@@ -58,7 +62,8 @@ def getModel(node_name: str, config: Dict[str, Any], writer: Optional[Callable]
     
     chat_config = {
         "model": model_name,
-        "api_key": OPENAI_API_KEY
+        "api_key": OPENAI_API_KEY,
+        "rate_limiter": rate_limiter_for(model_name)
     }
     
     return ChatOpenAI(**chat_config)
@@ -83,14 +88,8 @@ async def llm_call(state: State, writer: StreamWriter, config: Dict[str, Any]) -
     # Stream the response
     response_content = ""
     async for chunk in llm.astream(langchain_messages):
-        if writer:
-            writer({
-                "token": chunk.content,
-                "metadata": {
-                    "type": "token",
-                    "timestamp": datetime.now().isoformat()
-                }
-            })
+        if writer and chunk.content:
+            writer({"token": chunk.content})
         response_content += chunk.content
 
     try:
@@ -177,9 +176,25 @@ async def supervisor_node(state: State, writer: StreamWriter, config: Dict[str,
             workflow_status=workflow_status
         )
 
-        # Generate and parse the response
-        response = await llm.ainvoke(formatted_prompt)
-        supervisor_response = prompt.parse_response(response.content)
+        # Stream the response, surfacing the routing decision and answer text as they arrive;
+        # malformed output is left to the parse of the whole response below
+        parser = StreamingJSONParser()
+        response_text = ""
+        async for chunk in llm.astream(formatted_prompt):
+            response_text += chunk.content
+            for event in parser.try_feed(chunk.content):
+                if not writer:
+                    continue
+                if event.type == "field" and event.path == ("response_type",) \
+                        and event.value in SUPERVISOR_RESPONSE_TYPES:
+                    writer({
+                        "status": "supervisor_routing: " + event.value,
+                        "response_type": event.value
+                    })
+                elif event.type == "text_delta" and event.path == ("response_content",):
+                    writer({"token_delta": event.value, "field": "response_content"})
+
+        supervisor_response = prompt.parse_response(response_text)
         
         # Create a response message
         response_message = Message(
@@ -244,13 +259,20 @@ async def mission_proposal_node(state: State, writer: StreamWriter, config: Dict
             available_tools=tools_str
         )
 
-        print("Generating response...")
-        # Generate and parse the response
-        response = await llm.ainvoke(formatted_prompt)
-
-        print("Parsing response...")
-
-        mission_proposal = prompt.parse_response(response.content)
+        # Stream the response, surfacing each proposal field as soon as it is complete;
+        # malformed output is left to the parse of the whole response below
+        parser = StreamingJSONParser()
+        response_text = ""
+        async for chunk in llm.astream(formatted_prompt):
+            response_text += chunk.content
+            for event in parser.try_feed(chunk.content):
+                if writer and event.type == "field" and len(event.path) == 1:
+                    writer({
+                        "status": "mission_proposal_field: " + event.path[0],
+                        "mission_proposal_field": {"name": event.path[0], "value": event.value}
+                    })
+
+        mission_proposal = prompt.parse_response(response_text)
         
         mission_proposal_str = f"**Title:** {mission_proposal.title}\n**Goal:** {mission_proposal.goal}\n\n**Inputs needed:**\n" + "\n".join(f"- {input}" for input in mission_proposal.inputs) + "\n\n**Expected outputs:**\n" + "\n".join(f"- {output}" for output in mission_proposal.outputs) + "\n\n**Success criteria:**\n" + "\n".join(f"- {criteria}" for criteria in mission_proposal.success_criteria)
 
@@ -310,5 +332,5 @@ graph_builder.add_node("workflow_node", workflow_node)
 graph_builder.add_edge(START, "supervisor_node")
 
 # Compile the graph with streaming support
-compiled = graph_builder.compile()
+compiled = graph_builder.compile(checkpointer=checkpointer)
 graph = compiled 
\ No newline at end of file
@@ -1,5 +1,6 @@
-from typing import Dict, Any, Type
+from typing import Dict, Any, List, Type
 from pydantic import BaseModel
+from langchain_core.messages import BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 
@@ -7,6 +8,7 @@ class BasePrompt:
     """Base class for all prompts that encapsulates common functionality"""
     
     def __init__(self, response_model: Type[BaseModel]):
+        self.response_model = response_model
         self.parser = PydanticOutputParser(pydantic_object=response_model)
         self.format_instructions = self.parser.get_format_instructions()
         
@@ -22,6 +24,10 @@ class BasePrompt:
         # Format the template with the provided variables
         return prompt_template.format(**kwargs)
         
+    def get_formatted_messages(self, **kwargs: Dict[str, Any]) -> List[BaseMessage]:
+        """Get the formatted prompt messages without format instructions, for use with structured output"""
+        return self.get_prompt_template().format_messages(**kwargs)
+
     def get_prompt_template(self) -> ChatPromptTemplate:
         """Get the base prompt template. Must be implemented by subclasses."""
         raise NotImplementedError("Subclasses must implement get_prompt_template")
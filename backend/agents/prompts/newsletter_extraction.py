@@ -46,9 +46,7 @@ Article for extraction:
 Source: {source}
 Date: {date}
 
-{content}
-
-{format_instructions}"""
+{content}"""
 
     def get_prompt_template(self) -> ChatPromptTemplate:
         """Return a ChatPromptTemplate for newsletter extraction"""
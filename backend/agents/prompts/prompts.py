@@ -2,7 +2,6 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 from typing import List, Optional
-import random
 from datetime import datetime
 
 class ChecklistItem(BaseModel):
@@ -18,7 +17,7 @@ class KnowledgeNugget(BaseModel):
     source_url: str = Field(description="URL where this information was found")
     confidence: float = Field(description="Confidence in this information (0-1)", ge=0, le=1, default=1.0)
     conflicts_with: List[str] = Field(description="List of nugget IDs this conflicts with", default_factory=list)
-    nugget_id: str = Field(description="Unique identifier for this nugget", default_factory=lambda: str(random.randint(1000, 9999)))
+    nugget_id: str = Field(description="Unique identifier for this nugget (assigned by the knowledge base; leave empty for new nuggets)", default="")
 
 class KnowledgeNuggetUpdate(BaseModel):
     """Update to an existing knowledge nugget"""
@@ -119,22 +118,20 @@ def create_question_improvement_prompt():
         ("user", "{question}")
     ])
 
-def create_checklist_prompt(format_instructions: str):
+def create_checklist_prompt():
     """Create a prompt for generating answer requirements checklist"""
     return ChatPromptTemplate.from_messages([
         ("system", """You are an expert at breaking down questions into specific requirements for a complete answer.
         For the given question, generate a list of specific items that should be addressed in a well-formed answer.
-        Each item should be a clear, specific requirement that can be scored independently.
-        {format_instructions}"""),
+        Each item should be a clear, specific requirement that can be scored independently."""),
         ("user", "{question}")
     ])
 
-def create_scoring_prompt(format_instructions: str):
+def create_scoring_prompt():
     """Create a prompt for scoring answers against checklist requirements"""
     return ChatPromptTemplate.from_messages([
         ("system", """You are an expert at evaluating answers against specific requirements.
-        For each requirement in the checklist, score how well the answer addresses it on a scale of 0 to 1.
-        {format_instructions}"""),
+        For each requirement in the checklist, score how well the answer addresses it on a scale of 0 to 1."""),
         ("user", """Question: {question}
         Answer: {answer}
         Checklist: {checklist}
@@ -142,11 +139,14 @@ def create_scoring_prompt(format_instructions: str):
         Score each item in the checklist and return the updated checklist with scores.""")
     ])
 
-def create_kb_update_prompt(format_instructions: str):
+def create_kb_update_prompt():
     """Create a prompt for updating the knowledge base with new information"""
     return ChatPromptTemplate.from_messages([
         ("system", """You are an expert at analyzing and integrating information.
-        Your task is to update the knowledge base with new information from search results.
+        Your task is to update the knowledge base with new information from search results
+        and from the most relevant passages of the pages they link to.
+        Prefer the passages over the search snippets: they contain the pages' full text.
+        Use the source_url of the passage or result a nugget comes from.
         Current date: {current_date}
         
         For each piece of information:
@@ -159,18 +159,16 @@ def create_kb_update_prompt(format_instructions: str):
         When conflicts are found:
         1. Create a new nugget documenting the conflict
         2. Link conflicting nuggets together
-        3. Adjust confidence scores based on source reliability
-        
-        You MUST return a JSON object following these format instructions exactly:
-        {format_instructions}"""),
+        3. Adjust confidence scores based on source reliability"""),
         ("user", """Question: {question}
         Current Knowledge Base: {current_kb}
         New Search Results: {search_results}
+        Relevant Passages: {passages}
         
-        Analyze and update the knowledge base. Return a JSON object following the format instructions exactly:""")
+        Analyze and update the knowledge base.""")
     ])
 
-def create_url_selection_prompt(format_instructions: str):
+def create_url_selection_prompt():
     """Create a prompt for selecting the most relevant URLs from search results"""
     return ChatPromptTemplate.from_messages([
         ("system", """You are an expert at analyzing search results and identifying the most relevant sources.
@@ -185,9 +183,7 @@ def create_url_selection_prompt(format_instructions: str):
            - How directly it addresses the question
            - Source credibility and authority
            - Content depth and comprehensiveness
-           - Recency and timeliness
-        
-        {format_instructions}"""),
+           - Recency and timeliness"""),
         ("user", """Question: {question}
         Search Results: {search_results}
         
@@ -12,29 +12,28 @@ from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
 from langchain_community.document_loaders import WebBaseLoader
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import StreamWriter, Send
 
 
-from ..config.settings import (
-    DEFAULT_MODEL,
-    MAX_ITERATIONS,  
-    SCORE_THRESHOLD,
-    IMPROVEMENT_THRESHOLD,
-    MAX_SEARCH_RESULTS,
-    LOG_LEVEL,
-    LOG_FORMAT,
-    TAVILY_API_KEY,
-    OPENAI_API_KEY,
-    SERPAPI_API_KEY
-)
-
-from .prompts.prompts import (
+from config.settings import settings
+from services.llm.response_cache import langchain_response_cache
+from services.llm.structured_output import invoke_structured
+from services.run_manager import run_manager
+from services.llm.scheduler import rate_limiter_for
+from services.graph_checkpointer import checkpointer
+from services.llm.prompt_budget import PromptBudget, PromptSection, KEEP_WHOLE
+from services.research_memory import research_memory
+from services.search_ranking import rank_results, is_confident
+from services.search_cache import search_cache
+from agents.knowledge_store import knowledge_stores
+from agents.model_router import node_model_router
+from agents.passage_retrieval import select_passages
+
+from agents.prompts.prompts import (
     create_evaluator_prompt,
     create_gap_analyzer_prompt,
     create_query_generator_prompt,
@@ -49,9 +48,18 @@ from .prompts.prompts import (
     ChecklistResponse,
     KnowledgeNugget,
     KBUpdateResponse,
+    URLWithScore,
     URLSelectionResponse
 )
 
+DEFAULT_MODEL = settings.RAVE_DEFAULT_MODEL
+MAX_ITERATIONS = settings.RAVE_MAX_ITERATIONS
+SCORE_THRESHOLD = settings.RAVE_SCORE_THRESHOLD
+MAX_SEARCH_RESULTS = settings.RAVE_MAX_SEARCH_RESULTS
+OPENAI_API_KEY = settings.OPENAI_API_KEY
+TAVILY_API_KEY = settings.TAVILY_API_KEY
+SERPAPI_API_KEY = settings.SERPAPI_API_KEY
+
 class State(TypedDict):
     """State for the RAVE workflow"""
     messages: Annotated[list, add_messages]
@@ -62,10 +70,15 @@ class State(TypedDict):
     query_history: List[str]
     search_results: List[Dict[str, Any]]
     scraped_content: List[str] 
+    passages: List[Dict[str, Any]]
     urls_to_scrape: List[str]
     current_query: str
+    seed_queries: List[str]
+    productive_queries: List[str]
     knowledge_base: List[KnowledgeNugget]
+    reused_answer: bool
     cancelled: bool
+    run_options: Dict[str, Any]  # Configurable options of the run, reapplied when it is resumed
 
 def validate_state(state: State) -> bool:
     """Validate the state before processing"""
@@ -77,6 +90,9 @@ def validate_state(state: State) -> bool:
 def getModel(node_name: str, config: Dict[str, Any], writer: Optional[Callable] = None) -> ChatOpenAI:
     """Get the appropriate model for a given node.
     
+    A model named in the config for the node is used as is; otherwise the
+    node's routing policy picks one.
+    
     Args:
         node_name: The name of the node (e.g. 'question_model', 'answer_model')
         config: The configuration dictionary containing model settings
@@ -85,29 +101,51 @@ def getModel(node_name: str, config: Dict[str, Any], writer: Optional[Callable]
     Returns:
         ChatOpenAI instance configured with the appropriate model
     """
-    model_name = config["configurable"].get(node_name, DEFAULT_MODEL)
+    model_name = config["configurable"].get(node_name)
+    if not model_name:
+        decision = node_model_router.choose(node_name)
+        model_name = decision.model if decision else DEFAULT_MODEL
+        if decision and decision.skipped and writer:
+            writer({"msg": f"Using {model_name} for {node_name} ({decision.reason})"})
     
     # Special handling for non-chat models
     if model_name == "o1-pro":
         raise ValueError("o1-pro is not a chat model and cannot be used with chat completions")
     
-    # Get model configuration
-    from ..config.models import get_model_config
-    model_config = get_model_config(model_name)
-    
     # Create base model configuration
     chat_config = {
         "model": model_name,
-        "api_key": OPENAI_API_KEY
+        "api_key": OPENAI_API_KEY,
+        "rate_limiter": rate_limiter_for(model_name),
+        "callbacks": [node_model_router.callback(node_name, model_name)]
     }
     
     # Only add temperature for models that support it
-    if model_config.get("supports_temperature", True):
+    if not model_name.startswith(tuple(settings.RAVE_MODELS_WITHOUT_TEMPERATURE)):
         chat_config["temperature"] = 0.0
+        # Deterministic calls with identical prompts are answered from the response cache
+        chat_config["cache"] = langchain_response_cache
     
     return ChatOpenAI(**chat_config)
 
 
+def fit_prompt_sections(node_name: str, llm: ChatOpenAI, sections: List[PromptSection]) -> Dict[str, Any]:
+    """Fit prompt sections into the context window of the node's model, trimming low priority sections first"""
+    return PromptBudget(llm.model_name).fit(sections, call_site=f"rave_{node_name}").sections
+
+def template_text(prompt: ChatPromptTemplate) -> str:
+    """The fixed text of a chat prompt template, for counting it against the budget"""
+    return "".join(getattr(getattr(message, "prompt", None), "template", "") for message in prompt.messages)
+
+def weak_checklist_items(state: State, config: Dict[str, Any]) -> List[str]:
+    """Checklist items the current answer does not yet cover well (scored below the threshold)"""
+    score_threshold = config["configurable"].get("score_threshold", 1.0)
+    return [
+        item["item_to_score"] for item in state.get("scored_checklist", [])
+        if item.get("current_score", 0) < score_threshold
+    ]
+
+
 ### Nodes
 def improve_question(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
     """Improve the question for clarity and completeness"""
@@ -131,6 +169,40 @@ def improve_question(state: State, writer: StreamWriter, config: Dict[str, Any])
         writer({"msg": f"Error improving question: {str(e)}"})
         return {}
 
+def recall_research(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Reuse a fresh answer to the same question, or seed the run with knowledge from similar past runs"""
+    if not research_memory.enabled or not config["configurable"].get("use_research_memory", True):
+        return {}
+
+    writer({"msg": "Checking past research..."})
+    question = state.get("improved_question") or state["question"]
+
+    try:
+        recalled = research_memory.reusable_answer(question)
+        if recalled is not None:
+            writer({"msg": f"Reusing the answer to a previous research question ({recalled.similarity:.2f} similar)"})
+            return {
+                "answer": recalled.answer,
+                "scored_checklist": recalled.checklist,
+                "knowledge_base": [KnowledgeNugget(**nugget) for nugget in recalled.nuggets],
+                "search_results": recalled.search_results,
+                "reused_answer": True
+            }
+
+        nuggets, queries = research_memory.seed(question)
+        if not nuggets and not queries:
+            return {}
+
+        # Past nuggets get new IDs in this run's store
+        store = knowledge_stores.get(config["configurable"].get("thread_id", "default"), state.get("knowledge_base", []))
+        store.add_many([KnowledgeNugget(**nugget) for nugget in nuggets])
+        writer({"msg": f"Seeded research with {len(nuggets)} known facts and {len(queries)} past queries"})
+        return {"knowledge_base": store.nuggets, "seed_queries": queries}
+
+    except Exception as e:
+        writer({"msg": f"Error checking past research: {str(e)}"})
+        return {}
+
 def generate_scored_checklist(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
     """Generate a checklist of requirements for a well-formed answer"""
     writer({"msg": "Generating answer requirements checklist..."})
@@ -140,19 +212,13 @@ def generate_scored_checklist(state: State, writer: StreamWriter, config: Dict[s
         return {}
     
     llm = getModel("checklist_model", config, writer)
-    parser = PydanticOutputParser(pydantic_object=ChecklistResponse)
     
     try:
-        format_instructions = parser.get_format_instructions()
-        checklist_prompt = create_checklist_prompt(format_instructions)
-        formatted_prompt = checklist_prompt.format(
-            question=state["improved_question"],
-            format_instructions=format_instructions
+        checklist_prompt = create_checklist_prompt()
+        prompt_messages = checklist_prompt.format_messages(
+            question=state["improved_question"]
         )
-        checklist_response = llm.invoke(formatted_prompt)
-        
-        # Parse the response into checklist items
-        parsed_response = parser.parse(checklist_response.content)
+        parsed_response = invoke_structured(llm, prompt_messages, ChecklistResponse, "scored_checklist")
         checklist_items = [item.dict() for item in parsed_response.items]
         
         writer({"msg": "Scorecard generated successfully"})
@@ -170,6 +236,17 @@ def generate_query(state: State, writer: StreamWriter, config: Dict[str, Any]) -
         writer({"msg": "Error: No question provided"})
         return {}
     
+    # Queries that found new knowledge for similar past questions are tried first
+    query_history = state.get("query_history", [])
+    seed_queries = [query for query in state.get("seed_queries", []) if query not in query_history]
+    if seed_queries:
+        writer({"msg": "Using a search query from past research"})
+        return {
+            "current_query": seed_queries[0],
+            "query_history": query_history + [seed_queries[0]],
+            "seed_queries": seed_queries[1:]
+        }
+    
     llm = getModel("query_model", config, writer)
     query_generator_prompt = create_query_generator_prompt()
     
@@ -267,13 +344,18 @@ def search2(state: State, writer: StreamWriter) -> AsyncIterator[Dict[str, Any]]
             "api_key": SERPAPI_API_KEY
         }
         
-        search = GoogleSearch(params)
-        results = search.get_dict()
+        # Identical queries reuse cached results instead of spending SerpAPI quota
+        organic_results = search_cache.get_or_search_sync(
+            "serpapi",
+            current_query,
+            {"engine": "google"},
+            lambda: GoogleSearch(params).get_dict().get("organic_results", [])
+        )
         
         # Format results to match Tavily's format
         formatted_results = []
-        if "organic_results" in results:
-            for result in results["organic_results"]:
+        if organic_results:
+            for result in organic_results:
                 formatted_results.append({
                     "title": result.get("title", ""),
                     "link": result.get("link", ""),
@@ -307,23 +389,45 @@ def get_best_urls_from_search(state: State, writer: StreamWriter, config: Dict[s
         print("No search results available to analyze")
         return {"urls_to_scrape": []}
     
+    # Rank results locally against the question and the checklist items still below threshold
+    weak_items = weak_checklist_items(state, config)
+    try:
+        ranked = rank_results(state["search_results"], state["improved_question"], weak_items)
+    except Exception as e:
+        if writer:
+            writer({"msg": f"Error ranking search results, using them unranked: {str(e)}"})
+        ranked = None
+
+    if ranked is not None:
+        if not ranked:
+            return {"urls_to_scrape": []}
+        if is_confident(ranked):
+            urls_to_scrape = [
+                URLWithScore(url=item.url, score=int(item.relevance_score))
+                for item in ranked[:settings.SEARCH_RANK_CONFIDENT_URLS]
+            ]
+            if writer:
+                writer({"msg": f"Selected {len(urls_to_scrape)} relevant URLs for scraping"})
+            return {"urls_to_scrape": urls_to_scrape}
+        # Only the top candidates are shown to the model
+        candidates = [
+            {"title": item.result.get("title", ""), "link": item.url, "snippet": item.result.get("snippet", "")}
+            for item in ranked[:settings.SEARCH_RANK_LLM_CANDIDATES]
+        ]
+    else:
+        candidates = state["search_results"]
+    
     llm = getModel("url_model", config, writer)
-    parser = PydanticOutputParser(pydantic_object=URLSelectionResponse)
-    format_instructions = parser.get_format_instructions()
-    url_selection_prompt = create_url_selection_prompt(format_instructions)
+    url_selection_prompt = create_url_selection_prompt()
     
     try:
-        formatted_prompt = url_selection_prompt.format(
+        prompt_messages = url_selection_prompt.format_messages(
             question=state["improved_question"],
-            search_results=json.dumps(state["search_results"]),
-            format_instructions=format_instructions
+            search_results=json.dumps(candidates)
         )
-        
-        url_response = llm.invoke(formatted_prompt)
 
-        # Parse the response using Pydantic
         try:
-            parsed_response = parser.parse(url_response.content)
+            parsed_response = invoke_structured(llm, prompt_messages, URLSelectionResponse, "url_selection")
             # Return the full URLWithScore objects
             urls_to_scrape = parsed_response.urls
             
@@ -398,6 +502,31 @@ def scrape_urls(state: State, writer: StreamWriter, config: Dict[str, Any]) -> A
 
     return {"scraped_content": docs}
 
+def select_relevant_passages(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Pick the scraped passages most relevant to the question and the weak checklist items"""
+    if writer:
+        writer({"msg": "Selecting relevant passages from scraped pages..."})
+
+    scraped_content = state.get("scraped_content", [])
+    if not scraped_content:
+        return {"passages": []}
+
+    weak_items = weak_checklist_items(state, config)
+
+    try:
+        passages = select_passages(
+            scraped_content,
+            [state.get("improved_question") or state["question"]] + weak_items
+        )
+        if writer:
+            writer({"msg": f"Selected {len(passages)} relevant passages"})
+        return {"passages": passages}
+
+    except Exception as e:
+        if writer:
+            writer({"msg": f"Error selecting passages: {str(e)}"})
+        return {"passages": []}
+
 def update_knowledge_base(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
     """Update the knowledge base with new information from search results"""
     writer({"msg": "Updating knowledge base..."})
@@ -407,63 +536,74 @@ def update_knowledge_base(state: State, writer: StreamWriter, config: Dict[str,
         return {}
     
     llm = getModel("kb_model", config)
-    parser = PydanticOutputParser(pydantic_object=KBUpdateResponse)
     
     try:
-        # Get current knowledge base and search results
+        # Get current knowledge base, search results and passages from the scraped pages
         current_kb = state.get("knowledge_base", [])
         search_results = state.get("search_results", [])
+        passages = state.get("passages", [])
         
-        if not search_results:
+        if not search_results and not passages:
             writer({"msg": "No new search results to incorporate"})
             return {"knowledge_base": current_kb}
         
-        # Get format instructions and create prompt
-        format_instructions = parser.get_format_instructions()
-        kb_update_prompt = create_kb_update_prompt(format_instructions)
+        store = knowledge_stores.get(config["configurable"].get("thread_id", "default"), current_kb)
+
+        # Only the existing nuggets related to the new results are sent to the model;
+        # passages were embedded when they were selected
+        result_texts = [
+            str(result.get("content") or result.get("title", "")) if isinstance(result, dict) else str(result)
+            for result in search_results
+        ]
+        passage_vectors = [passage["vector"] for passage in passages if passage.get("vector")]
+        result_texts += [passage["content"] for passage in passages if not passage.get("vector")]
+        related_kb = store.retrieve(result_texts, query_vectors=passage_vectors)
+
+        kb_update_prompt = create_kb_update_prompt()
         
-        # Format the prompt with current KB and new search results
+        # Format the prompt with the related KB nuggets and new search results
         current_date = datetime.now().strftime("%Y-%m-%d")
-        formatted_prompt = kb_update_prompt.format(
+        sections = fit_prompt_sections("kb_model", llm, [
+            PromptSection("instructions", template_text(kb_update_prompt) + state["improved_question"],
+                          priority=3, min_tokens=KEEP_WHOLE),
+            PromptSection("current_kb", json.dumps([nugget.dict() for nugget in related_kb]), priority=2),
+            PromptSection("passages", json.dumps([
+                {"content": passage["content"], "source_url": passage["source_url"]} for passage in passages
+            ]), priority=1),
+            PromptSection("search_results", json.dumps(search_results), priority=0)
+        ])
+        prompt_messages = kb_update_prompt.format_messages(
             question=state["improved_question"],
-            current_kb=json.dumps([nugget.dict() for nugget in current_kb]),
-            search_results=json.dumps(search_results),
-            current_date=current_date,
-            format_instructions=format_instructions
+            current_kb=sections["current_kb"],
+            search_results=sections["search_results"],
+            passages=sections["passages"],
+            current_date=current_date
         )
         
-        # Get LLM's analysis of how to update the KB
-        kb_update_response = llm.invoke(formatted_prompt)
-        
         try:
-            # Parse the response using Pydantic
-            update_data = parser.parse(kb_update_response.content)
-            
-            # Update the knowledge base
-            updated_kb = current_kb.copy()
+            # Get LLM's analysis of how to update the KB
+            update_data = invoke_structured(llm, prompt_messages, KBUpdateResponse, "kb_update")
             
             # Process updated nuggets
             for update in update_data.updated_nuggets:
-                # Find the existing nugget
-                existing_nugget = next((n for n in updated_kb if n.nugget_id == update.nugget_id), None)
-                if existing_nugget:
-                    # Update the nugget with new values
-                    if update.content is not None:
-                        existing_nugget.content = update.content
-                    if update.confidence is not None:
-                        existing_nugget.confidence = update.confidence
-                    if update.conflicts_with is not None:
-                        existing_nugget.conflicts_with = update.conflicts_with
+                if not store.update(update):
+                    print("KB update for unknown nugget:", update.nugget_id)
             
-            # Add new nuggets
-            updated_kb.extend(update_data.new_nuggets)
+            # Add new nuggets; near-duplicates are merged into the nuggets they repeat
+            added = len(store)
+            store.add_many(update_data.new_nuggets)
+            added = len(store) - added
             
-            writer({"msg": "Knowledge base updated successfully"})
-            return {"knowledge_base": updated_kb}
+            writer({"msg": f"Knowledge base updated successfully ({added} new, "
+                           f"{len(update_data.new_nuggets) - added} merged, {len(store)} total)"})
+            result = {"knowledge_base": store.nuggets}
+            if added and state.get("current_query"):
+                # Remembered with the session so similar questions can start with this query
+                result["productive_queries"] = state.get("productive_queries", []) + [state["current_query"]]
+            return result
             
         except Exception as parse_error:
             print("Error parsing KB update:", str(parse_error))
-            print("Response content:", kb_update_response.content)
             writer({"msg": f"Error parsing knowledge base update: {str(parse_error)}"})
             return {"knowledge_base": current_kb}
             
@@ -487,15 +627,26 @@ def generate_answer(state: State, writer: StreamWriter, config: Dict[str, Any])
         # Use the improved question if available, otherwise use the original
         question_to_use = state.get("improved_question", state["question"])
         
-        # Get checklist and knowledge base
+        # Get checklist and the knowledge base nuggets relevant to its items
         checklist = state.get("scored_checklist", [])
-        knowledge_base = state.get("knowledge_base", [])
+        checklist_items = [item["item_to_score"] for item in checklist]
+        store = knowledge_stores.get(
+            config["configurable"].get("thread_id", "default"),
+            state.get("knowledge_base", [])
+        )
+        knowledge_base = store.retrieve(checklist_items or [question_to_use])
         
         # Format the prompt with all necessary information and markdown instruction
+        sections = fit_prompt_sections("answer_model", llm, [
+            PromptSection("instructions", template_text(answer_prompt) + question_to_use,
+                          priority=2, min_tokens=KEEP_WHOLE),
+            PromptSection("checklist", json.dumps(checklist_items), priority=1),
+            PromptSection("knowledge_base", json.dumps([nugget.dict() for nugget in knowledge_base]), priority=0)
+        ])
         formatted_prompt = answer_prompt.format(
             question=question_to_use,
-            checklist=json.dumps([item["item_to_score"] for item in checklist]),
-            knowledge_base=json.dumps([nugget.dict() for nugget in knowledge_base]),
+            checklist=sections["checklist"],
+            knowledge_base=sections["knowledge_base"],
             format_instructions="Please format your answer in markdown, using appropriate headings, lists, and formatting to make the information clear and well-structured."
         )
         
@@ -517,20 +668,16 @@ def score_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) ->
         return {}
     
     llm = getModel("scoring_model", config)
-    parser = PydanticOutputParser(pydantic_object=ChecklistResponse)
     
     try:
-        format_instructions = parser.get_format_instructions()
-        scoring_prompt = create_scoring_prompt(format_instructions)
-        formatted_prompt = scoring_prompt.format(
+        scoring_prompt = create_scoring_prompt()
+        prompt_messages = scoring_prompt.format_messages(
             question=state["improved_question"],
             answer=state["answer"],
-            checklist=json.dumps([item["item_to_score"] for item in state["scored_checklist"]]),
-            format_instructions=format_instructions
+            checklist=json.dumps([item["item_to_score"] for item in state["scored_checklist"]])
         )
         
-        scoring_response = llm.invoke(formatted_prompt)
-        parsed_response = parser.parse(scoring_response.content)
+        parsed_response = invoke_structured(llm, prompt_messages, ChecklistResponse, "answer_scoring")
         
         # Convert Pydantic model back to dict format
         updated_checklist = [item.dict() for item in parsed_response.items]
@@ -546,6 +693,10 @@ def score_answer(state: State, writer: StreamWriter, config: Dict[str, Any]) ->
 def should_continue_searching(state: State, config: Dict[str, Any], writer: StreamWriter) -> bool:
     """Check if we should continue searching based on checklist scores and max iterations"""
     writer({"msg": "Evaluating whether to continue searching..."})
+
+    if state.get("cancelled") or run_manager.is_cancelled(config["configurable"].get("run_id")):
+        writer({"msg": "Run cancelled, stopping search"})
+        return False
     
     checklist = state.get("scored_checklist", [])
     if not checklist:
@@ -572,6 +723,34 @@ def should_continue_searching(state: State, config: Dict[str, Any], writer: Stre
         writer({"msg": "All items meet or exceed threshold, stopping search"})
         return False
 
+def remember_research(state: State, writer: StreamWriter, config: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Save the finished run's vetted knowledge, productive queries and (if it met the checklist) answer"""
+    if not research_memory.enabled or not config["configurable"].get("use_research_memory", True):
+        return {}
+    if state.get("cancelled") or run_manager.is_cancelled(config["configurable"].get("run_id")):
+        return {}
+
+    checklist = state.get("scored_checklist", [])
+    score_threshold = config["configurable"].get("score_threshold", 1.0)
+    complete = bool(checklist) and all(item.get("current_score", 0) >= score_threshold for item in checklist)
+
+    try:
+        research_memory.remember(
+            question=state.get("improved_question") or state["question"],
+            answer=state.get("answer") if complete else None,
+            checklist=checklist,
+            nuggets=[nugget.dict() for nugget in state.get("knowledge_base", [])],
+            queries=state.get("productive_queries", []),
+            search_results=state.get("search_results", [])
+        )
+    except Exception as e:
+        writer({"msg": f"Error saving research for reuse: {str(e)}"})
+    return {}
+
+def route_after_recall(state: State) -> str:
+    """Skip the research loop when a past answer was reused"""
+    return "reused" if state.get("reused_answer") else "research"
+
 ### Graph
 
 # Define the graph
@@ -579,23 +758,35 @@ graph_builder = StateGraph(State)
 
 # Add nodes
 graph_builder.add_node("improve_question", improve_question)
+graph_builder.add_node("recall_research", recall_research)
 graph_builder.add_node("generate_scored_checklist", generate_scored_checklist)
 graph_builder.add_node("generate_query", generate_query)
 graph_builder.add_node("search2", search2)
 graph_builder.add_node("get_best_urls_from_search", get_best_urls_from_search)
 graph_builder.add_node("scrape_urls", scrape_urls)
+graph_builder.add_node("select_relevant_passages", select_relevant_passages)
 graph_builder.add_node("update_knowledge_base", update_knowledge_base)
 graph_builder.add_node("generate_answer", generate_answer)
 graph_builder.add_node("score_answer", score_answer)
+graph_builder.add_node("remember_research", remember_research)
 
 # Add edges
 graph_builder.add_edge(START, "improve_question")
-graph_builder.add_edge("improve_question", "generate_scored_checklist")
+graph_builder.add_edge("improve_question", "recall_research")
+graph_builder.add_conditional_edges(
+    "recall_research",
+    route_after_recall,
+    {
+        "reused": END,  # A fresh answer to the same question was reused
+        "research": "generate_scored_checklist"
+    }
+)
 graph_builder.add_edge("generate_scored_checklist", "generate_query")
 graph_builder.add_edge("generate_query", "search2")
 graph_builder.add_edge("search2", "get_best_urls_from_search")
 graph_builder.add_edge("get_best_urls_from_search", "scrape_urls")
-graph_builder.add_edge("scrape_urls", "update_knowledge_base")
+graph_builder.add_edge("scrape_urls", "select_relevant_passages")
+graph_builder.add_edge("select_relevant_passages", "update_knowledge_base")
 graph_builder.add_edge("update_knowledge_base", "generate_answer")
 graph_builder.add_edge("generate_answer", "score_answer")
 graph_builder.add_conditional_edges(
@@ -603,10 +794,11 @@ graph_builder.add_conditional_edges(
     should_continue_searching,
     {
         True: "generate_query",  # If scores < threshold, go back to generate_query
-        False: END  # If all scores are above threshold, we're done
+        False: "remember_research"  # If all scores are above threshold, we're done
     }
 )
+graph_builder.add_edge("remember_research", END)
 
 # Compile the graph
-compiled = graph_builder.compile()
+compiled = graph_builder.compile(checkpointer=checkpointer)
 graph = compiled 
\ No newline at end of file
@@ -14,7 +14,6 @@ from langchain_community.document_loaders import WebBaseLoader
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import StreamWriter, Send, Command
 
 
@@ -24,6 +23,8 @@ import os
 from agents.prompts.mission_definition import MissionDefinitionPrompt, MissionProposal
 from agents.prompts.supervisor_prompt import SupervisorPrompt, SupervisorResponse
 from agents.prompts.stage_generator import StageGeneratorPrompt, StageGeneratorResponse
+from services.llm.scheduler import rate_limiter_for
+from services.graph_checkpointer import checkpointer
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
@@ -48,7 +49,8 @@ def getModel(node_name: str, config: Dict[str, Any], writer: Optional[Callable]
     
     chat_config = {
         "model": model_name,
-        "api_key": OPENAI_API_KEY
+        "api_key": OPENAI_API_KEY,
+        "rate_limiter": rate_limiter_for(model_name)
     }
     
     return ChatOpenAI(**chat_config)
@@ -146,5 +148,5 @@ graph_builder.add_node("stage_generator", stage_generator_node)
 graph_builder.add_edge(START, "stage_generator")
 
 # Compile the graph with streaming support
-compiled = graph_builder.compile()
+compiled = graph_builder.compile(checkpointer=checkpointer)
 graph = compiled 
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""add graph checkpoint tables
+
+Revision ID: add_graph_checkpoints
+Revises: merge_workflow_heads
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'add_graph_checkpoints'
+down_revision = 'merge_workflow_heads'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+
+    if 'graph_checkpoints' not in tables:
+        op.create_table('graph_checkpoints',
+            sa.Column('thread_id', sa.String(255), nullable=False),
+            sa.Column('checkpoint_ns', sa.String(255), nullable=False, server_default=''),
+            sa.Column('checkpoint_id', sa.String(64), nullable=False),
+            sa.Column('parent_checkpoint_id', sa.String(64), nullable=True),
+            sa.Column('type', sa.String(64), nullable=True),
+            sa.Column('checkpoint', mysql.LONGBLOB(), nullable=False),
+            sa.Column('metadata_type', sa.String(64), nullable=True),
+            sa.Column('checkpoint_metadata', mysql.LONGBLOB(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True, server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.PrimaryKeyConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id')
+        )
+
+    if 'graph_checkpoint_writes' not in tables:
+        op.create_table('graph_checkpoint_writes',
+            sa.Column('thread_id', sa.String(255), nullable=False),
+            sa.Column('checkpoint_ns', sa.String(255), nullable=False, server_default=''),
+            sa.Column('checkpoint_id', sa.String(64), nullable=False),
+            sa.Column('task_id', sa.String(64), nullable=False),
+            sa.Column('idx', sa.Integer(), nullable=False),
+            sa.Column('channel', sa.String(255), nullable=False),
+            sa.Column('type', sa.String(64), nullable=True),
+            sa.Column('value', mysql.LONGBLOB(), nullable=False),
+            sa.Column('task_path', sa.String(255), nullable=False, server_default=''),
+            sa.PrimaryKeyConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id', 'task_id', 'idx')
+        )
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+    if 'graph_checkpoint_writes' in tables:
+        op.drop_table('graph_checkpoint_writes')
+    if 'graph_checkpoints' in tables:
+        op.drop_table('graph_checkpoints')
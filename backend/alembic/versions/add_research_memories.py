@@ -0,0 +1,47 @@
+"""add research memories table
+
+Revision ID: add_research_memories
+Revises: add_graph_checkpoints
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = 'add_research_memories'
+down_revision = 'add_graph_checkpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+
+    if 'research_memories' not in tables:
+        op.create_table('research_memories',
+            sa.Column('memory_id', sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column('question', sa.Text(), nullable=False),
+            sa.Column('question_embedding', mysql.BLOB(), nullable=False),
+            sa.Column('embedding_model', sa.String(100), nullable=False),
+            sa.Column('answer', mysql.LONGTEXT(), nullable=True),
+            sa.Column('checklist', sa.JSON(), nullable=True),
+            sa.Column('nuggets', sa.JSON(), nullable=True),
+            sa.Column('queries', sa.JSON(), nullable=True),
+            sa.Column('search_results', sa.JSON(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True, server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.PrimaryKeyConstraint('memory_id')
+        )
+        op.create_index('ix_research_memories_created_at', 'research_memories', ['created_at'])
+
+
+def downgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    tables = inspector.get_table_names()
+    if 'research_memories' in tables:
+        op.drop_index('ix_research_memories_created_at', table_name='research_memories')
+        op.drop_table('research_memories')
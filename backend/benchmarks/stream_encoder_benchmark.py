@@ -0,0 +1,124 @@
+"""
+Benchmark the SSE stream encoder against one-frame-per-token streaming.
+
+Runs the bot's supervisor node against a stand-in model that streams a
+supervisor JSON response token by token, and encodes the node's custom stream
+(routing status, one token_delta chunk per answer token, the final token)
+into SSE frames two ways:
+
+    baseline:  every chunk is its own frame, JSON-encoded with json.dumps
+    coalesced: chunks go through coalesce_tokens and encode_event
+
+For each it reports frames per response, bytes sent, frames/sec and CPU time
+per streamed response. "burst" feeds tokens as fast as possible (encoder
+throughput); "paced" feeds them at a realistic model speed (CPU per response).
+
+Usage (from the backend directory):
+    python -m benchmarks.stream_encoder_benchmark --tokens 2000 --responses 20
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from sse_starlette.sse import ServerSentEvent
+
+from agents import primary_agent
+from schemas.bot import Message, MessageRole
+from services.stream_encoder import coalesce_tokens, encode_event
+
+WORDS = "the quick brown fox jumps over a lazy dog while streaming tokens to clients".split()
+
+
+class StreamingModel:
+    """Stands in for the chat model, streaming a supervisor answer one token at a time"""
+
+    def __init__(self, tokens: int, interval: float):
+        self.tokens = tokens
+        self.interval = interval
+
+    async def astream(self, prompt):
+        yield SimpleNamespace(content='{"response_type": "FINAL_ANSWER", "response_content": "')
+        for index in range(self.tokens):
+            yield SimpleNamespace(content=WORDS[index % len(WORDS)] + " ")
+            if self.interval:
+                await asyncio.sleep(self.interval)
+        yield SimpleNamespace(content='"}')
+
+
+async def token_stream(tokens: int, interval: float):
+    """The custom stream the supervisor node writes for one answer"""
+    state = {
+        "messages": [Message(id="1", role=MessageRole.USER, content="Summarize the report", timestamp="")],
+        "mission": None
+    }
+    chunks: asyncio.Queue = asyncio.Queue()
+    # Only this node run sees the stand-in model
+    with patch.object(primary_agent, "getModel", lambda node_name, config, writer=None: StreamingModel(tokens, interval)):
+        node = asyncio.create_task(primary_agent.supervisor_node(state, chunks.put_nowait, {"configurable": {}}))
+        node.add_done_callback(lambda _: chunks.put_nowait(None))
+        while (chunk := await chunks.get()) is not None:
+            yield chunk
+        await node
+
+
+async def baseline(tokens: int, interval: float):
+    frames = size = 0
+    async for chunk in token_stream(tokens, interval):
+        frame = ServerSentEvent(data=json.dumps(chunk), id=str(frames + 1), event="message").encode()
+        frames += 1
+        size += len(frame)
+    return frames, size
+
+
+async def coalesced(tokens: int, interval: float):
+    frames = size = 0
+    async for chunk in coalesce_tokens(token_stream(tokens, interval)):
+        frame = ServerSentEvent(data=encode_event(chunk), id=str(frames + 1), event="message").encode()
+        frames += 1
+        size += len(frame)
+    return frames, size
+
+
+async def measure(name: str, encoder, tokens: int, responses: int, interval: float) -> None:
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    frames = size = 0
+    for _ in range(responses):
+        response_frames, response_size = await encoder(tokens, interval)
+        frames += response_frames
+        size += response_size
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    print(
+        f"  {name:<10} frames/response={frames / responses:>8.1f}"
+        f"  KB/response={size / responses / 1024:>7.1f}"
+        f"  frames/sec={frames / wall:>10.0f}"
+        f"  CPU ms/response={cpu * 1000 / responses:>8.2f}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000, help="Tokens per streamed response")
+    parser.add_argument("--responses", type=int, default=20, help="Responses per measurement")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="Model speed for the paced run")
+    args = parser.parse_args()
+
+    print(f"burst ({args.tokens} tokens x {args.responses} responses)")
+    await measure("baseline", baseline, args.tokens, args.responses, 0)
+    await measure("coalesced", coalesced, args.tokens, args.responses, 0)
+
+    # Paced responses take tokens / tokens_per_second seconds each, so run fewer of them
+    paced_responses = max(1, args.responses // 10)
+    interval = 1 / args.tokens_per_second
+    print(f"paced ({args.tokens_per_second:.0f} tokens/s, {paced_responses} responses)")
+    await measure("baseline", baseline, args.tokens, paced_responses, interval)
+    await measure("coalesced", coalesced, args.tokens, paced_responses, interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
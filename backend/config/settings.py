@@ -25,10 +25,20 @@ class Settings(BaseSettings):
     # API settings
     ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY")
     ANTHROPIC_MODEL: str = "claude-3-sonnet-20240229"
+    ANTHROPIC_PROMPT_CACHE_ENABLED: bool = True  # Mark stable prompt prefixes with cache_control
+    ANTHROPIC_PROMPT_CACHE_MIN_CHARS: int = 4000  # Roughly the 1024-token minimum cacheable prefix
     GOOGLE_SEARCH_API_KEY: str = os.getenv("GOOGLE_SEARCH_API_KEY")
     GOOGLE_SEARCH_ENGINE_ID: str = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
     GOOGLE_SEARCH_NUM_RESULTS: int = 10
+    SEARCH_RANK_QUESTION_WEIGHT: float = 0.5  # Weight of the question vs. the unmet requirements in result ranking
+    SEARCH_RANK_MAX_PER_DOMAIN: int = 2  # Ranked results kept from one site
+    SEARCH_RANK_DUPLICATE_SIMILARITY: float = 0.95  # Results this similar to a better ranked one are dropped
+    SEARCH_RANK_LLM_CANDIDATES: int = 8  # Top ranked results shown to the model that picks URLs to scrape
+    SEARCH_RANK_CONFIDENT_SCORE: float = 0.6  # Similarity at which a result is picked without asking the model
+    SEARCH_RANK_CONFIDENT_URLS: int = 3  # URLs scraped when the top ranked results are all confident
+    SEARCH_BATCH_MAX_CONCURRENCY: int = 4  # Searches of one batch request running at a time
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+    NCBI_API_KEY: str = os.getenv("NCBI_API_KEY", "")  # Optional; raises the PubMed rate limit
 
     # Google OAuth2 settings
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID")
@@ -55,6 +65,139 @@ class Settings(BaseSettings):
     LOG_SENSITIVE_FIELDS: list[str] = ["password", "token", "secret", "key", "authorization"]
     LOG_PERFORMANCE_THRESHOLD_MS: int = 500  # Log slow operations above this threshold
 
+    # Workflow step result cache settings
+    STEP_CACHE_TTL_SECONDS: int = 3600  # How long a step result can be reused
+    STEP_CACHE_MAX_ENTRIES: int = 256  # Least recently used results are evicted above this size
+
+    # Persistent cache settings
+    CACHE_DIR: str = "cache"  # Directory for local SQLite cache files
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600  # How long an identical prompt reuses its response
+    LLM_CACHE_MAX_ENTRIES: int = 5000  # Least recently used responses are evicted above this size
+
+    # PubMed settings
+    PUBMED_FETCH_CHUNK_SIZE: int = 200  # Articles per efetch request
+    PUBMED_MAX_CONCURRENT_FETCHES: int = 3  # efetch requests of one search in flight at a time
+    PUBMED_REQUESTS_PER_SECOND: float = 3.0  # NCBI limit per process without an API key
+    PUBMED_REQUESTS_PER_SECOND_WITH_KEY: float = 10.0
+    PUBMED_MAX_RETRIES: int = 3  # Retries of rate limited (429) or failed (5xx) requests
+    PUBMED_ARTICLE_CACHE_ENABLED: bool = True
+    PUBMED_ARTICLE_TTL_SECONDS: int = 30 * 24 * 3600  # How long an indexed (MEDLINE) article is reused
+    PUBMED_UNINDEXED_ARTICLE_TTL_SECONDS: int = 24 * 3600  # Articles still in process gain MeSH terms and corrections
+    PUBMED_ARTICLE_CACHE_MAX_ENTRIES: int = 200000
+
+    # Search result cache and quota settings
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_TTL_SECONDS: int = 24 * 3600  # How long identical searches reuse results
+    SEARCH_CACHE_MAX_ENTRIES: int = 20000
+    SEARCH_DAILY_QUOTAS: dict[str, int] = {  # Paid requests per day per provider
+        "google": 10000,
+        "serpapi": 3000,
+    }
+    SEARCH_USER_DAILY_QUOTA: int = 500  # Paid requests per user per day, across providers (0 for no limit)
+    SEARCH_QUOTA_RESERVE: float = 0.1  # Share of a quota kept back; near it, expired cached results are served instead
+    SEARCH_QUOTA_TIMEZONE: str = "America/Los_Angeles"  # Google resets search quotas at midnight Pacific time
+
+    # Research knowledge base settings
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    KB_MERGE_SIMILARITY: float = 0.92  # Nuggets at least this similar (cosine) to a stored one are merged into it
+    KB_TOP_K_PER_ITEM: int = 5  # Nuggets retrieved per checklist item or search result
+    KB_MAX_PROMPT_NUGGETS: int = 20  # Most nuggets sent in one prompt
+    PASSAGE_CHUNK_CHARS: int = 1500  # Size of the passages scraped pages are split into
+    PASSAGE_CHUNK_OVERLAP: int = 200
+    PASSAGE_TOKEN_BUDGET: int = 3000  # Passage tokens sent to the knowledge base update
+    PASSAGE_MAX_PER_SOURCE: int = 4  # Most passages taken from one page
+
+    # Cross-session research memory settings
+    RESEARCH_MEMORY_ENABLED: bool = True
+    RESEARCH_MEMORY_ANSWER_SIMILARITY: float = 0.95  # Question similarity (cosine) needed to reuse a past answer
+    RESEARCH_MEMORY_ANSWER_TTL_SECONDS: int = 7 * 24 * 3600  # Past answers older than this are never reused
+    RESEARCH_MEMORY_SEED_SIMILARITY: float = 0.8  # Question similarity needed to seed a run with past knowledge
+    RESEARCH_MEMORY_SEED_SESSIONS: int = 3  # Most past sessions a run is seeded from
+    RESEARCH_MEMORY_SEED_QUERIES: int = 3  # Most past queries a run starts with
+    RESEARCH_MEMORY_MIN_CONFIDENCE: float = 0.7  # Nuggets below this confidence are not remembered
+    RESEARCH_MEMORY_MAX_ENTRIES: int = 10000  # Oldest sessions are deleted above this count
+
+    # Streamed graph run settings
+    RUN_DISCONNECT_POLL_SECONDS: float = 1.0  # How often a run checks whether its client is still connected
+    RUN_DISCONNECT_GRACE_SECONDS: float = 30.0  # How long a run without clients waits for a reconnect
+    RUN_RETENTION_SECONDS: int = 600  # How long finished runs stay available for reconnects
+    RUN_REPLAY_BUFFER_EVENTS: int = 1000  # Events kept in memory per run for reconnects
+    RUN_REPLAY_SPILL_ENABLED: bool = False  # Spill events evicted from the buffer to a local SQLite file
+    RUN_REPLAY_SPILL_MAX_EVENTS: int = 100000
+    GRAPH_CHECKPOINT_TTL_SECONDS: int = 24 * 3600  # How long checkpoints of unfinished runs are kept for resumes
+    GRAPH_CHECKPOINT_SWEEP_SECONDS: int = 3600  # How often expired checkpoints are deleted
+    STREAM_COALESCE_SECONDS: float = 0.05  # Longest time a streamed token delta is held back to merge with the next (0 disables)
+    STREAM_COALESCE_MAX_CHARS: int = 1024  # Merged token delta text sent as soon as it reaches this size
+
+    # Agent run admission settings
+    ADMISSION_MAX_ACTIVE_RUNS: int = 16  # Concurrent graph runs per worker
+    ADMISSION_MAX_RUNS_PER_USER: int = 2  # Concurrent graph runs per user (also caps their queued runs)
+    ADMISSION_MAX_QUEUED_RUNS: int = 32  # Runs waiting for a slot before new requests get a 429
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 60.0  # Longest a queued run waits before giving up
+
+    # LLM call scheduler settings
+    LLM_SCHEDULER_ENABLED: bool = True
+    LLM_DEFAULT_RPM: int = 500  # Requests per minute for models without an explicit limit
+    LLM_DEFAULT_TPM: int = 200000  # Tokens per minute for models without an explicit limit
+    LLM_MODEL_RATE_LIMITS: dict[str, dict[str, int]] = {
+        "gpt-4o": {"rpm": 500, "tpm": 300000},
+        "gpt-4o-mini": {"rpm": 500, "tpm": 1000000},
+        "claude-3-sonnet-20240229": {"rpm": 50, "tpm": 80000},
+    }
+    LLM_INTERACTIVE_WEIGHT: float = 8.0  # Share of capacity for interactive calls relative to batch calls
+
+    # LLM provider routing settings
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures before a provider is skipped
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0  # How long a provider is skipped before a trial call
+    # Routing policy per call site; call sites without one use the primary provider, then the others
+    LLM_ROUTE_POLICIES: dict[str, dict] = {
+        "bot_service": {"targets": [["openai"], ["anthropic"]], "hedge": True, "hedge_after_seconds": 8.0},
+        "execute_llm": {"targets": [["openai"], ["anthropic"]], "hedge": False},
+    }
+
+    # RAVE research agent settings
+    TAVILY_API_KEY: str = os.getenv("TAVILY_API_KEY", "")
+    SERPAPI_API_KEY: str = os.getenv("SERPAPI_API_KEY", "")
+    RAVE_DEFAULT_MODEL: str = "gpt-4o-mini"  # Model of nodes without a routing policy
+    RAVE_MAX_ITERATIONS: int = 3  # Search rounds before the answer is returned as is
+    RAVE_SCORE_THRESHOLD: float = 0.9  # Checklist score every item must reach to stop searching
+    RAVE_MAX_SEARCH_RESULTS: int = 5
+    RAVE_MODELS_WITHOUT_TEMPERATURE: list[str] = ["o1", "o3"]  # Model name prefixes that reject a temperature
+
+    # RAVE per-node model routing settings
+    # Models per node in order of preference; a node is demoted to its next model when the
+    # preferred one breaks its latency SLO (p95 seconds), fails too often, costs too much or is queued
+    RAVE_NODE_MODELS: dict[str, dict] = {
+        "question_model": {"models": ["gpt-4o-mini"], "latency_slo_seconds": 10.0},
+        "checklist_model": {"models": ["gpt-4o", "gpt-4o-mini"], "latency_slo_seconds": 20.0},
+        "query_model": {"models": ["gpt-4o-mini"], "latency_slo_seconds": 5.0},
+        "url_model": {"models": ["gpt-4o-mini"], "latency_slo_seconds": 10.0},
+        "kb_model": {"models": ["gpt-4o", "gpt-4o-mini"], "latency_slo_seconds": 30.0},
+        "answer_model": {"models": ["gpt-4o", "gpt-4o-mini"], "latency_slo_seconds": 60.0},
+        "scoring_model": {"models": ["gpt-4o", "gpt-4o-mini"], "latency_slo_seconds": 20.0},
+    }
+    LLM_MODEL_COSTS: dict[str, dict[str, float]] = {  # USD per million input / output tokens
+        "gpt-4o": {"input": 2.5, "output": 10.0},
+        "gpt-4o-mini": {"input": 0.15, "output": 0.6},
+    }
+    RAVE_ROUTING_LOAD_WAIT_SECONDS: float = 2.0  # Expected scheduler wait at which a node skips a model
+    RAVE_ROUTING_MIN_SUCCESS_RATE: float = 0.8  # Models failing more of their recent calls are skipped
+    RAVE_ROUTING_PROBE_EVERY: int = 20  # Every nth call of a node retries its preferred model
+
+    # Prompt budget settings
+    LLM_DEFAULT_CONTEXT_WINDOW: int = 128000  # Context window (tokens) for models without an explicit one
+    LLM_CONTEXT_WINDOWS: dict[str, int] = {
+        "gpt-4o": 128000,
+        "gpt-4o-mini": 128000,
+        "o1": 200000,
+        "o1-mini": 128000,
+        "o3-mini": 200000,
+        "claude-3-sonnet-20240229": 200000,
+        "claude-3-5-sonnet-20241022": 200000,
+    }
+    PROMPT_RESERVED_OUTPUT_TOKENS: int = 4096  # Context window tokens kept free for the response
+
     # Neo4j Settings
     NEO4J_URI: str = "neo4j+ssc://801e8074.databases.neo4j.io"
     NEO4J_API_KEY: str = os.getenv("NEO4J_API_KEY", "")
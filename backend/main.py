@@ -7,6 +7,8 @@ from database import get_db, init_db, engine, Base
 from models import Base as ModelBase
 from config import settings, setup_logging
 from middleware import LoggingMiddleware
+from utils.metrics import metrics
+from services import auth_service
 import sys
 from pydantic import ValidationError
 from starlette.responses import JSONResponse
@@ -81,6 +83,12 @@ async def health_check():
     return {"status": "healthy", "version": settings.SETTING_VERSION}
 
 
+@app.get("/api/metrics")
+async def get_metrics(current_user=Depends(auth_service.validate_token)):
+    """In-process counters and latency summaries (cache hit rates, queue waits, ...)"""
+    return metrics.snapshot()
+
+
 @app.exception_handler(ValidationError)
 async def validation_exception_handler(request: Request, exc: ValidationError):
     logger.error(f"Validation error in {request.url.path}:")
@@ -71,7 +71,10 @@ class Tool(Base):
                 
         if not isinstance(value, dict):
             return {"parameters": [], "outputs": []}
-            
+
+        # Compile the parameter and output schemas once, when the signature is set
+        from services.schema_registry import schema_registry
+        schema_registry.compile_signature(value)
         return value
 
 class PromptTemplate(Base):
@@ -119,7 +122,10 @@ class PromptTemplate(Base):
                 
         if not isinstance(value, dict):
             return {}
-            
+
+        # Compile the schema once, when it is set; executions reuse the validator
+        from services.schema_registry import schema_registry
+        schema_registry.get_validator(value)
         return value
 
 class WorkflowStep(Base):
@@ -306,7 +312,10 @@ class WorkflowVariable(Base):
                 
         if not isinstance(value, dict):
             return {}
-            
+
+        # Compile the schema once, when it is set; executions reuse the validator
+        from services.schema_registry import schema_registry
+        schema_registry.get_validator(value)
         return value
 
     @validates('io_type')
@@ -396,3 +405,49 @@ class Asset(Base):
     user = relationship("User", back_populates="assets")
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
 
+
+
+class GraphCheckpoint(Base):
+    """LangGraph checkpoint, saved after each completed step of a graph run"""
+    __tablename__ = "graph_checkpoints"
+
+    thread_id = Column(String(255), primary_key=True)
+    checkpoint_ns = Column(String(255), primary_key=True, default="")
+    checkpoint_id = Column(String(64), primary_key=True)
+    parent_checkpoint_id = Column(String(64), nullable=True)
+    type = Column(String(64), nullable=True)  # Serializer type of the checkpoint payload
+    checkpoint = Column(LargeBinary(length=2**32 - 1), nullable=False)
+    metadata_type = Column(String(64), nullable=True)
+    checkpoint_metadata = Column(LargeBinary(length=2**32 - 1), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GraphCheckpointWrite(Base):
+    """Pending write of a graph task, kept until its step's checkpoint is saved"""
+    __tablename__ = "graph_checkpoint_writes"
+
+    thread_id = Column(String(255), primary_key=True)
+    checkpoint_ns = Column(String(255), primary_key=True, default="")
+    checkpoint_id = Column(String(64), primary_key=True)
+    task_id = Column(String(64), primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    channel = Column(String(255), nullable=False)
+    type = Column(String(64), nullable=True)
+    value = Column(LargeBinary(length=2**32 - 1), nullable=False)
+    task_path = Column(String(255), nullable=False, default="")
+
+
+class ResearchMemory(Base):
+    """Finished RAVE research session, indexed by the embedding of its question for reuse across sessions"""
+    __tablename__ = "research_memories"
+
+    memory_id = Column(Integer, primary_key=True, autoincrement=True)
+    question = Column(Text, nullable=False)
+    question_embedding = Column(LargeBinary, nullable=False)  # float32 vector
+    embedding_model = Column(String(100), nullable=False)
+    answer = Column(Text, nullable=True)
+    checklist = Column(JSON, nullable=True)
+    nuggets = Column(JSON, nullable=True)  # Vetted knowledge nuggets
+    queries = Column(JSON, nullable=True)  # Queries whose results added knowledge
+    search_results = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -2,112 +2,303 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from datetime import datetime
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Callable, Optional
 import asyncio
 import json
+import logging
+import weakref
 from sse_starlette.sse import EventSourceResponse
 
 from database import get_db
 from services.bot_service import BotService
-from schemas import Message, ChatResponse, MessageRole, Asset, BotRequest, Mission, Tool
+from schemas import Message, ChatResponse, MessageRole, Asset, BotRequest, RaveRequest, Mission, Tool
 # from agents.simple_agent import graph, State
 from agents.primary_agent import graph, State
 from agents.workflow_agent import graph as workflow_graph
+from agents.rave_agent import graph as rave_graph, State as RaveState
+from config.settings import settings
+from services.graph_checkpointer import checkpointer
+from services.run_manager import run_manager, GraphRun
+from services.stream_encoder import coalesce_tokens, encode_event
+from services.admission_controller import admission_controller, AdmissionRejected, AdmissionTicket
+from services.auth_service import get_token_subject
+from services.llm.scheduler import llm_call_context, INTERACTIVE
 import uuid
 import os
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 router = APIRouter(prefix="/api/bot", tags=["bot"])
+logger = logging.getLogger(__name__)
 
 
-@router.post("/stream")
-async def bot_stream(request: Request, bot_request: BotRequest):
-    """Endpoint that streams responses from the graph"""
-    
+# Graphs that can be resumed from their checkpoints, by run kind
+GRAPHS = {
+    "bot": graph,
+    "workflow": workflow_graph,
+    "rave": rave_graph
+}
+
+
+def run_config(run: GraphRun, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Graph config for a run: the checkpoint thread, and the run ID so nodes can
+    look up their run (e.g. to check for cancellation), plus any options the
+    graph's nodes read from their config
+    """
+    return {"configurable": {**(options or {}), "thread_id": run.thread_id, "run_id": run.run_id}}
+
+
+async def delete_checkpoints(run: GraphRun) -> None:
+    """Delete the checkpoints of a completed run, which can no longer be resumed"""
+    try:
+        await checkpointer.adelete_thread(run.thread_id)
+    except Exception as e:
+        # Left for the TTL sweep
+        logger.error(f"Error deleting checkpoints of run {run.run_id}: {str(e)}")
+
+
+def admit_run(request: Request) -> AdmissionTicket:
+    """Admit or queue a run for the requesting user, or fail fast with a 429"""
+    user_key = get_token_subject(request.headers.get("Authorization"))
+    if user_key is None:
+        user_key = request.client.host if request.client else "anonymous"
+    try:
+        return admission_controller.enter(user_key)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+async def run_events(run: GraphRun, request: Request, after_id: int = 0) -> AsyncIterator[Dict[str, Any]]:
+    """SSE events of a run after the given event ID; the event IDs allow resuming with Last-Event-ID"""
+    try:
+        async for event_id, chunk in run_manager.events(run, request, after_id):
+            yield {
+                "event": "message",
+                "id": str(event_id),
+                "data": encode_event(chunk)
+            }
+
+    except Exception as e:
+        # Handle errors (including events that are no longer available for replay)
+        print(f"Error: {e}")
+        yield {
+            "event": "error",
+            "data": json.dumps({"status": "error", "message": str(e)})
+        }
+
+
+def stream_run(kind: str,
+               request: Request,
+               stream_factory: Callable[[GraphRun], AsyncIterator[Any]],
+               thread_id: Optional[str] = None) -> EventSourceResponse:
+    """
+    Start a graph run once admitted and stream its events as SSE.
+
+    While the run waits for a slot, its queue position is sent as "queue" events.
+    The run ID and checkpoint thread ID are sent as the first "run" event; the
+    run ID is also sent in the X-Run-ID header. Streamed token deltas are merged
+    into fewer, larger events (see coalesce_tokens). The checkpoints of a run
+    that completes are deleted; interrupted runs keep theirs for resuming.
+    """
+    ticket = admit_run(request)
+    run_id = str(uuid.uuid4())
+    run_owns_ticket = False
+
+    def release_unless_running() -> None:
+        # Once the run task exists, it releases the slot when it ends
+        if not run_owns_ticket:
+            ticket.release()
+
+    async def graph_stream(run: GraphRun) -> AsyncIterator[Any]:
+        async for chunk in stream_factory(run):
+            yield chunk
+        await delete_checkpoints(run)
+
     async def event_generator():
-        """Generate SSE events from graph outputs"""
+        nonlocal run_owns_ticket
         try:
-            # Convert history to Message objects
-            messages = [
-                Message(
-                    id=str(uuid.uuid4()),
-                    role=MessageRole.USER if msg.role == "user" else MessageRole.ASSISTANT,
-                    content=msg.content,
-                    timestamp=msg.timestamp.isoformat()
-                )
-                for msg in bot_request.history
-            ]
-            
-            # Add the current message
-            current_message = Message(
-                id=str(uuid.uuid4()),
-                role=MessageRole.USER,
-                content=bot_request.message,
-                timestamp=datetime.now().isoformat()
-            )
-            messages.append(current_message)
-            
-            state = State(
-                messages=messages,
-                mission=bot_request.mission,
-                mission_proposal=None,
-                supervisor_response=None,
-                next_node=None,
-                selectedTools=bot_request.selectedTools,
-                assets=[]
-            )
-            
-            # Stream responses from the graph
-            async for chunk in graph.astream(state, stream_mode="custom"):
+            try:
+                async for position in ticket.wait():
+                    yield {
+                        "event": "queue",
+                        "data": json.dumps({"run_id": run_id, "position": position})
+                    }
+            except asyncio.TimeoutError:
                 yield {
-                    "event": "message",
-                    "data": json.dumps(chunk)
+                    "event": "error",
+                    "data": json.dumps({"status": "error", "message": "Timed out waiting for a free run slot"})
                 }
-                
-        except Exception as e:
-            # Handle errors
-            print(f"Error: {e}")
+                return
+
+            # Run the graph in its own task so it stops when the client goes away
+            # The run task inherits the call context, so its LLM calls are scheduled for this user
+            with llm_call_context(user_id=ticket.user_key, priority=INTERACTIVE):
+                run = run_manager.start(
+                    kind,
+                    lambda run: coalesce_tokens(graph_stream(run)),
+                    run_id=run_id,
+                    thread_id=thread_id
+                )
+            run.task.add_done_callback(lambda _: ticket.release())
+            run_owns_ticket = True
+
             yield {
-                "event": "error",
-                "data": json.dumps({"status": "error", "message": str(e)})
+                "event": "run",
+                "data": json.dumps({"run_id": run.run_id, "thread_id": run.thread_id})
             }
+            async for event in run_events(run, request):
+                yield event
+        finally:
+            release_unless_running()
+
+    events = event_generator()
+    # A generator the response never starts iterating does not run its finally block
+    weakref.finalize(events, release_unless_running)
+    return EventSourceResponse(events, headers={"X-Run-ID": run_id})
+
+
+@router.post("/stream")
+async def bot_stream(request: Request, bot_request: BotRequest):
+    """Endpoint that streams responses from the graph"""
     
-    return EventSourceResponse(event_generator())
+    # Convert history to Message objects
+    messages = [
+        Message(
+            id=str(uuid.uuid4()),
+            role=MessageRole.USER if msg.role == "user" else MessageRole.ASSISTANT,
+            content=msg.content,
+            timestamp=msg.timestamp.isoformat()
+        )
+        for msg in bot_request.history
+    ]
+
+    # Add the current message
+    current_message = Message(
+        id=str(uuid.uuid4()),
+        role=MessageRole.USER,
+        content=bot_request.message,
+        timestamp=datetime.now().isoformat()
+    )
+    messages.append(current_message)
+
+    state = State(
+        messages=messages,
+        mission=bot_request.mission,
+        mission_proposal=None,
+        supervisor_response=None,
+        next_node=None,
+        selectedTools=bot_request.selectedTools,
+        assets=[]
+    )
+
+    return stream_run(
+        "bot", request,
+        lambda run: graph.astream(state, config=run_config(run), stream_mode="custom")
+    )
 
 
 @router.post("/workflow/stream")
 async def workflow_stream(request: Request, bot_request: BotRequest):
     """Endpoint that streams workflow generation responses"""
     
-    async def event_generator():
-        """Generate SSE events from workflow graph outputs"""
-        try:
-            
-            state = State(
-                messages=[],
-                mission=bot_request.mission,
-                mission_proposal=None,
-                supervisor_response=None,
-                next_node=None,
-                selectedTools=bot_request.selectedTools,
-                assets=[]
-            )
-            
-            # Stream responses from the workflow graph
-            async for chunk in workflow_graph.astream(state, stream_mode="custom"):
-                yield {
-                    "event": "message",
-                    "data": json.dumps(chunk)
-                }
-                
-        except Exception as e:
-            # Handle errors
-            print(f"Error: {e}")
-            yield {
-                "event": "error",
-                "data": json.dumps({"status": "error", "message": str(e)})
-            }
-    
-    return EventSourceResponse(event_generator())
+    state = State(
+        messages=[],
+        mission=bot_request.mission,
+        mission_proposal=None,
+        supervisor_response=None,
+        next_node=None,
+        selectedTools=bot_request.selectedTools,
+        assets=[]
+    )
+
+    return stream_run(
+        "workflow", request,
+        lambda run: workflow_graph.astream(state, config=run_config(run), stream_mode="custom")
+    )
+
+
+@router.post("/rave/stream")
+async def rave_stream(request: Request, rave_request: RaveRequest):
+    """Endpoint that streams the progress of a RAVE research run"""
+    options = {
+        "max_iterations": rave_request.max_iterations or settings.RAVE_MAX_ITERATIONS,
+        "score_threshold": rave_request.score_threshold or settings.RAVE_SCORE_THRESHOLD,
+        "use_research_memory": rave_request.use_research_memory
+    }
+    state = RaveState(
+        messages=[],
+        question=rave_request.question,
+        improved_question="",
+        scored_checklist=[],
+        answer="",
+        query_history=[],
+        search_results=[],
+        scraped_content=[],
+        passages=[],
+        urls_to_scrape=[],
+        current_query="",
+        seed_queries=[],
+        productive_queries=[],
+        knowledge_base=[],
+        reused_answer=False,
+        cancelled=False,
+        run_options=options
+    )
+
+    return stream_run(
+        "rave", request,
+        lambda run: rave_graph.astream(state, config=run_config(run, options), stream_mode="custom")
+    )
+
+
+@router.get("/runs/{run_id}/events")
+async def reconnect_run(request: Request, run_id: str, last_event_id: Optional[int] = None):
+    """
+    Reconnect to the event stream of a running or recently finished run.
+
+    Events after the Last-Event-ID header (or last_event_id query parameter)
+    are replayed, then the stream continues live; the graph is not re-run.
+    """
+    run = run_manager.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found or no longer available")
+    if last_event_id is None:
+        header = request.headers.get("Last-Event-ID", "")
+        last_event_id = int(header) if header.isdigit() else 0
+    return EventSourceResponse(run_events(run, request, last_event_id), headers={"X-Run-ID": run_id})
+
+
+@router.post("/runs/{thread_id}/resume")
+async def resume_run(request: Request, thread_id: str, kind: str = "bot"):
+    """Resume an interrupted graph run from its last completed step"""
+    resumed_graph = GRAPHS.get(kind)
+    if resumed_graph is None:
+        raise HTTPException(status_code=400, detail=f"Unknown graph: {kind}")
+
+    snapshot = await resumed_graph.aget_state({"configurable": {"thread_id": thread_id}})
+    if not snapshot.values:
+        raise HTTPException(status_code=404, detail="No checkpoint found for this thread")
+    if not snapshot.next:
+        raise HTTPException(status_code=409, detail="Run already completed")
+    if run_manager.is_thread_active(thread_id):
+        raise HTTPException(status_code=409, detail="Run is still in progress")
+
+    # No input: the graph continues from the saved checkpoint, with the options it was started with
+    options = snapshot.values.get("run_options")
+    return stream_run(
+        kind, request,
+        lambda run: resumed_graph.astream(None, config=run_config(run, options), stream_mode="custom"),
+        thread_id=thread_id
+    )
 
 
+@router.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: str):
+    """Cancel a streamed graph run by ID"""
+    if not run_manager.cancel(run_id, reason="user_request"):
+        raise HTTPException(status_code=404, detail="Run not found or already finished")
+    return {"run_id": run_id, "status": "cancelled"}
@@ -5,6 +5,7 @@ from datetime import datetime
 from services.auth_service import validate_token
 from services.email_service import EmailService
 from services.newsletter_extraction_service import NewsletterExtractionService
+from services.llm.scheduler import llm_call_context, BATCH
 from schemas.email import (
     EmailLabel,
     EmailMessage,
@@ -600,12 +601,13 @@ async def extract_newsletter_range(
                     errors.append(f"Newsletter {newsletter['id']}: No content found")
                     continue
                     
-                # Extract information using AI
-                extraction = await newsletter_extraction_service.extract_from_newsletter(
-                    content=content,
-                    source=newsletter['source_name'],
-                    date=str(newsletter['email_date'])
-                )
+                # Extract information using AI, yielding to interactive LLM traffic
+                with llm_call_context(user_id=user.email, priority=BATCH):
+                    extraction = await newsletter_extraction_service.extract_from_newsletter(
+                        content=content,
+                        source=newsletter['source_name'],
+                        date=str(newsletter['email_date'])
+                    )
                 
                 # Convert extraction to JSON string
                 extraction_json = json.dumps(extraction)
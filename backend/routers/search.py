@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, status, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List
 from database import get_db
-from schemas import SearchResult, URLContent, FetchURLsRequest
+from schemas import SearchResult, URLContent, FetchURLsRequest, BatchSearchRequest, BatchSearchResponse
 from services import auth_service, search_service
 import logging
 
@@ -49,7 +49,7 @@ async def fetch_urls(request: FetchURLsRequest,
 @router.get(
     "/search-and-rank",
     response_model=List[SearchResult],
-    summary="Search topics and their content with AI-powered relevance scoring",
+    summary="Search the web and rank results by embedding similarity to the query",
     responses={
         200: {
             "description": "Search results successfully retrieved and scored",
@@ -76,7 +76,7 @@ async def search_and_rank(
     db: Session = Depends(get_db)
 ):
     """
-    Search across topics and their content with AI-powered relevance scoring
+    Search the web and rank the results by embedding similarity to the query
 
     Parameters:
     - **query**: Search query string
@@ -85,6 +85,7 @@ async def search_and_rank(
 
     Returns a list of search results sorted by relevance score.
     Each result includes a relevance score indicating how well it matches the query.
+    Repeated and near-duplicate pages are left out.
     """
     logger.info(
         f"search_and_rank endpoint called with query: {query}, num_results: {num_results}, min_score: {min_score}")
@@ -139,6 +140,48 @@ async def search(
     return results[:num_results]
 
 
+@router.post(
+    "/batch",
+    response_model=BatchSearchResponse,
+    summary="Run several searches in one request and merge their results",
+    responses={
+        200: {
+            "description": "Search results successfully retrieved",
+            "model": BatchSearchResponse
+        },
+        401: {"description": "Not authenticated"}
+    }
+)
+async def batch_search(request: BatchSearchRequest,
+                       current_user=Depends(auth_service.validate_token),
+                       db: Session = Depends(get_db)
+                       ) -> BatchSearchResponse:
+    """
+    Run several web searches concurrently.
+
+    Args:
+        request: BatchSearchRequest containing:
+            - queries: Search queries (1-20)
+            - num_results: Number of results per query (1-10)
+            - fetch_top_n: Number of top unique results whose content to fetch (0-10)
+
+    Returns:
+        BatchSearchResponse containing:
+        - searches: Results of each query, in request order
+        - unique_results: Results of all queries deduplicated by canonical URL,
+          best ranked first, with the queries that returned them
+        - contents: Fetched content of the top unique results
+    """
+    logger.info(f"batch search endpoint called with {len(request.queries)} queries")
+    return await search_service.batch_search(
+        db,
+        request.queries,
+        current_user.user_id,
+        num_results=request.num_results,
+        fetch_top_n=request.fetch_top_n
+    )
+
+
 @router.get(
     "/fetch-url",
     response_model=URLContent,
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from uuid import uuid4
 import random
@@ -15,12 +15,17 @@ from schemas import (
     PromptTemplateCreate, PromptTemplateUpdate, PromptTemplateTest, ToolSignature
 )
 from services.ai_service import AIService
-from services.auth_service import validate_token
+from services.auth_service import validate_token, get_token_subject
 from models import User
 from services import ai_service
 from routers.files import get_file_content_as_text
 from services.workflow_service import WorkflowService
 from services.pubmed_service import pubmed_service
+from services.step_cache_service import step_cache
+from services.schema_registry import schema_registry
+from services.llm.prompt_budget import PromptBudget, PromptSection, KEEP_WHOLE
+from services.llm.scheduler import llm_call_context, INTERACTIVE
+from exceptions import VariableValidationError, InvalidVariableError
 
 router = APIRouter(
     prefix="/api",
@@ -35,10 +40,15 @@ async def process_template_with_files(
     system_message: str | None,
     file_tokens: List[Dict[str, str]],
     file_variables: Dict[str, str],
-    db: Session
+    db: Session,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None
 ) -> Tuple[List[Dict[str, Any]], str | None]:
     """
     Process a template with file tokens and return content parts and updated system message.
+
+    File texts that would not fit in the model's context window (with max_tokens
+    left for the response) are truncated, all files in proportion to their size.
     
     Args:
         user_message: The user message template with file tokens
@@ -46,11 +56,14 @@ async def process_template_with_files(
         file_tokens: List of file token definitions
         file_variables: Dictionary mapping token names to file IDs
         db: Database session
+        model: Model the prompt is for (defaults to the AI service's default model)
+        max_tokens: Tokens reserved for the response
         
     Returns:
         Tuple of (content parts list, updated system message)
     """
     content_parts = []
+    file_text_indices = []
     current_text = user_message
 
     # Handle file tokens
@@ -83,6 +96,7 @@ async def process_template_with_files(
 
         # Add extracted text if available
         if file.extracted_text:
+            file_text_indices.append(len(content_parts))
             content_parts.append({
                 'type': 'text',
                 'text': file.extracted_text
@@ -110,6 +124,22 @@ async def process_template_with_files(
             'text': current_text.strip()
         })
 
+    if file_text_indices:
+        budget = PromptBudget(model or ai_service.provider.get_default_model(), reserved_output_tokens=max_tokens)
+        template_parts = [part for index, part in enumerate(content_parts) if index not in file_text_indices]
+        prompt = budget.fit(
+            [
+                PromptSection("system", system_message or "", priority=1, min_tokens=KEEP_WHOLE),
+                PromptSection("template", [{'role': 'user', 'content': template_parts}], priority=1, min_tokens=KEEP_WHOLE)
+            ] + [
+                PromptSection(f"file_{index}", content_parts[index]['text'], priority=0)
+                for index in file_text_indices
+            ],
+            call_site="prompt_template_files"
+        )
+        for index in file_text_indices:
+            content_parts[index] = {'type': 'text', 'text': prompt[f"file_{index}"]}
+
     return content_parts, system_message
 
 @router.get("/tools", response_model=List[ToolResponse])
@@ -152,7 +182,11 @@ async def create_prompt_template(
     db: Session = Depends(get_db)
 ):
     """Create a new prompt template"""
-    db_template = PromptTemplate(**template.model_dump())
+    # The model compiles the output schema when it is set
+    try:
+        db_template = PromptTemplate(**template.model_dump())
+    except InvalidVariableError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     db.add(db_template)
     db.commit()
     db.refresh(db_template)
@@ -168,10 +202,14 @@ async def update_prompt_template(
     db_template = db.query(PromptTemplate).filter(PromptTemplate.template_id == template_id).first()
     if not db_template:
         raise HTTPException(status_code=404, detail="Template not found")
-    
-    for key, value in template.model_dump(exclude_unset=True).items():
-        setattr(db_template, key, value)
-    
+
+    try:
+        for key, value in template.model_dump(exclude_unset=True).items():
+            setattr(db_template, key, value)
+    except InvalidVariableError as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
     db.commit()
     db.refresh(db_template)
     return db_template
@@ -189,6 +227,7 @@ async def delete_prompt_template(template_id: str, db: Session = Depends(get_db)
 @router.post("/prompt-templates/test", response_model=LLMExecuteResponse)
 async def test_prompt_template(
     test_data: PromptTemplateTest,
+    http_request: Request,
     db: Session = Depends(get_db)
 ):
     """Test a prompt template with parameters"""
@@ -217,7 +256,8 @@ async def test_prompt_template(
             system_message=system_message,
             file_tokens=file_tokens,
             file_variables=test_data.parameters,
-            db=db
+            db=db,
+            max_tokens=1000
         )
 
         # Build messages array (only user message)
@@ -227,11 +267,16 @@ async def test_prompt_template(
         }]
 
         # Execute the LLM request with system message as separate parameter
-        response = await ai_service.send_messages(
-            messages=messages,
-            max_tokens=1000,
-            system=system_message if system_message else None
-        )
+        with llm_call_context(user_id=get_token_subject(http_request.headers.get("Authorization")), priority=INTERACTIVE):
+            response = await ai_service.send_messages(
+                messages=messages,
+                max_tokens=1000,
+                system=system_message if system_message else None,
+                # Cached responses are only reused for deterministic calls
+                temperature=0 if not test_data.bypass_cache else None,
+                use_cache=not test_data.bypass_cache,
+                call_site="prompt_template_test"
+            )
 
         # Process response based on schema type
         if test_data.output_schema["type"] == "object":
@@ -243,17 +288,25 @@ async def test_prompt_template(
                     detail=f"LLM response was not valid JSON: {str(e)}"
                 )
 
+        # Enforce the expected output schema
+        try:
+            schema_registry.validate("response", test_data.output_schema, response)
+        except VariableValidationError as e:
+            raise HTTPException(status_code=422, detail=e.message)
+
         return LLMExecuteResponse(
             template_id=None,
             messages=messages,
             response=response
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/execute_llm", response_model=LLMExecuteResponse)
-async def execute_llm(request: LLMExecuteRequest, db: Session = Depends(get_db)):
+async def execute_llm(request: LLMExecuteRequest, http_request: Request, db: Session = Depends(get_db)):
     """Execute an LLM prompt template with provided parameters"""
     template = db.query(PromptTemplate).filter(PromptTemplate.template_id == request.prompt_template_id).first()
     if not template:
@@ -272,6 +325,43 @@ async def execute_llm(request: LLMExecuteRequest, db: Session = Depends(get_db))
                 detail=f"Missing required file token: {token['name']}"
             )
 
+    # Enforce the template's tool signature on the step inputs. String tokens
+    # are rendered with str(), so only their presence and the file references are checked.
+    signature = WorkflowService(db)._build_llm_signature(template)
+    step_inputs = {name: str(value) for name, value in request.regular_variables.items()}
+    step_inputs.update(request.file_variables)
+    try:
+        schema_registry.validate_parameters(signature, step_inputs)
+    except VariableValidationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+    # Check the step result cache, keyed by template version and resolved inputs
+    file_versions = {}
+    if request.file_variables:
+        file_rows = db.query(File.file_id, File.updated_at).filter(
+            File.file_id.in_(list(request.file_variables.values()))
+        ).all()
+        updated_by_id = {row.file_id: row.updated_at for row in file_rows}
+        file_versions = {
+            name: [file_id, updated_by_id.get(file_id)]
+            for name, file_id in request.file_variables.items()
+        }
+    cache_key = step_cache.make_key(
+        tool_id="llm",
+        prompt_template_id=template.template_id,
+        template_version=template.updated_at.isoformat() if template.updated_at else None,
+        inputs={
+            "regular_variables": request.regular_variables,
+            "file_variables": file_versions,
+            "model": request.model,
+            "max_tokens": request.max_tokens
+        }
+    )
+    if not request.bypass_cache:
+        cached_response = step_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response.model_copy(update={"cached": True})
+
     try:
         # Format both templates
         user_message = template.user_message_template
@@ -292,7 +382,9 @@ async def execute_llm(request: LLMExecuteRequest, db: Session = Depends(get_db))
             system_message=system_message,
             file_tokens=file_tokens,
             file_variables=request.file_variables,
-            db=db
+            db=db,
+            model=request.model,
+            max_tokens=request.max_tokens
         )
 
         # Build messages array
@@ -301,13 +393,17 @@ async def execute_llm(request: LLMExecuteRequest, db: Session = Depends(get_db))
             'content': content_parts if content_parts else user_message
         }]
 
-        # Call LLM using AI service
-        llm_response = await ai_service.send_messages(
-            messages=messages,
-            model=request.model,
-            max_tokens=request.max_tokens,
-            system=system_message if system_message else None
-        )
+        # Call LLM using AI service. The step cache above is the only cache for
+        # LLM steps, so the LLM response cache is not consulted as well.
+        with llm_call_context(user_id=get_token_subject(http_request.headers.get("Authorization")), priority=INTERACTIVE):
+            llm_response = await ai_service.send_messages(
+                messages=messages,
+                model=request.model,
+                max_tokens=request.max_tokens,
+                system=system_message if system_message else None,
+                use_cache=False,
+                call_site="execute_llm"
+            )
 
         # Process response based on schema type
         response = llm_response
@@ -322,20 +418,38 @@ async def execute_llm(request: LLMExecuteRequest, db: Session = Depends(get_db))
                     detail=f"LLM response was not valid JSON: {str(e)}"
                 )
 
-        return LLMExecuteResponse(
+        # Enforce the template's output schema on the step output
+        try:
+            schema_registry.validate_outputs(signature, {"response": response})
+        except VariableValidationError as e:
+            raise HTTPException(status_code=422, detail=e.message)
+
+        execute_response = LLMExecuteResponse(
             template_id=template.template_id,
             messages=messages,
             response=response
         )
+        step_cache.set(cache_key, execute_response)
+        return execute_response
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/pubmed/search")
-async def search_pubmed(query: str, db: Session = Depends(get_db)):
+async def search_pubmed(query: str, bypass_cache: bool = False, db: Session = Depends(get_db)):
     """Search PubMed for articles"""
     try:
+        cache_key = step_cache.make_key(tool_id="pubmed_search", inputs={"query": query})
+        if not bypass_cache:
+            cached_results = step_cache.get(cache_key)
+            if cached_results is not None:
+                return cached_results
+
         results = await pubmed_service.search(query)
+        if results:
+            step_cache.set(cache_key, results)
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
@@ -2,7 +2,15 @@
 Schemas package for Fractal Bot API
 """
 
-from .search import SearchResult, URLContent, FetchURLsRequest
+from .search import (
+    SearchResult,
+    URLContent,
+    FetchURLsRequest,
+    BatchSearchRequest,
+    BatchSearchResponse,
+    BatchSearchResult,
+    QuerySearchResults
+)
 from .asset import Asset
 from .auth import (
     UserBase,
@@ -22,6 +30,7 @@ from .bot import (
     Workflow,
     Mission,
     BotRequest,
+    RaveRequest,
     Tool
 )
 
@@ -164,5 +173,6 @@ __all__ = [
     'Stage',
     'Asset',
     'BotRequest',
+    'RaveRequest',
     'Tool'
 ]  
\ No newline at end of file
@@ -178,3 +178,9 @@ class BotRequest(BaseModel):
     history: List[MessageHistory]
     mission: Mission
     selectedTools: List[Tool]
+
+class RaveRequest(BaseModel):
+    question: str
+    max_iterations: Optional[int] = None
+    score_threshold: Optional[float] = None
+    use_research_memory: bool = True
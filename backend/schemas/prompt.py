@@ -39,6 +39,7 @@ class PromptTemplateTest(BaseModel):
     tokens: List[Dict[str, str]] = Field(description="List of tokens in the template")
     parameters: Dict[str, Any] = Field(description="Values for the template tokens")
     output_schema: Dict[str, Any] = Field(description="Expected output schema")
+    bypass_cache: bool = Field(False, description="Skip the LLM response cache and call the model")
 
 class LLMExecuteRequest(BaseModel):
     """Schema for executing an LLM with a prompt template"""
@@ -47,9 +48,11 @@ class LLMExecuteRequest(BaseModel):
     file_variables: Dict[str, str] = Field(description="File IDs for file variables")
     model: Optional[str] = Field(None, description="Optional model override")
     max_tokens: Optional[int] = Field(None, description="Optional max tokens override")
+    bypass_cache: bool = Field(False, description="Skip the step result cache and force a fresh execution")
 
 class LLMExecuteResponse(BaseModel):
     """Schema for LLM execution response"""
     template_id: Optional[str] = Field(None, description="ID of the template used, if any")
     messages: List[Dict[str, Any]]
-    response: Any 
\ No newline at end of file
+    response: Any
+    cached: bool = Field(False, description="Whether the response was served from the step result cache") 
\ No newline at end of file
@@ -13,20 +13,45 @@ class QuestionAnalysis(BaseModel):
 class SearchResult(BaseModel):
     """Schema for search results"""
     title: str
-    url: str
+    link: str
     snippet: str
     displayLink: Optional[str] = None
     pagemap: Optional[Dict[str, Any]] = None
+    relevance_score: float = 0.0  # 0-100, set by search_and_rank
 
 class URLContent(BaseModel):
     """Schema for URL content"""
     url: str
-    content: str
     title: Optional[str] = None
+    text: str = ""
+    content_type: str = "text"  # html, markdown, code or text
+    error: Optional[str] = None
     metadata: Optional[Dict[str, Any]] = None
 
 class FetchURLsRequest(BaseModel):
     """Schema for URL fetch requests"""
     urls: List[str]
     include_metadata: bool = True
-    max_length: Optional[int] = Field(default=1000, ge=1, le=10000) 
\ No newline at end of file
+    max_length: Optional[int] = Field(default=1000, ge=1, le=10000)
+
+class BatchSearchRequest(BaseModel):
+    """Schema for batch search requests"""
+    queries: List[str] = Field(min_length=1, max_length=20)
+    num_results: int = Field(default=10, ge=1, le=10, description="Results per query")
+    fetch_top_n: int = Field(default=0, ge=0, le=10, description="Fetch the content of this many top unique results")
+
+class QuerySearchResults(BaseModel):
+    """Results of one query of a batch search"""
+    query: str
+    results: List[SearchResult]
+    error: Optional[str] = None
+
+class BatchSearchResult(SearchResult):
+    """A unique result of a batch search and the queries that returned it"""
+    queries: List[str]
+
+class BatchSearchResponse(BaseModel):
+    """Schema for batch search responses"""
+    searches: List[QuerySearchResults]
+    unique_results: List[BatchSearchResult]  # Deduplicated by canonical URL, best ranked first
+    contents: List[URLContent] = Field(default_factory=list) 
\ No newline at end of file
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from config.settings import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a run cannot be admitted or queued"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A request's place in the admission queue, and later its run slot"""
+
+    def __init__(self, controller: "AdmissionController", user_key: str):
+        self.controller = controller
+        self.user_key = user_key
+        self.enqueued_at = time.time()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._changed = asyncio.Event()
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    @property
+    def position(self) -> int:
+        """1-based position in the wait queue, or 0 once admitted"""
+        return self.controller.position(self)
+
+    async def wait(self, timeout: Optional[float] = None) -> AsyncIterator[int]:
+        """
+        Wait for admission, yielding the queue position whenever it changes.
+
+        Leaves the queue if the wait is abandoned (e.g. the client disconnected).
+
+        Raises:
+            asyncio.TimeoutError: If not admitted within timeout seconds
+        """
+        timeout = settings.ADMISSION_QUEUE_TIMEOUT_SECONDS if timeout is None else timeout
+        deadline = self.enqueued_at + timeout
+        last_position = None
+        try:
+            while not self.admitted:
+                position = self.position
+                if position != last_position:
+                    last_position = position
+                    yield position
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), max(deadline - time.time(), 0))
+                except asyncio.TimeoutError:
+                    if not self.admitted:
+                        metrics.increment("admission_rejected", reason="queue_timeout")
+                        raise
+        finally:
+            if not self.admitted:
+                self.release()
+
+    def release(self) -> None:
+        """Give back the run slot, or leave the queue if not yet admitted (only the first call counts)"""
+        if not self.released:
+            self.controller.release(self)
+
+
+class AdmissionController:
+    """
+    Bounds the number of concurrent agent runs, globally and per user.
+
+    Requests beyond the caps wait in a bounded FIFO queue; a queued request is
+    admitted as soon as a slot frees up and its user is under the per-user cap.
+    When the queue is full the request is rejected right away with a
+    Retry-After estimate instead of piling up more work.
+    """
+
+    def __init__(self,
+                 max_active: int,
+                 max_per_user: int,
+                 max_queued: int):
+        self.max_active = max_active
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self._active: Dict[str, int] = {}
+        self._total_active = 0
+        self._queue: Deque[AdmissionTicket] = deque()
+        self._avg_run_seconds = 30.0  # Moving average of run durations, used for Retry-After
+
+    def enter(self, user_key: str) -> AdmissionTicket:
+        """
+        Admit a run or place it in the wait queue.
+
+        Returns:
+            The ticket, admitted if a slot was free
+
+        Raises:
+            AdmissionRejected: If the queue (or the user's share of it) is full
+        """
+        ticket = AdmissionTicket(self, user_key)
+        if not self._queue and self._can_admit(user_key):
+            self._admit(ticket, queued=False)
+            return ticket
+
+        user_queued = sum(1 for queued in self._queue if queued.user_key == user_key)
+        if len(self._queue) >= self.max_queued:
+            self._reject("queue_full")
+        if user_queued >= self.max_per_user:
+            self._reject("user_queue_full")
+
+        self._queue.append(ticket)
+        self._update_gauges()
+        logger.info(f"Queued run for {user_key} at position {len(self._queue)}")
+        return ticket
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted:
+            self._total_active -= 1
+            self._active[ticket.user_key] -= 1
+            if not self._active[ticket.user_key]:
+                del self._active[ticket.user_key]
+            duration = time.time() - ticket.admitted_at
+            self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * duration
+        else:
+            try:
+                self._queue.remove(ticket)
+            except ValueError:
+                pass
+        self._dispatch()
+
+    def position(self, ticket: AdmissionTicket) -> int:
+        if ticket.admitted:
+            return 0
+        try:
+            return self._queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": self._total_active,
+            "queued": len(self._queue),
+            "users_active": len(self._active)
+        }
+
+    def _can_admit(self, user_key: str) -> bool:
+        return (self._total_active < self.max_active
+                and self._active.get(user_key, 0) < self.max_per_user)
+
+    def _admit(self, ticket: AdmissionTicket, queued: bool) -> None:
+        ticket.admitted_at = time.time()
+        self._total_active += 1
+        self._active[ticket.user_key] = self._active.get(ticket.user_key, 0) + 1
+        metrics.increment("admission_admitted", queued=str(queued).lower())
+        metrics.observe("admission_queue_wait_seconds", ticket.admitted_at - ticket.enqueued_at)
+        self._update_gauges()
+
+    def _dispatch(self) -> None:
+        """Admit queued tickets in order, skipping users that are at their cap"""
+        admitted = []
+        for ticket in list(self._queue):
+            if self._total_active >= self.max_active:
+                break
+            if self._can_admit(ticket.user_key):
+                self._queue.remove(ticket)
+                self._admit(ticket, queued=True)
+                admitted.append(ticket)
+        # Wake every waiter: admitted ones proceed, the rest report their new position
+        for ticket in admitted + list(self._queue):
+            ticket._changed.set()
+        self._update_gauges()
+
+    def _reject(self, reason: str) -> None:
+        metrics.increment("admission_rejected", reason=reason)
+        raise AdmissionRejected(f"Too many concurrent runs ({reason})", self._retry_after())
+
+    def _retry_after(self) -> int:
+        """Estimate seconds until a queue slot frees up"""
+        waves = (len(self._queue) + 1) / max(self.max_active, 1)
+        return max(1, math.ceil(waves * self._avg_run_seconds))
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("admission_active_runs", self._total_active)
+        metrics.set_gauge("admission_queued_runs", len(self._queue))
+
+
+# Create a singleton instance
+admission_controller = AdmissionController(
+    max_active=settings.ADMISSION_MAX_ACTIVE_RUNS,
+    max_per_user=settings.ADMISSION_MAX_RUNS_PER_USER,
+    max_queued=settings.ADMISSION_MAX_QUEUED_RUNS
+)
+
+__all__ = ['admission_controller', 'AdmissionController', 'AdmissionTicket', 'AdmissionRejected']
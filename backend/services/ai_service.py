@@ -1,9 +1,17 @@
+import json
 import logging
-from typing import Optional, List, Dict, TypedDict, AsyncGenerator, Union, Literal
+from typing import Optional, List, Dict, Any, TypedDict, AsyncGenerator, Union, Literal
 from config.settings import settings
 from .llm.base import LLMProvider
 from .llm.anthropic_provider import AnthropicProvider
 from .llm.openai_provider import OpenAIProvider
+from .llm.response_cache import llm_response_cache
+from .llm.structured_output import StructuredOutputError, build_repair_prompt, check_attempt, REPAIR_SYSTEM_PROMPT, DEFAULT_MAX_REPAIRS
+from .llm.router import LLMRouter, RoutePolicy
+from .schema_registry import schema_registry
+from exceptions import VariableValidationError
+from utils.metrics import metrics
+from utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -23,27 +31,84 @@ class Message(TypedDict):
 
 class AIService:
     def __init__(self):
-        #self.provider: LLMProvider = AnthropicProvider()
-        self.provider: LLMProvider = OpenAIProvider()
+        providers: Dict[str, LLMProvider] = {"openai": OpenAIProvider()}
+        if settings.ANTHROPIC_API_KEY:
+            providers["anthropic"] = AnthropicProvider()
+        policies = {
+            call_site: RoutePolicy.from_dict(policy)
+            for call_site, policy in settings.LLM_ROUTE_POLICIES.items()
+        }
+        # Calls go through the router, which fails over and hedges between providers
+        self.router = LLMRouter(providers, policies, primary="openai")
+        self._inflight = SingleFlight("llm")
+
+    @property
+    def provider(self) -> LLMProvider:
+        """The primary provider"""
+        return self.router.primary_provider
 
     def set_provider(self, provider: str):
-        """Change the LLM provider"""
-        if provider == "openai":
-            self.provider = OpenAIProvider()
-        elif provider == "anthropic":
-            self.provider = AnthropicProvider()
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
+        """Change the primary LLM provider"""
+        self.router.set_primary(provider)
 
     async def close(self):
-        """Cleanup method to close the provider session"""
-        await self.provider.close()
+        """Cleanup method to close the provider sessions"""
+        for provider in self.router.providers.values():
+            await provider.close()
+
+    def _format_messages(self, messages: List[Message]) -> List[Dict[str, Any]]:
+        """Format messages with text and/or image content for the provider"""
+        formatted_messages = []
+        
+        for msg in messages:
+            if isinstance(msg["content"], str):
+                # Simple text message
+                formatted_messages.append({
+                    "role": msg["role"],
+                    "content": msg["content"]
+                })
+            else:
+                # Message with potential multiple content parts
+                content_parts = []
+                for part in msg["content"]:
+                    if "source" in part:
+                        # Already in provider format (e.g. base64 images from file templates)
+                        content_parts.append(part)
+                        continue
+                    if "text" in part:
+                        content_parts.append({
+                            "type": "text",
+                            "text": part["text"]
+                        })
+                    if "image_url" in part:
+                        content_parts.append({
+                            "type": "image",
+                            "image_url": part["image_url"]
+                        })
+                    elif "image_data" in part and "image_mime_type" in part:
+                        # Convert binary image data to base64
+                        import base64
+                        image_base64 = base64.b64encode(part["image_data"]).decode('utf-8')
+                        content_parts.append({
+                            "type": "image",
+                            "image_url": f"data:{part['image_mime_type']};base64,{image_base64}"
+                        })
+                
+                formatted_messages.append({
+                    "role": msg["role"],
+                    "content": content_parts
+                })
+
+        return formatted_messages
 
     async def send_messages(self, 
                           messages: List[Message],
                           model: Optional[str] = None,
                           max_tokens: Optional[int] = None,
-                          system: Optional[str] = None
+                          system: Optional[str] = None,
+                          temperature: Optional[float] = None,
+                          use_cache: bool = False,
+                          call_site: str = "default"
                           ) -> str:
         """
         Send a collection of messages that can contain text and/or images to the AI provider.
@@ -53,63 +118,174 @@ class AIService:
             model: Optional model to use (defaults to provider's default)
             max_tokens: Optional maximum tokens for response
             system: Optional system message to include in the prompt
+            temperature: Optional sampling temperature (defaults to provider's default)
+            use_cache: Whether an identical earlier request may be answered from the response
+                cache. Only opt in for deterministic calls (e.g. temperature 0), since a cached
+                response is returned unchanged for the whole TTL.
+            call_site: Name of the caller, used to pick its routing policy
 
         Returns:
             The AI provider's response text
         """
         try:
-            # Format messages for the provider
-            formatted_messages = []
-            
-            for msg in messages:
-                if isinstance(msg["content"], str):
-                    # Simple text message
-                    formatted_messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-                else:
-                    # Message with potential multiple content parts
-                    content_parts = []
-                    for part in msg["content"]:
-                        if "text" in part:
-                            content_parts.append({
-                                "type": "text",
-                                "text": part["text"]
-                            })
-                        if "image_url" in part:
-                            content_parts.append({
-                                "type": "image",
-                                "image_url": part["image_url"]
-                            })
-                        elif "image_data" in part and "image_mime_type" in part:
-                            # Convert binary image data to base64
-                            import base64
-                            image_base64 = base64.b64encode(part["image_data"]).decode('utf-8')
-                            content_parts.append({
-                                "type": "image",
-                                "image_url": f"data:{part['image_mime_type']};base64,{image_base64}"
-                            })
-                    
-                    formatted_messages.append({
-                        "role": msg["role"],
-                        "content": content_parts
-                    })
-
-            # Send to provider
-            response = await self.provider.create_chat_completion(
+            formatted_messages = self._format_messages(messages)
+
+            # Responses are keyed by the provider and model the call is routed to
+            target = self.router.first_target(call_site, model)
+            target_provider, target_model = target or (self.provider.name, model or self.provider.get_default_model())
+            request_key = llm_response_cache.make_key(
+                provider=target_provider,
+                model=target_model,
                 messages=formatted_messages,
-                model=model,
+                system=system,
                 max_tokens=max_tokens,
-                system=system
+                temperature=temperature
+            )
+
+            # Check the response cache for an identical request
+            use_cache = use_cache and settings.LLM_CACHE_ENABLED
+            if use_cache:
+                cached_response = await llm_response_cache.aget(request_key, provider=target_provider)
+                if cached_response is not None:
+                    return cached_response
+
+            async def create(provider: LLMProvider, routed_model: Optional[str]):
+                response = await provider.create_chat_completion(
+                    messages=formatted_messages,
+                    model=routed_model,
+                    max_tokens=max_tokens,
+                    system=system,
+                    temperature=temperature
+                )
+                return response, (provider.name, routed_model or provider.get_default_model())
+
+            # Send to provider, sharing the call with identical concurrent requests
+            response, answered_by = await self._inflight.do(
+                request_key,
+                lambda: self.router.call(call_site, create, model=model)
             )
 
+            # Failover answers come from another provider or model than the key says
+            if use_cache and answered_by == (target_provider, target_model):
+                await llm_response_cache.aset(request_key, response)
+
             return response
 
         except Exception as e:
             logger.error(f"Error in send_messages: {str(e)}")
             raise
 
+    async def send_structured(self,
+                              messages: List[Message],
+                              schema: Dict[str, Any],
+                              name: str,
+                              description: Optional[str] = None,
+                              model: Optional[str] = None,
+                              max_tokens: Optional[int] = None,
+                              system: Optional[str] = None,
+                              max_repairs: int = DEFAULT_MAX_REPAIRS,
+                              call_site: str = "default"
+                              ) -> Dict[str, Any]:
+        """
+        Send messages and get output matching a JSON schema through native tool calling.
+
+        Invalid output is repaired by sending only the faulty output and the
+        validation error, not the original prompt.
+
+        Args:
+            messages: List of messages with role and content
+            schema: JSON schema of the expected output (must be an object schema)
+            name: Name of the output tool, also used as the call site in metrics
+            description: Optional description of the output tool
+            model: Optional model to use (defaults to provider's default)
+            max_tokens: Optional maximum tokens for response
+            system: Optional system message to include in the prompt
+            max_repairs: Number of repair attempts after an invalid output
+            call_site: Name of the caller, used to pick its routing policy
+
+        Returns:
+            The validated output
+
+        Raises:
+            StructuredOutputError: If no valid output was produced
+        """
+        metrics.increment("structured_output_calls", call_site=name)
+        formatted_messages = self._format_messages(messages)
+        current_system = system
+        error = None
+        raw_output = None
+
+        for attempt in range(max_repairs + 1):
+            try:
+                result = await self.router.call(
+                    call_site,
+                    lambda provider, target_model: provider.create_structured_completion(
+                        messages=formatted_messages,
+                        schema=schema,
+                        name=name,
+                        description=description,
+                        model=target_model,
+                        max_tokens=max_tokens,
+                        system=current_system
+                    ),
+                    model=model
+                )
+                raw_output = json.dumps(result)
+                schema_registry.validate(name, schema, result)
+                error = None
+            except (StructuredOutputError, VariableValidationError) as e:
+                error = getattr(e, "message", None) or str(e)
+                raw_output = getattr(e, "raw_output", None) or raw_output
+
+            if check_attempt(name, attempt, error):
+                return result
+
+            # Repair with only the faulty output and the error
+            formatted_messages = [{"role": "user", "content": build_repair_prompt(raw_output, error)}]
+            current_system = REPAIR_SYSTEM_PROMPT
+
+        raise StructuredOutputError(f"Invalid {name} output: {error}", raw_output)
+
+    async def stream_messages(self,
+                              messages: List[Message],
+                              model: Optional[str] = None,
+                              max_tokens: Optional[int] = None,
+                              system: Optional[str] = None,
+                              call_site: str = "default"
+                              ) -> AsyncGenerator[str, None]:
+        """
+        Send a collection of messages to the AI provider and stream the response text.
+
+        Streamed responses bypass the response cache. Use StreamingJSONParser to act
+        on structured output before the response is complete.
+
+        Args:
+            messages: List of messages with role and content. Content can be text or image data.
+            model: Optional model to use (defaults to provider's default)
+            max_tokens: Optional maximum tokens for response
+            system: Optional system message to include in the prompt
+            call_site: Name of the caller, used to pick its routing policy
+
+        Yields:
+            Chunks of the AI provider's response text
+        """
+        try:
+            formatted_messages = self._format_messages(messages)
+            async for chunk in self.router.stream(
+                call_site,
+                lambda provider, target_model: provider.create_chat_completion_stream(
+                    messages=formatted_messages,
+                    model=target_model,
+                    max_tokens=max_tokens,
+                    system=system
+                ),
+                model=model
+            ):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error in stream_messages: {str(e)}")
+            raise
+
 
 # Create a singleton instance
 ai_service = AIService()
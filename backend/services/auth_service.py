@@ -142,6 +142,22 @@ async def login_user(db: Session, email: str, password: str) -> Token:
 # returns user object
 
 
+def get_token_subject(authorization: Optional[str]) -> Optional[str]:
+    """
+    Return the subject (email) of a bearer token without a database lookup.
+
+    Used where a request only needs to be attributed to a user (e.g. for
+    per-user limits); returns None for missing or invalid tokens.
+    """
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        payload = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
 async def validate_token(
     credentials: HTTPAuthorizationCredentials = Security(security),
     db: Session = Depends(get_db)
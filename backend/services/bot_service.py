@@ -1,11 +1,15 @@
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
+import asyncio
 import uuid
 import logging
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from services.ai_service import AIService
 from services.search_service import google_search
+from services.llm.streaming_json import StreamingJSONParser, parse_json_response
+from services.llm.structured_output import build_repair_prompt, REPAIR_SYSTEM_PROMPT
+from services.llm.prompt_budget import PromptBudget, PromptSection, KEEP_WHOLE
 from schemas import (
     Message, 
     ChatResponse, 
@@ -15,7 +19,6 @@ from schemas import (
     AgentStatus
 )
 import json
-import re
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -67,6 +70,26 @@ TOOLS = [
     }
 ]
 
+# JSON schema of the bot's response, used to repair responses that fail to parse
+BOT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": ["tool", "final_response"]},
+        "tool": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "parameters": {"type": "object"}
+            },
+            "required": ["name"]
+        },
+        "response": {"type": "string"},
+        "agent_jobs": {"type": "array", "items": {"type": "object"}},
+        "assets": {"type": "array", "items": {"type": "object"}}
+    },
+    "required": ["type"]
+}
+
 class BotService:
     def __init__(self, db: Session):
         self.db = db
@@ -79,40 +102,14 @@ class BotService:
             "pending_approvals": []
         }
 
-    def get_clean_response_json(self, response: str) -> str:
-        """Clean the response to ensure it's valid JSON"""
-        
-        response = response.strip()
-        
-        # Remove markdown code blocks if present
-        if response.startswith('```json'):
-            response = response[7:]
-        if response.endswith('```'):    
-            response = response[:-3]
-            
-        # Try to parse the complete response as JSON
+    def get_clean_response_json(self, response: str) -> Dict[str, Any]:
+        """Parse the response as JSON, tolerating code fences and raw newlines in strings"""
         try:
-            return json.loads(response)
-        except json.JSONDecodeError as e:
-            # If parsing fails, try to fix newlines in string values
-            try:
-                # Find all string values in the JSON and escape newlines
-                def escape_newlines(match):
-                    # Get the string content (without quotes)
-                    content = match.group(1)
-                    # Escape newlines and other control characters
-                    content = content.replace('\n', '\\n')
-                    content = content.replace('\r', '\\r')
-                    content = content.replace('\t', '\\t')
-                    return f'"{content}"'
-                
-                # This regex matches string values in JSON, including the quotes
-                fixed_response = re.sub(r'"([^"]*?)"', escape_newlines, response)
-                return json.loads(fixed_response)
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON: {str(e)}")
-                logger.error(f"Response after cleaning: {fixed_response}")
-                raise ValueError(f"AI response must be valid JSON: {str(e)}")
+            return parse_json_response(response)
+        except ValueError as e:
+            logger.error(f"Failed to parse JSON: {str(e)}")
+            logger.error(f"Response: {response}")
+            raise ValueError(f"AI response must be valid JSON: {str(e)}")
 
     async def process_message(self, message: str, history: List[Dict[str, Any]], assets: List[Asset] = None) -> ChatResponse:
         """Process a user message and return a response with appropriate side effects"""
@@ -128,37 +125,44 @@ class BotService:
                 logger.info(f"Processing message: {message}")
                 logger.info(f"Messages: {messages}")
                 
-                # Get AI response
-                response = await self._get_ai_response(messages, assets)
-                logger.info(f"AI response: {response}")
-
-                # Process response
-                response_data = self.get_clean_response_json(response)
-                self._validate_response_data(response_data)
-                
-                # Handle based on response type
-                if response_data["type"] == "tool":
-                    logger.info(f"Processing Tool use response")
-                    # Execute tool and update conversation
-                    tool_results = await self._execute_tool(response_data["tool"])
-                    logger.info(f"Tool results: {tool_results}")
-                    self._update_tool_history(tool_use_history, iteration, response_data["tool"], tool_results)
-                    self._update_conversation_history(messages, response_data["tool"], tool_results)
-                    iteration += 1
-                    continue
-                    
-                elif response_data["type"] == "final_response":
-                    logger.info(f"Processing Final response")
-                    # Process final response and return
-                    processed_response = await self._process_final_response(response_data)
-                    return self._create_chat_response(
-                        response_data["response"],
-                        processed_response,
-                        tool_use_history
-                    )
-                
-                else:
-                    raise ValueError(f"Invalid response type: {response_data['type']}")
+                # Get AI response; a requested tool may already be running
+                response_data, tool_task = await self._get_ai_response(messages, assets)
+                logger.info(f"AI response: {response_data}")
+
+                try:
+                    # Process response
+                    self._validate_response_data(response_data)
+
+                    # Handle based on response type
+                    if response_data["type"] == "tool":
+                        logger.info(f"Processing Tool use response")
+                        # Execute tool and update conversation
+                        if tool_task is not None:
+                            tool_results = await tool_task
+                        else:
+                            tool_results = await self._execute_tool(response_data["tool"])
+                        logger.info(f"Tool results: {tool_results}")
+                        self._update_tool_history(tool_use_history, iteration, response_data["tool"], tool_results)
+                        self._update_conversation_history(messages, response_data["tool"], tool_results)
+                        iteration += 1
+                        continue
+
+                    elif response_data["type"] == "final_response":
+                        logger.info(f"Processing Final response")
+                        # Process final response and return
+                        processed_response = await self._process_final_response(response_data)
+                        return self._create_chat_response(
+                            response_data["response"],
+                            processed_response,
+                            tool_use_history
+                        )
+
+                    else:
+                        raise ValueError(f"Invalid response type: {response_data['type']}")
+                finally:
+                    # A tool started early whose result is not used must not keep running
+                    if tool_task is not None and not tool_task.done():
+                        tool_task.cancel()
 
             # 3. Handle max iterations reached
             return self._create_max_iterations_response(tool_use_history)
@@ -176,12 +180,85 @@ class BotService:
         messages.append({"role": "user", "content": message})
         return messages
 
-    async def _get_ai_response(self, messages: List[Dict[str, Any]], assets: List[Asset]) -> str:
-        """Get response from AI service"""
-        return await self.ai_service.send_messages(
-            messages=messages,
-            system=self._get_system_prompt(assets)
-        )
+    async def _get_ai_response(self, messages: List[Dict[str, Any]], assets: List[Asset]) -> Tuple[Dict[str, Any], Optional[asyncio.Task]]:
+        """
+        Stream the response from the AI service and parse it as it arrives.
+
+        A tool call is started as soon as its "tool" object is complete, while the
+        model is still finishing the response. Malformed output stops the
+        incremental parse; the whole response is then repaired once it has
+        arrived, and an early tool call the repair does not ask for is cancelled.
+
+        Returns:
+            Tuple of (parsed response, task running the requested tool or None)
+        """
+        parser = StreamingJSONParser()
+        tool_task = None
+        started_tool = None
+        response_text = ""
+        prompt_messages, system = self._fit_prompt(messages, assets)
+        try:
+            async for chunk in self.ai_service.stream_messages(
+                messages=prompt_messages,
+                system=system,
+                call_site="bot_service"
+            ):
+                response_text += chunk
+                for event in parser.try_feed(chunk):
+                    if (event.type == "field" and event.path == ("tool",) and tool_task is None
+                            and isinstance(parser.value, dict) and parser.value.get("type") == "tool"):
+                        logger.info(f"Starting tool {event.value.get('name')} before response completed")
+                        started_tool = event.value
+                        tool_task = asyncio.create_task(self._execute_tool(started_tool))
+            try:
+                return parser.close(), tool_task
+            except ValueError as e:
+                # Repair with a structured call that carries only the broken output and the error
+                logger.warning(f"AI response was not valid JSON, repairing: {str(e)}")
+                repaired = await self.ai_service.send_structured(
+                    messages=[{"role": "user", "content": build_repair_prompt(response_text, str(e))}],
+                    schema=BOT_RESPONSE_SCHEMA,
+                    name="bot_response",
+                    system=REPAIR_SYSTEM_PROMPT,
+                    call_site="bot_service"
+                )
+                # The early result only belongs to the repaired response if it asks for the same call
+                if tool_task is not None and not (repaired.get("type") == "tool" and repaired.get("tool") == started_tool):
+                    tool_task.cancel()
+                    tool_task = None
+                return repaired, tool_task
+        except BaseException:
+            if tool_task is not None:
+                tool_task.cancel()
+            raise
+
+    def _fit_prompt(self, messages: List[Dict[str, Any]], assets: List[Asset]) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Fit the system prompt, assets and conversation into the model's context window.
+
+        The system prompt and the current turn (the user's message and any tool
+        calls made for it) are always sent whole; assets are truncated and the
+        oldest history is dropped when they do not fit.
+
+        Returns:
+            Tuple of (messages, system prompt) to send
+        """
+        current_turn = max((index for index, message in enumerate(messages) if message["role"] == "user"), default=0)
+        # Budget for the model the call is routed to first
+        target = self.ai_service.router.first_target("bot_service")
+        budget = PromptBudget(target[1] if target else self.ai_service.provider.get_default_model())
+        prompt = budget.fit([
+            PromptSection("system", self._get_system_prompt(), priority=3, min_tokens=KEEP_WHOLE),
+            PromptSection("current_turn", messages[current_turn:], priority=2, min_tokens=KEEP_WHOLE),
+            PromptSection("assets", self._get_assets_section(assets), priority=1),
+            PromptSection("history", messages[:current_turn], priority=0)
+        ], call_site="bot_service")
+
+        # The conversation sent must still start with a user message
+        history = prompt["history"]
+        while history and history[0]["role"] != "user":
+            history = history[1:]
+        return history + prompt["current_turn"], prompt["system"] + prompt["assets"]
 
     def _validate_response_data(self, response_data: Dict[str, Any]) -> None:
         """Validate response data structure"""
@@ -657,11 +734,16 @@ Asset Types:
 - fileType: The format of the file (txt, pdf, csv, json, png, jpg, jpeg, gif, mp3, mp4, wav, unknown)
 - dataType: The type of structured data (unstructured, email_list, generic_list, generic_table)"""
 
-        if assets:
-            # Add current assets to the system prompt
-            assets_section = "\n\nCurrent Assets Available:\n"
-            for asset in assets:
-                assets_section += f"""
+        return base_prompt + self._get_assets_section(assets)
+
+    def _get_assets_section(self, assets: List[Asset] = None) -> str:
+        """Get the system prompt section describing the current assets"""
+        if not assets:
+            return ""
+
+        assets_section = "\n\nCurrent Assets Available:\n"
+        for asset in assets:
+            assets_section += f"""
 Asset ID: {asset.asset_id}
 Name: {asset.name}
 Description: {asset.description or 'No description provided'}
@@ -670,7 +752,6 @@ Data Type: {asset.dataType}
 Content: {asset.content}
 Metadata: {json.dumps(asset.metadata, indent=2)}
 """
-            base_prompt += assets_section
             print("type of asset.content: ", type(asset.content))
 
-        return base_prompt 
\ No newline at end of file
+        return assets_section 
\ No newline at end of file
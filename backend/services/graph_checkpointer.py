@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config.settings import settings
+from database import SessionLocal
+from models import GraphCheckpoint, GraphCheckpointWrite
+
+logger = logging.getLogger(__name__)
+
+
+class SQLAlchemyCheckpointSaver(BaseCheckpointSaver):
+    """
+    LangGraph checkpoint saver backed by the application database.
+
+    A checkpoint is saved after every completed step of a graph run, keyed by
+    the run's thread ID, so an interrupted run can be resumed from its last
+    completed node by any worker. Checkpoints are stored whole (including
+    channel values) with the graph's serializer.
+
+    The checkpoints of a run are deleted when it completes; those of runs that
+    were never finished are kept for resumes until they are older than the TTL,
+    and are swept periodically as new checkpoints are saved.
+    """
+
+    def __init__(self,
+                 session_factory: Callable[[], Session] = SessionLocal,
+                 ttl_seconds: Optional[int] = None,
+                 sweep_seconds: Optional[int] = None,
+                 **kwargs: Any):
+        super().__init__(**kwargs)
+        self.session_factory = session_factory
+        self.ttl_seconds = settings.GRAPH_CHECKPOINT_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.sweep_seconds = settings.GRAPH_CHECKPOINT_SWEEP_SECONDS if sweep_seconds is None else sweep_seconds
+        self._last_sweep = time.monotonic()
+        self._sweep_lock = threading.Lock()
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        with self.session_factory() as db:
+            query = db.query(GraphCheckpoint).filter(
+                GraphCheckpoint.thread_id == thread_id,
+                GraphCheckpoint.checkpoint_ns == checkpoint_ns
+            )
+            if checkpoint_id:
+                query = query.filter(GraphCheckpoint.checkpoint_id == checkpoint_id)
+            else:
+                # Checkpoint IDs are time-ordered, so the largest is the latest
+                query = query.order_by(GraphCheckpoint.checkpoint_id.desc())
+            row = query.first()
+            if row is None:
+                return None
+            return self._to_tuple(db, row)
+
+    def list(self,
+             config: Optional[RunnableConfig],
+             *,
+             filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None,
+             limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        with self.session_factory() as db:
+            query = db.query(GraphCheckpoint)
+            if config:
+                query = query.filter(GraphCheckpoint.thread_id == config["configurable"]["thread_id"])
+                checkpoint_ns = config["configurable"].get("checkpoint_ns")
+                if checkpoint_ns is not None:
+                    query = query.filter(GraphCheckpoint.checkpoint_ns == checkpoint_ns)
+                checkpoint_id = get_checkpoint_id(config)
+                if checkpoint_id:
+                    query = query.filter(GraphCheckpoint.checkpoint_id == checkpoint_id)
+            if before and (before_id := get_checkpoint_id(before)):
+                query = query.filter(GraphCheckpoint.checkpoint_id < before_id)
+            query = query.order_by(GraphCheckpoint.checkpoint_id.desc())
+            if limit is not None and not filter:
+                query = query.limit(limit)
+
+            results: List[CheckpointTuple] = []
+            for row in query.all():
+                checkpoint_tuple = self._to_tuple(db, row)
+                # Metadata is serialized, so filters are applied after loading
+                if filter and not all(checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    def put(self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_type, checkpoint_data = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_data = self.serde.dumps_typed(metadata)
+
+        with self.session_factory() as db:
+            db.merge(GraphCheckpoint(
+                thread_id=thread_id,
+                checkpoint_ns=checkpoint_ns,
+                checkpoint_id=checkpoint["id"],
+                parent_checkpoint_id=config["configurable"].get("checkpoint_id"),
+                type=checkpoint_type,
+                checkpoint=checkpoint_data,
+                metadata_type=metadata_type,
+                checkpoint_metadata=metadata_data
+            ))
+            db.commit()
+        self._sweep_if_due()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"]
+            }
+        }
+
+    def put_writes(self,
+                   config: RunnableConfig,
+                   writes: Sequence[Tuple[str, Any]],
+                   task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # Special writes (errors, interrupts) replace earlier ones; regular writes are recorded once per task
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        with self.session_factory() as db:
+            existing = set()
+            if not replace:
+                existing = {
+                    idx for (idx,) in db.query(GraphCheckpointWrite.idx).filter(
+                        GraphCheckpointWrite.thread_id == thread_id,
+                        GraphCheckpointWrite.checkpoint_ns == checkpoint_ns,
+                        GraphCheckpointWrite.checkpoint_id == checkpoint_id,
+                        GraphCheckpointWrite.task_id == task_id
+                    )
+                }
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                if idx in existing:
+                    continue
+                value_type, value_data = self.serde.dumps_typed(value)
+                db.merge(GraphCheckpointWrite(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint_id,
+                    task_id=task_id,
+                    idx=idx,
+                    channel=channel,
+                    type=value_type,
+                    value=value_data,
+                    task_path=task_path
+                ))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker recorded the same task writes first
+                db.rollback()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.session_factory() as db:
+            db.query(GraphCheckpointWrite).filter(GraphCheckpointWrite.thread_id == thread_id).delete()
+            db.query(GraphCheckpoint).filter(GraphCheckpoint.thread_id == thread_id).delete()
+            db.commit()
+
+    def delete_expired(self, max_age_seconds: Optional[int] = None) -> int:
+        """
+        Delete the threads whose latest checkpoint is older than the given age.
+
+        Args:
+            max_age_seconds: Age above which a thread is deleted (defaults to the TTL)
+
+        Returns:
+            Number of threads deleted
+        """
+        max_age_seconds = self.ttl_seconds if max_age_seconds is None else max_age_seconds
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+        with self.session_factory() as db:
+            expired = [
+                thread_id for (thread_id,) in db.query(GraphCheckpoint.thread_id)
+                .group_by(GraphCheckpoint.thread_id)
+                .having(func.max(GraphCheckpoint.created_at) < cutoff)
+            ]
+            if expired:
+                db.query(GraphCheckpointWrite).filter(
+                    GraphCheckpointWrite.thread_id.in_(expired)
+                ).delete(synchronize_session=False)
+                db.query(GraphCheckpoint).filter(
+                    GraphCheckpoint.thread_id.in_(expired)
+                ).delete(synchronize_session=False)
+                db.commit()
+        if expired:
+            logger.info(f"Deleted checkpoints of {len(expired)} expired graph threads")
+        return len(expired)
+
+    def _sweep_if_due(self) -> None:
+        # One writer sweeps at a time; the others carry on saving
+        if time.monotonic() - self._last_sweep < self.sweep_seconds or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = time.monotonic()
+            self.delete_expired()
+        except Exception as e:
+            logger.error(f"Error deleting expired checkpoints: {str(e)}")
+        finally:
+            self._sweep_lock.release()
+
+    # Database access is synchronous, so the async API runs it in worker threads
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self,
+                    config: Optional[RunnableConfig],
+                    *,
+                    filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint_tuple in results:
+            yield checkpoint_tuple
+
+    async def aput(self,
+                   config: RunnableConfig,
+                   checkpoint: Checkpoint,
+                   metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self,
+                          config: RunnableConfig,
+                          writes: Sequence[Tuple[str, Any]],
+                          task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def _to_tuple(self, db: Session, row: GraphCheckpoint) -> CheckpointTuple:
+        writes = db.query(GraphCheckpointWrite).filter(
+            GraphCheckpointWrite.thread_id == row.thread_id,
+            GraphCheckpointWrite.checkpoint_ns == row.checkpoint_ns,
+            GraphCheckpointWrite.checkpoint_id == row.checkpoint_id
+        ).order_by(GraphCheckpointWrite.task_id, GraphCheckpointWrite.idx).all()
+
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": row.checkpoint_id
+                }
+            },
+            checkpoint=self.serde.loads_typed((row.type, row.checkpoint)),
+            metadata=self.serde.loads_typed((row.metadata_type, row.checkpoint_metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": row.thread_id,
+                        "checkpoint_ns": row.checkpoint_ns,
+                        "checkpoint_id": row.parent_checkpoint_id
+                    }
+                }
+                if row.parent_checkpoint_id else None
+            ),
+            pending_writes=[
+                (write.task_id, write.channel, self.serde.loads_typed((write.type, write.value)))
+                for write in writes
+            ]
+        )
+
+
+# Create a singleton instance
+checkpointer = SQLAlchemyCheckpointSaver()
+
+__all__ = ['checkpointer', 'SQLAlchemyCheckpointSaver']
@@ -1,18 +1,23 @@
 import anthropic
+import copy
 import logging
 from typing import List, Dict, Optional, Any, AsyncGenerator
 from config.settings import settings
 from .base import LLMProvider
+from .structured_output import StructuredOutputError
 import aiohttp
 import ssl
 import certifi
 import time
 
 DEFAULT_MAX_TOKENS = 4096  # Default max tokens for Claude-3
+MAX_CACHE_BREAKPOINTS = 4  # Anthropic allows at most four cache_control blocks per request
 logger = logging.getLogger(__name__)
 
 
 class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+
     def __init__(self):
         self.client = anthropic.AsyncAnthropic(
             api_key=settings.ANTHROPIC_API_KEY)
@@ -20,6 +25,55 @@ class AnthropicProvider(LLMProvider):
     def get_default_model(self) -> str:
         return "claude-3-5-sonnet-20241022"
 
+    def _apply_cache_breakpoints(self,
+                                 messages: List[Dict[str, Any]],
+                                 system: Optional[str]
+                                 ) -> tuple[List[Dict[str, Any]], Any, bool]:
+        """
+        Mark stable prompt prefixes with cache_control so repeated requests over the
+        same system prompt or file content are served from Anthropic's prompt cache.
+
+        Breakpoints go on a large system prompt and on the last block of each run of
+        file-derived content (large text parts and images), earliest runs first.
+
+        Returns:
+            Tuple of (messages, system, whether any breakpoint was added). The input
+            messages are not modified.
+        """
+        if not settings.ANTHROPIC_PROMPT_CACHE_ENABLED:
+            return messages, system, False
+
+        min_chars = settings.ANTHROPIC_PROMPT_CACHE_MIN_CHARS
+        breakpoints = 0
+
+        if system and len(system) >= min_chars:
+            system = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+            breakpoints += 1
+
+        def is_stable(part: Dict[str, Any]) -> bool:
+            if part.get("type") == "image":
+                return True
+            return part.get("type") == "text" and len(part.get("text", "")) >= min_chars
+
+        marked_messages = []
+        for message in messages:
+            content = message.get("content")
+            if not isinstance(content, list) or breakpoints >= MAX_CACHE_BREAKPOINTS:
+                marked_messages.append(message)
+                continue
+
+            content = copy.copy(content)
+            for i, part in enumerate(content):
+                if breakpoints >= MAX_CACHE_BREAKPOINTS:
+                    break
+                run_ends_here = i + 1 == len(content) or not is_stable(content[i + 1])
+                if is_stable(part) and run_ends_here:
+                    content[i] = {**part, "cache_control": {"type": "ephemeral"}}
+                    breakpoints += 1
+            marked_messages.append({**message, "content": content})
+
+        return marked_messages, system, breakpoints > 0
+
     async def generate(self,
                        prompt: str,
                        model: Optional[str] = None,
@@ -30,6 +84,7 @@ class AnthropicProvider(LLMProvider):
             model = model or self.get_default_model()
             max_tokens = max_tokens or DEFAULT_MAX_TOKENS
 
+            await self._wait_for_capacity(model, prompt, max_tokens=max_tokens)
             message = await self.client.messages.create(
                 model=model,
                 max_tokens=max_tokens,
@@ -61,6 +116,7 @@ class AnthropicProvider(LLMProvider):
             model = model or self.get_default_model()
             max_tokens = max_tokens or DEFAULT_MAX_TOKENS
 
+            await self._wait_for_capacity(model, prompt, max_tokens=max_tokens)
             stream = await self.client.messages.create(
                 model=model,
                 max_tokens=max_tokens,
@@ -93,7 +149,8 @@ class AnthropicProvider(LLMProvider):
         messages: List[Dict[str, str]],
         model: Optional[str] = None,
         max_tokens: Optional[int] = None,
-        system: Optional[str] = None
+        system: Optional[str] = None,
+        temperature: Optional[float] = None
     ) -> str:
         try:
             start_time = time.time()
@@ -107,11 +164,21 @@ class AnthropicProvider(LLMProvider):
                 "max_tokens": max_tokens
             }
 
+            # Mark stable prefixes for prompt caching
+            messages, system, use_prompt_cache = self._apply_cache_breakpoints(messages, system)
+            params["messages"] = messages
+
             # Add optional system parameter if provided
             if system is not None:
                 params["system"] = system
+            if temperature is not None:
+                params["temperature"] = temperature
 
-            message = await self.client.messages.create(**params)
+            await self._wait_for_capacity(model, messages, system, max_tokens)
+            if use_prompt_cache:
+                message = await self.client.beta.prompt_caching.messages.create(**params)
+            else:
+                message = await self.client.messages.create(**params)
 
             # Log request statistics
             self._log_request_stats(
@@ -119,7 +186,9 @@ class AnthropicProvider(LLMProvider):
                 model=model,
                 start_time=start_time,
                 input_tokens=message.usage.input_tokens,
-                output_tokens=message.usage.output_tokens
+                output_tokens=message.usage.output_tokens,
+                cache_read_tokens=getattr(message.usage, "cache_read_input_tokens", None) or 0,
+                cache_creation_tokens=getattr(message.usage, "cache_creation_input_tokens", None) or 0
             )
 
             return message.content[0].text
@@ -128,6 +197,59 @@ class AnthropicProvider(LLMProvider):
                 f"Error creating Anthropic chat completion with model {model}: {str(e)}")
             raise
 
+    async def create_structured_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        schema: Dict[str, Any],
+        name: str,
+        description: Optional[str] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        try:
+            start_time = time.time()
+            model = model or self.get_default_model()
+            max_tokens = max_tokens or DEFAULT_MAX_TOKENS
+
+            # Force the tool so the schema is enforced by the API rather than the prompt
+            params = {
+                "model": model,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "tools": [{
+                    "name": name,
+                    "description": description or f"Record the {name}",
+                    "input_schema": schema
+                }],
+                "tool_choice": {"type": "tool", "name": name}
+            }
+            if system is not None:
+                params["system"] = system
+
+            await self._wait_for_capacity(model, messages, system, max_tokens)
+            message = await self.client.messages.create(**params)
+
+            self._log_request_stats(
+                method=f"structured_completion:{name}",
+                model=model,
+                start_time=start_time,
+                input_tokens=message.usage.input_tokens,
+                output_tokens=message.usage.output_tokens
+            )
+
+            for block in message.content:
+                if block.type == "tool_use":
+                    return block.input
+            text = "".join(getattr(block, "text", "") for block in message.content)
+            raise StructuredOutputError("Model did not call the output tool", text)
+        except StructuredOutputError:
+            raise
+        except Exception as e:
+            logger.error(
+                f"Error creating Anthropic structured completion with model {model}: {str(e)}")
+            raise
+
     async def create_chat_completion_stream(
         self,
         messages: List[Dict[str, str]],
@@ -149,25 +271,37 @@ class AnthropicProvider(LLMProvider):
                 "stream": True
             }
 
+            # Mark stable prefixes for prompt caching
+            messages, system, use_prompt_cache = self._apply_cache_breakpoints(messages, system)
+            params["messages"] = messages
+
             # Add optional system parameter if provided
             if system is not None:
                 params["system"] = system
 
-            stream = await self.client.messages.create(**params)
+            await self._wait_for_capacity(model, messages, system, max_tokens)
+            if use_prompt_cache:
+                stream = await self.client.beta.prompt_caching.messages.create(**params)
+            else:
+                stream = await self.client.messages.create(**params)
 
-            # For streaming, we can't get exact token counts during the stream
-            # We'll log a simplified version at the end
+            # Input and cache token counts arrive with message_start; output tokens are not tracked
+            usage = None
             async for message in stream:
-                if message.type == "content_block_delta":
+                if message.type == "message_start":
+                    usage = message.message.usage
+                elif message.type == "content_block_delta":
                     yield message.delta.text
 
-            # Log request statistics with estimated tokens
+            # Log request statistics
             self._log_request_stats(
                 method="chat_completion_stream",
                 model=model,
                 start_time=start_time,
-                input_tokens=0,  # Token counts not available in stream
-                output_tokens=0
+                input_tokens=getattr(usage, "input_tokens", 0) or 0,
+                output_tokens=0,
+                cache_read_tokens=getattr(usage, "cache_read_input_tokens", None) or 0,
+                cache_creation_tokens=getattr(usage, "cache_creation_input_tokens", None) or 0
             )
 
         except Exception as e:
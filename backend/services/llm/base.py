@@ -2,6 +2,9 @@ from abc import ABC, abstractmethod
 from typing import List, Dict, Optional, Any, AsyncGenerator
 import time
 import logging
+from utils.metrics import metrics
+from services.llm.scheduler import llm_scheduler, DEFAULT_OUTPUT_TOKENS
+from services.llm.prompt_budget import count_message_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +12,8 @@ logger = logging.getLogger(__name__)
 class LLMProvider(ABC):
     """Base class for LLM providers"""
 
+    name: str = "base"  # Provider identifier used in cache keys and metrics
+
     @abstractmethod
     def get_default_model(self) -> str:
         """Get the default model for this provider"""
@@ -39,6 +44,7 @@ class LLMProvider(ABC):
         model: Optional[str] = None,
         max_tokens: Optional[int] = None,
         system: Optional[str] = None,
+        temperature: Optional[float] = None,
         **kwargs: Any
     ) -> str:
         """Create a chat completion with the given messages"""
@@ -56,20 +62,64 @@ class LLMProvider(ABC):
         """Create a streaming chat completion with the given messages"""
         raise NotImplementedError
 
+    async def create_structured_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        schema: Dict[str, Any],
+        name: str,
+        description: Optional[str] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Create a chat completion whose output is forced through a native tool call
+        with the given JSON schema as its input schema.
+
+        Raises:
+            StructuredOutputError: If the model does not return parseable tool arguments
+        """
+        raise NotImplementedError(f"{self.name} does not support structured completions")
+
     @abstractmethod
     async def close(self):
         """Cleanup resources"""
         pass
 
+    async def _wait_for_capacity(self,
+                                 model: str,
+                                 messages: Any,
+                                 system: Optional[str] = None,
+                                 max_tokens: Optional[int] = None) -> None:
+        """
+        Wait for the scheduler to release this call under the model's rate limits.
+
+        The call is charged its exact prompt size plus max_tokens, which is also
+        recorded as the call's prompt token count.
+        """
+        prompt_tokens = count_message_tokens(messages, model, system)
+        metrics.observe("llm_prompt_tokens", prompt_tokens, provider=self.name, model=model)
+        await llm_scheduler.acquire(model, prompt_tokens + (max_tokens or DEFAULT_OUTPUT_TOKENS))
+
     def _log_request_stats(self,
                            method: str,
                            model: str,
                            start_time: float,
                            input_tokens: int,
-                           output_tokens: int):
+                           output_tokens: int,
+                           cache_read_tokens: int = 0,
+                           cache_creation_tokens: int = 0):
         duration = time.time() - start_time
         logger.info(
             f"LLM Request Stats - Method: {method}, Model: {model}, "
             f"Duration: {duration:.2f}s, Input Tokens: {input_tokens}, "
-            f"Output Tokens: {output_tokens}, Total Tokens: {input_tokens + output_tokens}"
+            f"Output Tokens: {output_tokens}, Total Tokens: {input_tokens + output_tokens}, "
+            f"Cache Read Tokens: {cache_read_tokens}, Cache Write Tokens: {cache_creation_tokens}"
         )
+        metrics.observe("llm_request_seconds", duration, provider=self.name, model=model)
+        if input_tokens:
+            metrics.observe("llm_input_tokens", input_tokens, provider=self.name, method=method)
+        if cache_read_tokens:
+            metrics.increment("llm_prompt_cache_read_tokens", cache_read_tokens, provider=self.name)
+        if cache_creation_tokens:
+            metrics.increment("llm_prompt_cache_write_tokens", cache_creation_tokens, provider=self.name)
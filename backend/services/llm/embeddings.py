@@ -0,0 +1,15 @@
+from functools import lru_cache
+
+from langchain_core.embeddings import Embeddings
+
+from config.settings import settings
+
+
+@lru_cache(maxsize=None)
+def default_embeddings() -> Embeddings:
+    """Shared embedding model for semantic search (EMBEDDING_MODEL)"""
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=settings.EMBEDDING_MODEL, api_key=settings.OPENAI_API_KEY)
+
+
+__all__ = ['default_embeddings']
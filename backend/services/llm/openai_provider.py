@@ -1,18 +1,43 @@
 from openai import AsyncOpenAI
+import json
 import logging
-from typing import List, Dict, Optional, AsyncGenerator
+import time
+from typing import List, Dict, Optional, Any, AsyncGenerator
 from config.settings import settings
 from .base import LLMProvider
+from .structured_output import StructuredOutputError
 
 logger = logging.getLogger(__name__)
 
 class OpenAIProvider(LLMProvider):
+    name = "openai"
+
     def __init__(self):
         self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         
     def get_default_model(self) -> str:
         return "gpt-4-turbo-preview"
 
+    def _format_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Convert base64 image parts ({'type': 'image', 'source': ...}) to OpenAI image_url parts"""
+        formatted = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, list):
+                parts = []
+                for part in content:
+                    source = part.get("source")
+                    if part.get("type") == "image" and isinstance(source, dict) and source.get("type") == "base64":
+                        parts.append({
+                            "type": "image_url",
+                            "image_url": {"url": f"data:{source['media_type']};base64,{source['data']}"}
+                        })
+                    else:
+                        parts.append(part)
+                message = {**message, "content": parts}
+            formatted.append(message)
+        return formatted
+
     async def generate(self, 
         prompt: str, 
         model: Optional[str] = None,
@@ -20,6 +45,7 @@ class OpenAIProvider(LLMProvider):
     ) -> str:
         try:
             model = model or self.get_default_model()
+            await self._wait_for_capacity(model, prompt, max_tokens=max_tokens)
             response = await self.client.completions.create(
                 model=model,
                 prompt=prompt,
@@ -37,6 +63,7 @@ class OpenAIProvider(LLMProvider):
     ) -> AsyncGenerator[str, None]:
         try:
             model = model or self.get_default_model()
+            await self._wait_for_capacity(model, prompt, max_tokens=max_tokens)
             stream = await self.client.completions.create(
                 model=model,
                 prompt=prompt,
@@ -54,7 +81,8 @@ class OpenAIProvider(LLMProvider):
         messages: List[Dict[str, str]], 
         model: Optional[str] = None,
         max_tokens: Optional[int] = None,
-        system: Optional[str] = None
+        system: Optional[str] = None,
+        temperature: Optional[float] = None
     ) -> str:
         try:
             model = model or self.get_default_model()
@@ -63,16 +91,80 @@ class OpenAIProvider(LLMProvider):
             chat_messages = []
             if system:
                 chat_messages.append({"role": "system", "content": system})
-            chat_messages.extend(messages)
+            chat_messages.extend(self._format_messages(messages))
             
+            params = {
+                "model": model,
+                "messages": chat_messages,
+                "max_tokens": max_tokens
+            }
+            if temperature is not None:
+                params["temperature"] = temperature
+
+            await self._wait_for_capacity(model, chat_messages, max_tokens=max_tokens)
+            response = await self.client.chat.completions.create(**params)
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Error creating OpenAI chat completion with model {model}: {str(e)}")
+            raise
+
+    async def create_structured_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        schema: Dict[str, Any],
+        name: str,
+        description: Optional[str] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        system: Optional[str] = None
+    ) -> Dict[str, Any]:
+        try:
+            start_time = time.time()
+            model = model or self.get_default_model()
+
+            chat_messages = []
+            if system:
+                chat_messages.append({"role": "system", "content": system})
+            chat_messages.extend(self._format_messages(messages))
+
+            # Force the function so the schema is enforced by the API rather than the prompt
+            await self._wait_for_capacity(model, chat_messages, max_tokens=max_tokens)
             response = await self.client.chat.completions.create(
                 model=model,
                 messages=chat_messages,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                tools=[{
+                    "type": "function",
+                    "function": {
+                        "name": name,
+                        "description": description or f"Record the {name}",
+                        "parameters": schema
+                    }
+                }],
+                tool_choice={"type": "function", "function": {"name": name}}
             )
-            return response.choices[0].message.content
+
+            if response.usage:
+                self._log_request_stats(
+                    method=f"structured_completion:{name}",
+                    model=model,
+                    start_time=start_time,
+                    input_tokens=response.usage.prompt_tokens,
+                    output_tokens=response.usage.completion_tokens
+                )
+
+            message = response.choices[0].message
+            if not message.tool_calls:
+                raise StructuredOutputError("Model did not call the output tool", message.content)
+            arguments = message.tool_calls[0].function.arguments
+            try:
+                return json.loads(arguments)
+            except json.JSONDecodeError as e:
+                raise StructuredOutputError(f"Tool arguments are not valid JSON: {str(e)}", arguments)
+        except StructuredOutputError:
+            raise
         except Exception as e:
-            logger.error(f"Error creating OpenAI chat completion with model {model}: {str(e)}")
+            logger.error(f"Error creating OpenAI structured completion with model {model}: {str(e)}")
             raise
 
     async def create_chat_completion_stream(
@@ -90,8 +182,9 @@ class OpenAIProvider(LLMProvider):
             chat_messages = []
             if system:
                 chat_messages.append({"role": "system", "content": system})
-            chat_messages.extend(messages)
+            chat_messages.extend(self._format_messages(messages))
             
+            await self._wait_for_capacity(model, chat_messages, max_tokens=max_tokens)
             stream = await self.client.chat.completions.create(
                 model=model,
                 messages=chat_messages,
@@ -0,0 +1,245 @@
+import logging
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import groupby
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import tiktoken
+
+from config.settings import settings
+from utils.metrics import metrics
+from .scheduler import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Used for models tiktoken does not know (e.g. Claude); close enough for budgeting
+FALLBACK_ENCODING = "o200k_base"
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators per chat message
+REPLY_PRIMING_TOKENS = 3  # Every reply is primed with <|start|>assistant<|message|>
+IMAGE_TOKENS = 1000  # Rough cost of an image content part
+
+TRUNCATION_MARKER = "\n[...truncated]\n"
+
+KEEP_WHOLE = 2 ** 31  # min_tokens for sections that must never be trimmed
+
+SectionContent = Union[str, List[Dict[str, Any]]]
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        # tiktoken downloads its encodings on first use, which fails offline
+        logger.warning(f"No tokenizer available for {model}, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Number of tokens text encodes to for model"""
+    if not text:
+        return 0
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _content_tokens(content: Any, model: str) -> int:
+    if content is None:
+        return 0
+    if isinstance(content, str):
+        return count_tokens(content, model)
+    if isinstance(content, list):
+        tokens = 0
+        for part in content:
+            if isinstance(part, dict) and part.get("type") in ("image", "image_url"):
+                tokens += IMAGE_TOKENS
+            elif isinstance(part, dict):
+                tokens += count_tokens(str(part.get("text", "")), model)
+            else:
+                tokens += count_tokens(str(part), model)
+        return tokens
+    return count_tokens(str(content), model)
+
+
+def count_message_tokens(messages: Any, model: str, system: Optional[str] = None) -> int:
+    """
+    Number of prompt tokens for a chat call: message contents plus the per-message
+    and reply priming overhead. messages may be a plain prompt string, a list of
+    {"role", "content"} dicts, or LangChain messages.
+    """
+    if isinstance(messages, str):
+        return count_tokens(messages, model) + count_tokens(system or "", model) + REPLY_PRIMING_TOKENS
+
+    tokens = REPLY_PRIMING_TOKENS
+    if system:
+        tokens += MESSAGE_OVERHEAD_TOKENS + count_tokens(system, model)
+    for message in messages or []:
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", message)
+        tokens += MESSAGE_OVERHEAD_TOKENS + _content_tokens(content, model)
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str, keep: str = "start") -> str:
+    """
+    Cut text down to at most max_tokens tokens, marking the cut.
+
+    Args:
+        keep: "start" keeps the beginning of the text, "end" keeps the end
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    max_tokens = max(0, max_tokens - count_tokens(TRUNCATION_MARKER, model))
+    encoding = _encoding_for(model)
+    if encoding is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        kept = text[:max_chars] if keep == "start" else text[len(text) - max_chars:]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        kept = encoding.decode(tokens[:max_tokens] if keep == "start" else tokens[len(tokens) - max_tokens:])
+    return kept + TRUNCATION_MARKER if keep == "start" else TRUNCATION_MARKER + kept
+
+
+def context_window(model: str) -> int:
+    return settings.LLM_CONTEXT_WINDOWS.get(model, settings.LLM_DEFAULT_CONTEXT_WINDOW)
+
+
+@dataclass
+class PromptSection:
+    """
+    One part of a prompt competing for the token budget.
+
+    name: Key of the section in the assembled prompt
+    content: Text, or a list of chat messages (e.g. conversation history)
+    priority: Sections with lower priority are trimmed first
+    min_tokens: The section is never trimmed below this size (KEEP_WHOLE: never trimmed)
+    keep: Part of a text section that survives truncation ("start" or "end");
+        message lists always lose their oldest messages first
+    """
+    name: str
+    content: SectionContent
+    priority: int = 0
+    min_tokens: int = 0
+    keep: str = "start"
+
+
+@dataclass
+class AssembledPrompt:
+    """Sections after fitting them into the budget"""
+    sections: Dict[str, SectionContent]
+    section_tokens: Dict[str, int]
+    tokens: int
+    budget: int
+    trimmed: List[str] = field(default_factory=list)
+
+    def __getitem__(self, name: str) -> SectionContent:
+        return self.sections[name]
+
+    @property
+    def over_budget(self) -> bool:
+        return self.tokens > self.budget
+
+
+class PromptBudget:
+    """
+    Fits prompt sections into a model's context window.
+
+    Tokens are counted with the model's tokenizer. When the sections do not fit
+    in the budget (the context window minus the tokens reserved for the
+    response), the lowest priority sections are truncated first, never below
+    their min_tokens.
+    """
+
+    def __init__(self,
+                 model: str,
+                 max_prompt_tokens: Optional[int] = None,
+                 reserved_output_tokens: Optional[int] = None):
+        self.model = model
+        reserved = settings.PROMPT_RESERVED_OUTPUT_TOKENS if reserved_output_tokens is None else reserved_output_tokens
+        budget = context_window(model) - reserved
+        self.budget = min(budget, max_prompt_tokens) if max_prompt_tokens else budget
+
+    def count(self, content: SectionContent) -> int:
+        if isinstance(content, list):
+            return count_message_tokens(content, self.model) - REPLY_PRIMING_TOKENS
+        return count_tokens(content, self.model)
+
+    def fit(self, sections: Sequence[PromptSection], call_site: str = "default") -> AssembledPrompt:
+        """
+        Trim sections, lowest priority first, until they fit the budget.
+
+        Sections of equal priority are trimmed together, in proportion to how
+        far each is above its min_tokens.
+        """
+        contents = {section.name: section.content for section in sections}
+        tokens = {section.name: self.count(section.content) for section in sections}
+        trimmed = []
+
+        overflow = sum(tokens.values()) - self.budget
+        for _, group in groupby(sorted(sections, key=lambda section: section.priority), key=lambda section: section.priority):
+            if overflow <= 0:
+                break
+            group = list(group)
+            trimmable = sum(max(0, tokens[section.name] - section.min_tokens) for section in group)
+            if not trimmable:
+                continue
+            share = min(1.0, overflow / trimmable)
+            for section in group:
+                cut = math.ceil(max(0, tokens[section.name] - section.min_tokens) * share)
+                if cut <= 0:
+                    continue
+                contents[section.name] = self._shrink(section, contents[section.name], tokens[section.name] - cut)
+                new_tokens = self.count(contents[section.name])
+                overflow -= tokens[section.name] - new_tokens
+                tokens[section.name] = new_tokens
+                trimmed.append(section.name)
+
+        return self._assembled(contents, tokens, trimmed, call_site)
+
+    def _shrink(self, section: PromptSection, content: SectionContent, target: int) -> SectionContent:
+        if isinstance(content, list):
+            # Drop the oldest messages
+            messages = list(content)
+            while messages and self.count(messages) > target:
+                messages.pop(0)
+            return messages
+        return truncate_to_tokens(content, target, self.model, keep=section.keep)
+
+    def _assembled(self,
+                   contents: Dict[str, SectionContent],
+                   tokens: Dict[str, int],
+                   trimmed: List[str],
+                   call_site: str) -> AssembledPrompt:
+        prompt = AssembledPrompt(
+            sections=contents,
+            section_tokens=tokens,
+            tokens=sum(tokens.values()),
+            budget=self.budget,
+            trimmed=trimmed
+        )
+        metrics.observe("prompt_tokens", prompt.tokens, call_site=call_site)
+        for name in trimmed:
+            metrics.increment("prompt_sections_trimmed", call_site=call_site, section=name)
+        if trimmed:
+            logger.info(f"Trimmed prompt sections {trimmed} for {call_site} to fit {self.budget} tokens")
+        if prompt.over_budget:
+            logger.warning(f"Prompt for {call_site} is {prompt.tokens} tokens, over its {self.budget} token budget")
+        return prompt
+
+
+__all__ = [
+    'PromptBudget',
+    'PromptSection',
+    'AssembledPrompt',
+    'count_tokens',
+    'count_message_tokens',
+    'truncate_to_tokens',
+    'context_window',
+    'KEEP_WHOLE'
+]
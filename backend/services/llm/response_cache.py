@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from config.settings import settings
+from utils.metrics import metrics
+from utils.persistent_cache import PersistentCache
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """
+    Exact-match cache for LLM responses.
+
+    Responses are keyed by a canonical hash of the provider, model, system prompt,
+    messages, max_tokens and temperature, and persisted locally so repeated
+    executions of the same rendered prompt skip the provider round trip.
+    """
+
+    def __init__(self, backend: PersistentCache):
+        self.backend = backend
+
+    def make_key(self,
+                 provider: str,
+                 model: str,
+                 messages: Any,
+                 system: Optional[str] = None,
+                 max_tokens: Optional[int] = None,
+                 temperature: Optional[float] = None) -> str:
+        """Build the cache key for a request"""
+        canonical = json.dumps(
+            {
+                "provider": provider,
+                "model": model,
+                "system": system,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "temperature": temperature
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, provider: str = "unknown") -> Optional[Any]:
+        """Return the cached response for a key, or None on a miss"""
+        try:
+            response = self.backend.get(key)
+        except Exception as e:
+            # The cache must never break an LLM call
+            logger.warning(f"LLM response cache read failed: {str(e)}")
+            response = None
+        return self._count_lookup(response, provider)
+
+    async def aget(self, key: str, provider: str = "unknown") -> Optional[Any]:
+        """get without blocking the event loop"""
+        try:
+            response = await self.backend.aget(key)
+        except Exception as e:
+            logger.warning(f"LLM response cache read failed: {str(e)}")
+            response = None
+        return self._count_lookup(response, provider)
+
+    def _count_lookup(self, response: Optional[Any], provider: str) -> Optional[Any]:
+        if response is None:
+            metrics.increment("llm_cache_misses", provider=provider)
+        else:
+            metrics.increment("llm_cache_hits", provider=provider)
+            logger.info(f"LLM response cache hit for provider {provider}")
+        return response
+
+    def set(self, key: str, response: Any) -> None:
+        """Store a response"""
+        if response is None:
+            return
+        try:
+            self.backend.set(key, response)
+        except Exception as e:
+            logger.warning(f"LLM response cache write failed: {str(e)}")
+
+    async def aset(self, key: str, response: Any) -> None:
+        """set without blocking the event loop"""
+        if response is None:
+            return
+        try:
+            await self.backend.aset(key, response)
+        except Exception as e:
+            logger.warning(f"LLM response cache write failed: {str(e)}")
+
+    def clear(self) -> None:
+        """Remove all cached responses"""
+        self.backend.clear()
+
+
+class LangChainResponseCache(BaseCache):
+    """
+    Adapter exposing the LLM response cache to LangChain chat models, so agent
+    nodes built on ChatOpenAI share the same persistent store.
+    """
+
+    def __init__(self, cache: LLMResponseCache):
+        self.cache = cache
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        # llm_string already encodes the model name and its parameters (incl. temperature)
+        return self.cache.make_key(provider="langchain", model=llm_string, messages=prompt)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        serialized = self.cache.get(self._key(prompt, llm_string), provider="langchain")
+        if serialized is None:
+            return None
+        try:
+            return [loads(generation) for generation in serialized]
+        except Exception as e:
+            logger.warning(f"Discarding unreadable LangChain cache entry: {str(e)}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        serialized: List[str] = [dumps(generation) for generation in return_val]
+        self.cache.set(self._key(prompt, llm_string), serialized)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear()
+
+
+# Create singleton instances
+llm_response_cache = LLMResponseCache(
+    PersistentCache(
+        path=os.path.join(settings.CACHE_DIR, "llm_responses.sqlite3"),
+        table="llm_responses",
+        ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES
+    )
+)
+langchain_response_cache = LangChainResponseCache(llm_response_cache)
+
+__all__ = ['llm_response_cache', 'langchain_response_cache', 'LLMResponseCache', 'LangChainResponseCache']
@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from config.settings import settings
+from utils.metrics import metrics
+from .base import LLMProvider
+from .structured_output import StructuredOutputError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+LATENCY_WINDOW = 200  # Recent call durations kept per target for the p95 estimate
+MIN_LATENCY_SAMPLES = 20  # Below this many samples the policy's hedge_after_seconds is used
+
+# Errors about the response content rather than the provider; raised without failover
+CONTENT_ERRORS = (StructuredOutputError,)
+
+
+class CircuitBreaker:
+    """
+    Stops sending calls to a provider after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens and the
+    provider is skipped. After reset_seconds one trial call is let through
+    (half open); its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.time() - self.opened_at >= self.reset_seconds:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_in_flight = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.time()
+            self._set_state(OPEN)
+
+    def release(self) -> None:
+        """Forget a trial call that was cancelled before it finished"""
+        self._trial_in_flight = False
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit breaker for {self.name}: {self.state} -> {state}")
+        self.state = state
+        metrics.set_gauge("llm_circuit_open", 1 if state == OPEN else 0, provider=self.name)
+
+
+class LatencyTracker:
+    """Rolling call durations per (provider, model) target"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def record(self, target: Tuple[str, str], seconds: float) -> None:
+        self._samples.setdefault(target, deque(maxlen=self.window)).append(seconds)
+
+    def p95(self, target: Tuple[str, str]) -> Optional[float]:
+        samples = self._samples.get(target)
+        if not samples or len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+@dataclass
+class RoutePolicy:
+    """
+    How calls from one call site are routed.
+
+    targets: (provider, model) pairs in order of preference; a model of None
+        means the caller's model for the first target and the provider's
+        default model for the others. A caller's model is never sent to
+        another provider, since model names are provider specific.
+    hedge: Whether to send a backup request to the next target when the
+        first is slower than its rolling p95.
+    hedge_after_seconds: Hedge delay to use until enough latencies are known.
+    """
+    targets: List[Tuple[str, Optional[str]]]
+    hedge: bool = False
+    hedge_after_seconds: float = 10.0
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RoutePolicy":
+        return cls(
+            targets=[(target[0], target[1] if len(target) > 1 else None) for target in data["targets"]],
+            hedge=data.get("hedge", False),
+            hedge_after_seconds=data.get("hedge_after_seconds", 10.0)
+        )
+
+
+class AllProvidersFailedError(Exception):
+    """Raised when no target of a route policy produced a result"""
+
+    def __init__(self, call_site: str, errors: List[Tuple[str, Exception]]):
+        summary = "; ".join(f"{name}: {error}" for name, error in errors) or "all circuits open"
+        super().__init__(f"All providers failed for {call_site}: {summary}")
+        self.errors = errors
+
+
+ProviderCall = Callable[[LLMProvider, Optional[str]], Awaitable[T]]
+
+
+class LLMRouter:
+    """
+    Routes LLM calls over several providers according to per-call-site policies.
+
+    A call goes to the first target whose circuit breaker is closed. Errors fail
+    over to the next target. With hedging, a backup request is sent to the next
+    target once the first exceeds its rolling p95 latency (for streams, its
+    time to first chunk); whichever answers first wins and the other request
+    is cancelled.
+    """
+
+    def __init__(self,
+                 providers: Dict[str, LLMProvider],
+                 policies: Dict[str, RoutePolicy],
+                 primary: str):
+        self.providers = providers
+        self.policies = policies
+        self.primary = primary
+        self.latency = LatencyTracker()
+        # Streams hedge on time to first chunk, which is not comparable to whole call durations
+        self.first_chunk_latency = LatencyTracker()
+        self.breakers = {
+            name: CircuitBreaker(
+                name,
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                reset_seconds=settings.LLM_CIRCUIT_RESET_SECONDS
+            )
+            for name in providers
+        }
+
+    @property
+    def primary_provider(self) -> LLMProvider:
+        return self.providers[self.primary]
+
+    def set_primary(self, provider: str) -> None:
+        """Make provider the first target of call sites without an explicit policy"""
+        if provider not in self.providers:
+            raise ValueError(f"Unsupported provider: {provider}")
+        self.primary = provider
+
+    def policy_for(self, call_site: str) -> RoutePolicy:
+        policy = self.policies.get(call_site) or self.policies.get("default")
+        if policy is not None:
+            return policy
+        others = [name for name in self.providers if name != self.primary]
+        return RoutePolicy(targets=[(self.primary, None)] + [(name, None) for name in others])
+
+    def _targets(self, call_site: str, model: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+        """Resolve the policy targets to (provider, model) pairs for available providers"""
+        targets = []
+        for index, (provider, target_model) in enumerate(self.policy_for(call_site).targets):
+            if provider not in self.providers:
+                continue
+            if target_model is None and index == 0:
+                target_model = model
+            targets.append((provider, target_model))
+        return targets
+
+    def first_target(self, call_site: str, model: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """(provider, model) a call is sent to when nothing fails, or None if no target is available"""
+        for provider, target_model in self._targets(call_site, model):
+            return provider, target_model or self.providers[provider].get_default_model()
+        return None
+
+    async def call(self, call_site: str, fn: ProviderCall, model: Optional[str] = None) -> T:
+        """
+        Run fn(provider, model) against the targets of the call site's policy.
+
+        Raises:
+            AllProvidersFailedError: If every available target failed
+        """
+        policy = self.policy_for(call_site)
+        pending = self._targets(call_site, model)
+        errors: List[Tuple[str, Exception]] = []
+        running: Dict[asyncio.Task, Tuple[str, Optional[str], float]] = {}
+
+        def launch_next() -> bool:
+            while pending:
+                provider, target_model = pending.pop(0)
+                if not self.breakers[provider].allow():
+                    logger.info(f"Skipping {provider} for {call_site}: circuit open")
+                    continue
+                task = asyncio.create_task(fn(self.providers[provider], target_model))
+                running[task] = (provider, target_model, time.time())
+                return True
+            return False
+
+        try:
+            if not launch_next():
+                raise AllProvidersFailedError(call_site, errors)
+            hedged = False
+            while running:
+                timeout = None
+                if policy.hedge and not hedged and pending and len(running) == 1:
+                    provider, target_model, started = next(iter(running.values()))
+                    hedge_after = self.latency.p95((provider, target_model or "")) or policy.hedge_after_seconds
+                    timeout = max(0.0, started + hedge_after - time.time())
+
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Primary is slower than its p95: send a backup request
+                    hedged = True
+                    if launch_next():
+                        metrics.increment("llm_router_hedges", call_site=call_site)
+                    continue
+
+                for task in done:
+                    provider, target_model, started = running.pop(task)
+                    error = task.exception()
+                    if isinstance(error, CONTENT_ERRORS):
+                        self.breakers[provider].record_success()
+                        raise error
+                    if error is None:
+                        self.breakers[provider].record_success()
+                        self.latency.record((provider, target_model or ""), time.time() - started)
+                        if hedged:
+                            metrics.increment("llm_router_hedge_wins", call_site=call_site, provider=provider)
+                        return task.result()
+                    self.breakers[provider].record_failure()
+                    errors.append((provider, error))
+                    logger.warning(f"{provider} failed for {call_site}: {str(error)}")
+
+                if not running:
+                    # Fail over to the next target
+                    if launch_next():
+                        metrics.increment("llm_router_failovers", call_site=call_site)
+
+            raise AllProvidersFailedError(call_site, errors)
+        finally:
+            # Cancel the losing (or abandoned) requests
+            for task, (provider, _, _) in running.items():
+                task.cancel()
+                self.breakers[provider].release()
+
+    async def stream(self,
+                     call_site: str,
+                     fn: Callable[[LLMProvider, Optional[str]], AsyncGenerator[str, None]],
+                     model: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        Stream fn(provider, model) from the first target that sends a chunk.
+
+        Streams fail over only if a target errors before sending its first
+        chunk. With hedging, a backup stream is started once the first target
+        takes longer than its rolling p95 to send its first chunk; the stream
+        whose first chunk arrives first is used and the other is closed.
+        """
+        policy = self.policy_for(call_site)
+        pending = self._targets(call_site, model)
+        errors: List[Tuple[str, Exception]] = []
+        # First-chunk task -> (provider, model, start time, stream)
+        running: Dict[asyncio.Task, Tuple[str, Optional[str], float, AsyncGenerator[str, None]]] = {}
+        winner: Optional[AsyncGenerator[str, None]] = None
+        first_chunk = None
+
+        def launch_next() -> bool:
+            while pending:
+                provider, target_model = pending.pop(0)
+                if not self.breakers[provider].allow():
+                    continue
+                stream = fn(self.providers[provider], target_model)
+                task = asyncio.ensure_future(stream.__anext__())
+                running[task] = (provider, target_model, time.time(), stream)
+                return True
+            return False
+
+        try:
+            if not launch_next():
+                raise AllProvidersFailedError(call_site, errors)
+            hedged = False
+            while running:
+                timeout = None
+                if policy.hedge and not hedged and pending and len(running) == 1:
+                    provider, target_model, started, _ = next(iter(running.values()))
+                    hedge_after = self.first_chunk_latency.p95((provider, target_model or "")) or policy.hedge_after_seconds
+                    timeout = max(0.0, started + hedge_after - time.time())
+
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # No first chunk within the first target's p95: start a backup stream
+                    hedged = True
+                    if launch_next():
+                        metrics.increment("llm_router_hedges", call_site=call_site)
+                    continue
+
+                for task in done:
+                    provider, target_model, started, stream = running.pop(task)
+                    error = task.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        self.breakers[provider].record_success()
+                        self.first_chunk_latency.record((provider, target_model or ""), time.time() - started)
+                        if hedged:
+                            metrics.increment("llm_router_hedge_wins", call_site=call_site, provider=provider)
+                        if error is not None:
+                            return
+                        winner, first_chunk = stream, task.result()
+                        break
+                    if isinstance(error, CONTENT_ERRORS):
+                        self.breakers[provider].record_success()
+                        raise error
+                    self.breakers[provider].record_failure()
+                    errors.append((provider, error))
+                    logger.warning(f"{provider} stream failed for {call_site}: {str(error)}")
+                    await stream.aclose()
+                if winner is not None:
+                    break
+
+                if not running and launch_next():
+                    # Fail over to the next target
+                    metrics.increment("llm_router_failovers", call_site=call_site)
+
+            if winner is None:
+                raise AllProvidersFailedError(call_site, errors)
+        finally:
+            # Close the losing (or abandoned) streams
+            for task, (provider, _, _, stream) in running.items():
+                task.cancel()
+                self.breakers[provider].release()
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+
+        try:
+            yield first_chunk
+            async for chunk in winner:
+                yield chunk
+        finally:
+            await winner.aclose()
+
+
+__all__ = [
+    'LLMRouter',
+    'RoutePolicy',
+    'CircuitBreaker',
+    'LatencyTracker',
+    'AllProvidersFailedError'
+]
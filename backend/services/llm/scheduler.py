@@ -0,0 +1,323 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from config.settings import settings
+from utils.metrics import metrics
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Priority classes
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+CHARS_PER_TOKEN = 4  # Rough prompt size estimate when no tokenizer is at hand
+DEFAULT_OUTPUT_TOKENS = 1000  # Assumed completion size when max_tokens is not given
+QUEUED_RETRY_SECONDS = 0.1  # How often a caller that cannot join the queue checks again while others wait
+
+
+@dataclass(frozen=True)
+class LLMCallContext:
+    """Who an LLM call is made for, and how urgently"""
+    user_id: str = "anonymous"
+    priority: str = INTERACTIVE
+
+
+_call_context: ContextVar[LLMCallContext] = ContextVar("llm_call_context", default=LLMCallContext())
+
+
+@contextmanager
+def llm_call_context(user_id: Optional[str] = None, priority: Optional[str] = None) -> Iterator[LLMCallContext]:
+    """
+    Attribute the LLM calls made inside the block (and in tasks started from it)
+    to a user and priority class.
+    """
+    current = _call_context.get()
+    context = LLMCallContext(
+        user_id=str(user_id) if user_id is not None else current.user_id,
+        priority=priority or current.priority
+    )
+    token = _call_context.set(context)
+    try:
+        yield context
+    finally:
+        _call_context.reset(token)
+
+
+def current_call_context() -> LLMCallContext:
+    return _call_context.get()
+
+
+def estimate_tokens(messages: Any, system: Optional[str] = None, max_tokens: Optional[int] = None) -> int:
+    """
+    Estimate the tokens a call counts against a TPM limit: prompt plus max_tokens,
+    which is how providers reserve capacity before the completion is known.
+    """
+    prompt_chars = len(str(messages)) + len(system or "")
+    return prompt_chars // CHARS_PER_TOKEN + (max_tokens or DEFAULT_OUTPUT_TOKENS)
+
+
+@dataclass(order=True)
+class _QueuedCall:
+    finish_tag: float
+    seq: int
+    model: str = field(compare=False)
+    tokens: int = field(compare=False)
+    context: LLMCallContext = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.time)
+
+
+class LLMScheduler:
+    """
+    Schedules upstream LLM calls across users and priority classes.
+
+    Calls are served in weighted fair queuing order: each (priority, user) flow
+    gets a share of the model's token budget proportional to its priority weight,
+    so one user's batch job cannot starve another user's chat. Each model has an
+    RPM and a TPM token bucket; a call is released when both have room.
+
+    Sync callers in worker threads (LangChain's invoke) join the same queue
+    through the event loop the scheduler runs on.
+    """
+
+    def __init__(self,
+                 model_limits: Dict[str, Dict[str, int]],
+                 default_rpm: int,
+                 default_tpm: int,
+                 priority_weights: Dict[str, float],
+                 enabled: bool = True):
+        self.model_limits = model_limits
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.priority_weights = priority_weights
+        self.enabled = enabled
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._heap: List[_QueuedCall] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[Tuple[str, str], float] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Buckets are also used from sync LangChain calls running in worker threads
+        self._lock = threading.Lock()
+
+    async def acquire(self, model: str, tokens: int, context: Optional[LLMCallContext] = None) -> None:
+        """
+        Wait until a call to model using about tokens tokens may be sent.
+
+        Args:
+            model: Model the call goes to (limits are per model)
+            tokens: Estimated tokens for the call, see estimate_tokens
+            context: Caller attribution (defaults to the current llm_call_context)
+        """
+        if not self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        context = context or current_call_context()
+        flow = (context.priority, context.user_id)
+        weight = self.priority_weights.get(context.priority, 1.0)
+
+        start_tag = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+        call = _QueuedCall(
+            finish_tag=start_tag + tokens / weight,
+            seq=next(self._seq),
+            model=model,
+            tokens=tokens,
+            context=context,
+            future=asyncio.get_running_loop().create_future()
+        )
+        self._last_finish[flow] = call.finish_tag
+        heapq.heappush(self._heap, call)
+        self._dispatch()
+
+        try:
+            await call.future
+        finally:
+            if not call.future.done():
+                # Cancelled while queued; skipped when it reaches the front
+                call.future.cancel()
+            wait = time.time() - call.enqueued_at
+            metrics.observe("llm_scheduler_wait_seconds", wait, priority=context.priority, model=model)
+            if wait > 1:
+                logger.info(f"LLM call for {context.user_id} ({context.priority}) waited {wait:.2f}s for {model}")
+
+    def acquire_sync(self, model: str, tokens: int, context: Optional[LLMCallContext] = None) -> None:
+        """
+        Blocking acquire for calls made from worker threads.
+
+        The call waits in the fair queue on the scheduler's event loop. Without
+        a running loop to queue on (or on the loop's own thread, which must not
+        block) it takes capacity directly, but still only once no other call
+        is queued for the model.
+        """
+        if not self.enabled:
+            return
+        context = context or current_call_context()
+        loop = self._loop
+        if loop is not None and loop.is_running() and not self._on_loop_thread(loop):
+            asyncio.run_coroutine_threadsafe(self.acquire(model, tokens, context), loop).result()
+            return
+        while True:
+            wait = self.try_acquire(model, tokens)
+            if wait == 0.0:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self, model: str, tokens: int) -> float:
+        """
+        Take capacity for a call without queuing. Calls already queued for the
+        model go first.
+
+        Returns:
+            0 if the call may be sent, otherwise seconds to wait before retrying
+        """
+        if not self.enabled:
+            return 0.0
+        if any(call.model == model and not call.future.done() for call in list(self._heap)):
+            return QUEUED_RETRY_SECONDS
+        return self._take(model, tokens)
+
+    def _take(self, model: str, tokens: int) -> float:
+        with self._lock:
+            requests, token_budget = self._get_buckets(model)
+            wait = max(requests.wait_time(1), token_budget.wait_time(tokens))
+            if wait == 0.0:
+                requests.try_acquire(1)
+                token_budget.try_acquire(tokens)
+            return wait
+
+    def queued(self) -> int:
+        return sum(1 for call in self._heap if not call.future.done())
+
+    def estimated_wait(self, model: str, tokens: int) -> float:
+        """Seconds a new call to model would wait for capacity, behind the calls already queued for it"""
+        if not self.enabled:
+            return 0.0
+        queued = [call for call in self._heap if call.model == model and not call.future.done()]
+        with self._lock:
+            requests, token_budget = self._get_buckets(model)
+            return max(
+                requests.wait_time(1) + len(queued) / requests.rate,
+                token_budget.wait_time(tokens) + sum(call.tokens for call in queued) / token_budget.rate
+            )
+
+    @staticmethod
+    def _on_loop_thread(loop: asyncio.AbstractEventLoop) -> bool:
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+    def _get_buckets(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            limits = self.model_limits.get(model, {})
+            self._buckets[model] = (
+                TokenBucket.per_minute(limits.get("rpm", self.default_rpm)),
+                TokenBucket.per_minute(limits.get("tpm", self.default_tpm))
+            )
+        return self._buckets[model]
+
+    def _dispatch(self) -> None:
+        """Release queued calls in finish-tag order while their model has capacity"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        blocked: Dict[str, float] = {}
+        held: List[_QueuedCall] = []
+        while self._heap:
+            call = heapq.heappop(self._heap)
+            if call.future.done():
+                continue
+            if call.model in blocked:
+                # Keep order within a model; other models can still proceed
+                held.append(call)
+                continue
+            wait = self._take(call.model, call.tokens)
+            if wait > 0:
+                blocked[call.model] = wait
+                held.append(call)
+                continue
+            self._virtual_time = max(self._virtual_time, call.finish_tag)
+            call.future.set_result(None)
+
+        for call in held:
+            heapq.heappush(self._heap, call)
+        # Flows that are behind virtual time carry no state worth keeping
+        self._last_finish = {
+            flow: finish for flow, finish in self._last_finish.items() if finish > self._virtual_time
+        }
+        metrics.set_gauge("llm_scheduler_queued", len(self._heap))
+
+        if blocked:
+            self._timer = asyncio.get_running_loop().call_later(min(blocked.values()), self._dispatch)
+
+
+class SchedulerRateLimiter(BaseRateLimiter):
+    """
+    LangChain rate limiter backed by the LLM scheduler, for chat models created
+    with ChatOpenAI(..., rate_limiter=...).
+
+    LangChain does not pass the prompt to the limiter, so each call is charged
+    tokens_per_call tokens.
+    """
+
+    def __init__(self, scheduler: LLMScheduler, model: str, tokens_per_call: int = DEFAULT_OUTPUT_TOKENS * 2):
+        self.scheduler = scheduler
+        self.model = model
+        self.tokens_per_call = tokens_per_call
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self.scheduler.try_acquire(self.model, self.tokens_per_call) == 0.0
+        # Sync calls run in worker threads and queue on the scheduler's loop
+        self.scheduler.acquire_sync(self.model, self.tokens_per_call)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self.scheduler.try_acquire(self.model, self.tokens_per_call) == 0.0
+        await self.scheduler.acquire(self.model, self.tokens_per_call)
+        return True
+
+
+# Create a singleton instance
+llm_scheduler = LLMScheduler(
+    model_limits=settings.LLM_MODEL_RATE_LIMITS,
+    default_rpm=settings.LLM_DEFAULT_RPM,
+    default_tpm=settings.LLM_DEFAULT_TPM,
+    priority_weights={
+        INTERACTIVE: settings.LLM_INTERACTIVE_WEIGHT,
+        BATCH: 1.0
+    },
+    enabled=settings.LLM_SCHEDULER_ENABLED
+)
+
+
+def rate_limiter_for(model: str) -> SchedulerRateLimiter:
+    """Rate limiter to pass to a LangChain chat model for the given model"""
+    return SchedulerRateLimiter(llm_scheduler, model)
+
+
+__all__ = [
+    'llm_scheduler',
+    'LLMScheduler',
+    'SchedulerRateLimiter',
+    'rate_limiter_for',
+    'llm_call_context',
+    'current_call_context',
+    'estimate_tokens',
+    'INTERACTIVE',
+    'BATCH'
+]
@@ -0,0 +1,314 @@
+import copy
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+JSONPath = Tuple[Union[str, int], ...]
+
+WHITESPACE = " \t\r\n"
+LITERAL_CHARS = set("0123456789+-.eEtruefalsn")
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+@dataclass
+class JSONEvent:
+    """
+    Event emitted while parsing a streamed JSON document.
+
+    Types:
+        text_delta: New characters of a string value still being generated
+        field: A value (at any depth) is complete
+        done: The whole document is complete
+    """
+    type: str
+    path: JSONPath
+    value: Any = None
+
+
+class _Frame:
+    """An open object or array"""
+
+    def __init__(self, container: Union[dict, list], path: JSONPath):
+        self.container = container
+        self.path = path
+        self.key: Optional[str] = None
+
+
+class StreamingJSONParser:
+    """
+    Incremental parser for JSON produced by an LLM.
+
+    Feed chunks as they arrive and act on the returned events before the model
+    has finished. The parser skips any text or markdown fence before the first
+    object or array and everything after it, and accepts raw newlines and tabs
+    inside strings. feed() raises ValueError on malformed output; try_feed()
+    instead stops parsing, so the caller can fall back to handling the whole
+    response once the stream ends.
+
+    Example:
+        parser = StreamingJSONParser()
+        async for chunk in stream:
+            for event in parser.feed(chunk):
+                if event.type == "field" and event.path == ("tool",):
+                    start_tool(event.value)
+        result = parser.close()
+    """
+
+    def __init__(self):
+        self._state = "start"
+        self._stack: List[_Frame] = []
+        self._root: Any = None
+        self._events: List[JSONEvent] = []
+
+        # Current string or literal token
+        self._chars: List[str] = []
+        self._string_is_key = False
+        self._string_path: JSONPath = ()
+        self._delta_start = 0
+        self._unicode: List[str] = []
+
+        self.error: Optional[str] = None  # Why try_feed() stopped parsing, if it did
+
+    @property
+    def value(self) -> Any:
+        """The live (partial) document; strings still being generated are not included"""
+        return self._root
+
+    @property
+    def partial(self) -> Any:
+        """A copy of the partial document including the string currently being generated"""
+        snapshot = copy.deepcopy(self._root)
+        if self._state in ("string", "escape", "unicode") and not self._string_is_key and self._stack:
+            self._assign(snapshot, self._string_path, "".join(self._chars))
+        return snapshot
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> List[JSONEvent]:
+        """Consume a chunk of model output and return the events it completed"""
+        self._events = []
+        for ch in chunk:
+            self._consume(ch)
+        self._flush_text_delta()
+        return self._events
+
+    def try_feed(self, chunk: str) -> List[JSONEvent]:
+        """
+        Like feed(), but malformed output stops parsing instead of raising: the
+        error is kept in error, and this and later chunks return no events.
+        """
+        if self.error is not None:
+            return []
+        try:
+            return self.feed(chunk)
+        except ValueError as e:
+            logger.info(f"Stopped parsing streamed JSON: {str(e)}")
+            self.error = str(e)
+            return []
+
+    def close(self) -> Any:
+        """
+        Finish parsing and return the complete document.
+
+        Raises:
+            ValueError: If the output was malformed or no complete JSON object or array was received
+        """
+        if self.error is not None:
+            raise ValueError(self.error)
+        if self._state != "done":
+            raise ValueError("Incomplete JSON: response ended before the document was closed")
+        return self._root
+
+    def _consume(self, ch: str) -> None:
+        state = self._state
+
+        if state == "string":
+            if ch == "\\":
+                self._state = "escape"
+            elif ch == '"':
+                self._end_string()
+            else:
+                # Raw control characters are kept as-is rather than rejected
+                self._chars.append(ch)
+            return
+
+        if state == "escape":
+            if ch == "u":
+                self._unicode = []
+                self._state = "unicode"
+            else:
+                self._chars.append(ESCAPES.get(ch, ch))
+                self._state = "string"
+            return
+
+        if state == "unicode":
+            self._unicode.append(ch)
+            if len(self._unicode) == 4:
+                try:
+                    self._chars.append(chr(int("".join(self._unicode), 16)))
+                except ValueError:
+                    raise ValueError(f"Invalid unicode escape: \\u{''.join(self._unicode)}")
+                self._state = "string"
+            return
+
+        if state == "literal":
+            if ch in LITERAL_CHARS:
+                self._chars.append(ch)
+                return
+            self._end_literal()
+            state = self._state
+
+        if state == "done" or ch in WHITESPACE:
+            return
+
+        if state == "start":
+            if ch in "{[":
+                self._open(ch, ())
+            return
+
+        if state == "value":
+            frame = self._stack[-1]
+            if ch == "]" and isinstance(frame.container, list) and not frame.container:
+                self._close(ch)
+            elif ch in "{[":
+                self._open(ch, self._child_path(frame))
+            elif ch == '"':
+                self._begin_string(is_key=False, path=self._child_path(frame))
+            elif ch in LITERAL_CHARS:
+                self._chars = [ch]
+                self._state = "literal"
+            else:
+                raise ValueError(f"Unexpected character {ch!r} where a value was expected")
+            return
+
+        if state == "key":
+            if ch == '"':
+                self._begin_string(is_key=True, path=self._stack[-1].path)
+            elif ch == "}":
+                self._close(ch)
+            else:
+                raise ValueError(f"Unexpected character {ch!r} where a key was expected")
+            return
+
+        if state == "colon":
+            if ch != ":":
+                raise ValueError(f"Unexpected character {ch!r} where ':' was expected")
+            self._state = "value"
+            return
+
+        if state == "after":
+            if ch == ",":
+                self._state = "key" if isinstance(self._stack[-1].container, dict) else "value"
+            elif ch in "}]":
+                self._close(ch)
+            else:
+                raise ValueError(f"Unexpected character {ch!r} after a value")
+
+    def _child_path(self, frame: _Frame) -> JSONPath:
+        if isinstance(frame.container, dict):
+            return frame.path + (frame.key,)
+        return frame.path + (len(frame.container),)
+
+    def _open(self, ch: str, path: JSONPath) -> None:
+        container: Union[dict, list] = {} if ch == "{" else []
+        if self._stack:
+            self._insert(container)
+        else:
+            self._root = container
+        self._stack.append(_Frame(container, path))
+        self._state = "key" if ch == "{" else "value"
+
+    def _close(self, ch: str) -> None:
+        frame = self._stack[-1]
+        if (ch == "}") != isinstance(frame.container, dict):
+            raise ValueError(f"Mismatched closing {ch!r}")
+        self._stack.pop()
+        self._complete(frame.path, frame.container)
+
+    def _begin_string(self, is_key: bool, path: JSONPath) -> None:
+        self._chars = []
+        self._string_is_key = is_key
+        self._string_path = path
+        self._delta_start = 0
+        self._state = "string"
+
+    def _end_string(self) -> None:
+        text = "".join(self._chars)
+        if any("\ud800" <= c <= "\udfff" for c in text):
+            # Recombine surrogate pairs from \u escapes
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16")
+
+        if self._string_is_key:
+            self._stack[-1].key = text
+            self._state = "colon"
+            return
+
+        self._flush_text_delta()
+        self._insert(text)
+        self._complete(self._string_path, text)
+
+    def _end_literal(self) -> None:
+        token = "".join(self._chars)
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid literal: {token}")
+        frame = self._stack[-1]
+        path = self._child_path(frame)
+        self._insert(value)
+        self._complete(path, value)
+
+    def _insert(self, value: Any) -> None:
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict):
+            frame.container[frame.key] = value
+        else:
+            frame.container.append(value)
+
+    def _complete(self, path: JSONPath, value: Any) -> None:
+        self._events.append(JSONEvent("field", path, value))
+        if self._stack:
+            self._state = "after"
+        else:
+            self._state = "done"
+            self._events.append(JSONEvent("done", (), value))
+
+    def _flush_text_delta(self) -> None:
+        """Emit the characters added to the current string value since the last flush"""
+        if self._string_is_key or self._state not in ("string", "escape", "unicode"):
+            return
+        if len(self._chars) > self._delta_start:
+            delta = "".join(self._chars[self._delta_start:])
+            self._delta_start = len(self._chars)
+            self._events.append(JSONEvent("text_delta", self._string_path, delta))
+
+    @staticmethod
+    def _assign(root: Any, path: JSONPath, value: Any) -> None:
+        target = root
+        for part in path[:-1]:
+            target = target[part]
+        if isinstance(target, list):
+            target.append(value)
+        else:
+            target[path[-1]] = value
+
+
+def parse_json_response(response: str) -> Any:
+    """
+    Parse a complete LLM response as JSON, tolerating markdown fences, leading or
+    trailing text and raw newlines inside strings.
+
+    Raises:
+        ValueError: If the response does not contain a complete JSON document
+    """
+    parser = StreamingJSONParser()
+    parser.feed(response)
+    return parser.close()
+
+
+__all__ = ['StreamingJSONParser', 'JSONEvent', 'parse_json_response']
@@ -0,0 +1,154 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from pydantic import BaseModel
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+
+DEFAULT_MAX_REPAIRS = 1  # Repair attempts after the first invalid output
+
+REPAIR_SYSTEM_PROMPT = (
+    "Your previous output did not match the required schema. "
+    "Return the same content, corrected so it satisfies the schema, using the provided tool."
+)
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a model does not produce output matching the requested schema"""
+
+    def __init__(self, message: str, raw_output: Optional[str] = None):
+        super().__init__(message)
+        self.raw_output = raw_output
+
+
+def build_repair_prompt(raw_output: Optional[str], error: str) -> str:
+    """
+    Build the repair turn for an invalid structured output.
+
+    Only the faulty output and the validation error are sent; the original prompt
+    and its context are not repeated.
+    """
+    return f"Previous output:\n{raw_output or '(no output)'}\n\nValidation error:\n{error}"
+
+
+def _record_usage(name: str, raw: Any, attempt: str) -> None:
+    usage = getattr(raw, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        metrics.observe("structured_output_prompt_tokens", usage["input_tokens"], call_site=name, attempt=attempt)
+
+
+def _raw_arguments(raw: Any) -> Optional[str]:
+    """Return the tool call arguments (or plain content) of a raw model message"""
+    tool_calls = getattr(raw, "tool_calls", None)
+    if tool_calls:
+        return json.dumps(tool_calls[0].get("args", {}))
+    content = getattr(raw, "content", None)
+    return content if isinstance(content, str) else None
+
+
+def _structured_model(llm: BaseChatModel, schema: Type[T]):
+    # Native tool calling: the schema travels as the tool definition instead of prompt text
+    return llm.with_structured_output(schema, method="function_calling", include_raw=True)
+
+
+def check_attempt(name: str, attempt: int, error: Optional[str]) -> bool:
+    """
+    Record the outcome of one structured output attempt.
+
+    Shared by every structured call so that parse failures and repairs are
+    counted the same way whichever client made the call.
+
+    Args:
+        name: Call site name used for metrics and logs
+        attempt: 0 for the first attempt, then the number of the repair
+        error: The validation error of the output, or None if it is valid
+
+    Returns:
+        True if the output is valid, False if it needs a repair
+    """
+    if attempt:
+        metrics.increment("structured_output_repairs", call_site=name, outcome="ok" if error is None else "failed")
+    if error is None:
+        return True
+    metrics.increment("structured_output_parse_failures", call_site=name)
+    logger.warning(f"Invalid structured output for {name}: {error}")
+    return False
+
+
+def _result_error(name: str, result: Dict[str, Any], attempt: int) -> Optional[str]:
+    """Return the error of a with_structured_output result, if any"""
+    _record_usage(name, result.get("raw"), "repair" if attempt else "initial")
+    if result.get("parsed") is not None and result.get("parsing_error") is None:
+        return None
+    error = result.get("parsing_error")
+    return str(error) if error else "Model did not call the output tool"
+
+
+def _repair_messages(result: Dict[str, Any], error: str) -> List[BaseMessage]:
+    return [
+        SystemMessage(content=REPAIR_SYSTEM_PROMPT),
+        HumanMessage(content=build_repair_prompt(_raw_arguments(result.get("raw")), error))
+    ]
+
+
+def invoke_structured(llm: BaseChatModel,
+                      messages: List[BaseMessage],
+                      schema: Type[T],
+                      name: str,
+                      max_repairs: int = DEFAULT_MAX_REPAIRS) -> T:
+    """
+    Invoke a LangChain chat model and return its output as an instance of schema.
+
+    Args:
+        llm: The chat model
+        messages: The prompt messages (without format instructions)
+        schema: Pydantic model describing the output
+        name: Call site name used for metrics and logs
+        max_repairs: Number of error-only repair attempts after an invalid output
+
+    Raises:
+        StructuredOutputError: If no valid output was produced
+    """
+    metrics.increment("structured_output_calls", call_site=name)
+    structured = _structured_model(llm, schema)
+    for attempt in range(max_repairs + 1):
+        result = structured.invoke(messages)
+        error = _result_error(name, result, attempt)
+        if check_attempt(name, attempt, error):
+            return result["parsed"]
+        messages = _repair_messages(result, error)
+    raise StructuredOutputError(f"Invalid {name} output: {error}", _raw_arguments(result.get("raw")))
+
+
+async def ainvoke_structured(llm: BaseChatModel,
+                             messages: List[BaseMessage],
+                             schema: Type[T],
+                             name: str,
+                             max_repairs: int = DEFAULT_MAX_REPAIRS) -> T:
+    """Async version of invoke_structured"""
+    metrics.increment("structured_output_calls", call_site=name)
+    structured = _structured_model(llm, schema)
+    for attempt in range(max_repairs + 1):
+        result = await structured.ainvoke(messages)
+        error = _result_error(name, result, attempt)
+        if check_attempt(name, attempt, error):
+            return result["parsed"]
+        messages = _repair_messages(result, error)
+    raise StructuredOutputError(f"Invalid {name} output: {error}", _raw_arguments(result.get("raw")))
+
+
+__all__ = [
+    'invoke_structured',
+    'ainvoke_structured',
+    'build_repair_prompt',
+    'check_attempt',
+    'StructuredOutputError',
+    'REPAIR_SYSTEM_PROMPT'
+]
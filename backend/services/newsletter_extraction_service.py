@@ -3,6 +3,9 @@ import logging
 from langchain_openai import ChatOpenAI
 import os
 from agents.prompts.newsletter_extraction import NewsletterExtractionPrompt, NewsletterExtractionResponse
+from services.llm.structured_output import ainvoke_structured
+from services.llm.scheduler import rate_limiter_for
+from services.llm.prompt_budget import PromptBudget, PromptSection, KEEP_WHOLE
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +13,8 @@ class NewsletterExtractionService:
     def __init__(self):
         self.llm = ChatOpenAI(
             model="gpt-4o",
-            api_key=os.getenv("OPENAI_API_KEY")
+            api_key=os.getenv("OPENAI_API_KEY"),
+            rate_limiter=rate_limiter_for("gpt-4o")
         )
         self.prompt = NewsletterExtractionPrompt()
         
@@ -35,17 +39,28 @@ class NewsletterExtractionService:
 
             prompt = NewsletterExtractionPrompt()
 
+            # Truncate articles too long for the model's context window
+            budgeted = PromptBudget(self.llm.model_name).fit([
+                PromptSection(
+                    "instructions",
+                    prompt.system_message + prompt.user_message_template + source + date,
+                    priority=1,
+                    min_tokens=KEEP_WHOLE
+                ),
+                PromptSection("content", content, priority=0)
+            ], call_site="newsletter_extraction")
+
             # Create and format the prompt
-            formatted_prompt = prompt.get_formatted_prompt(
-                content=content,
+            prompt_messages = prompt.get_formatted_messages(
+                content=budgeted["content"],
                 source=source,
                 date=date
             )
             
-            # Get extraction from LLM
-            response = await self.llm.ainvoke(formatted_prompt)
-
-            extraction = prompt.parse_response(response.content)
+            # Get extraction from LLM through native tool calling
+            extraction = await ainvoke_structured(
+                self.llm, prompt_messages, NewsletterExtractionResponse, "newsletter_extraction"
+            )
 
             return extraction.dict()
                 
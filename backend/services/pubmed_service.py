@@ -1,175 +1,437 @@
 import aiohttp
+import asyncio
 import logging
-from typing import List, Dict, Any
-from datetime import datetime
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Any, AsyncIterator, Deque, Optional, Sequence, Tuple
 from xml.etree import ElementTree
+from config.settings import settings
+from utils.metrics import metrics
+from utils.persistent_cache import PersistentCache
+from utils.rate_limit import TokenBucket
+from utils.singleflight import SingleFlight, make_flight_key
 
 logger = logging.getLogger(__name__)
 
-class PubMedService:
-    """Service for interacting with the PubMed API"""
-    
+READ_CHUNK_BYTES = 64 * 1024  # Response bytes fed to the XML parser at a time
+ESEARCH_MAX_IDS = 10000  # PubMed esearch returns at most this many IDs per query
+MEDLINE_STATUSES = ("MEDLINE", "PubMed-not-MEDLINE", "OLDMEDLINE")  # Citations no longer being indexed
+
+
+class PubMedXMLParser:
+    """
+    Incremental parser for efetch PubmedArticleSet XML.
+
+    Response bytes are fed as they arrive; each article is converted to a dict
+    when its closing tag is parsed and its element is then removed from the
+    tree, so memory stays bounded however many articles the response holds.
+    """
+
     def __init__(self):
+        self._parser = ElementTree.XMLPullParser(events=("start", "end"))
+        self._root: Optional[ElementTree.Element] = None
+        self._depth = 0
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """Parse more of the response; returns the articles completed by it"""
+        self._parser.feed(data)
+        return self._read_events()
+
+    def close(self) -> List[Dict[str, Any]]:
+        self._parser.close()
+        return self._read_events()
+
+    def _read_events(self) -> List[Dict[str, Any]]:
+        articles = []
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+                self._depth += 1
+                continue
+            self._depth -= 1
+            # Only direct children of the root (one per article) are handled and freed
+            if self._depth != 1:
+                continue
+            if elem.tag == "PubmedArticle":
+                article = self._parse_article(elem)
+                if article is not None:
+                    articles.append(article)
+            self._root.remove(elem)
+        return articles
+
+    def _parse_article(self, article: ElementTree.Element) -> Optional[Dict[str, Any]]:
+        try:
+            # Get basic citation info
+            citation = article.find("MedlineCitation")
+            if citation is None:
+                logger.warning("Missing MedlineCitation element in article")
+                return None
+
+            # Get article info
+            article_elem = citation.find("Article")
+            if article_elem is None:
+                logger.warning("Missing Article element in citation")
+                return None
+
+            # Extract data
+            pmid = citation.findtext("PMID")
+            title = _element_text(article_elem.find("ArticleTitle"))
+            abstract_sections = self._parse_abstract(article_elem.find("Abstract"))
+            abstract = "\n\n".join(
+                f"{section['label']}: {section['text']}" if section["label"] else section["text"]
+                for section in abstract_sections
+            )
+            journal = article_elem.findtext("Journal/Title")
+            pub_date = article_elem.find("Journal/JournalIssue/PubDate")
+            revised_date = citation.find("DateRevised")
+
+            # Build article data
+            article_data = {
+                "id": pmid,
+                "title": title or "No title available",
+                "abstract": abstract or "No abstract available",
+                "abstract_sections": abstract_sections,
+                "journal": journal or "Unknown journal",
+                "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/" if pmid else None,
+                "publication_date": self._parse_pub_date(pub_date) if pub_date is not None else None,
+                "revised_date": self._parse_pub_date(revised_date) if revised_date is not None else None,
+                "mesh_terms": [
+                    _element_text(descriptor)
+                    for descriptor in citation.findall("MeshHeadingList/MeshHeading/DescriptorName")
+                ],
+                "citation_status": citation.get("Status")
+            }
+
+            logger.debug("Parsed article ID %s: %s", article_data["id"], article_data["title"])
+            return article_data
+
+        except Exception as e:
+            logger.error("Error parsing article: %s", str(e), exc_info=True)
+            return None
+
+    def _parse_abstract(self, abstract_elem: Optional[ElementTree.Element]) -> List[Dict[str, Optional[str]]]:
+        """Sections of the abstract as {"label", "text"} (label is None for unstructured abstracts)"""
+        if abstract_elem is None:
+            return []
+        sections = []
+        for section in abstract_elem.findall("AbstractText"):
+            text = _element_text(section)
+            if text:
+                sections.append({"label": section.get("Label"), "text": text})
+        return sections
+
+    def _parse_pub_date(self, pub_date_elem: ElementTree.Element) -> Optional[str]:
+        """Parse publication date from PubMed XML"""
+        try:
+            year = pub_date_elem.findtext("Year")
+            month = pub_date_elem.findtext("Month")
+            day = pub_date_elem.findtext("Day")
+            if year is None:
+                # Free-form dates such as "1998 Dec-1999 Jan"
+                return pub_date_elem.findtext("MedlineDate")
+
+            date_parts = [year]
+            if month is not None:
+                date_parts.append(month.zfill(2))
+            if day is not None:
+                date_parts.append(day.zfill(2))
+
+            return "-".join(date_parts)
+
+        except Exception as e:
+            logger.error("Error parsing publication date: %s", str(e))
+            return None
+
+
+def _element_text(elem: Optional[ElementTree.Element]) -> str:
+    """Text of an element including inline markup such as <i> and <sup>"""
+    if elem is None:
+        return ""
+    return " ".join("".join(elem.itertext()).split())
+
+
+def _retry_after(value: Optional[str], default: float) -> float:
+    """Seconds to wait from a Retry-After header (delay seconds or HTTP date), or default if it is missing or unreadable"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class PubMedArticleStore:
+    """
+    Parsed PubMed articles by PMID, in a local SQLite cache.
+
+    Articles already indexed for MEDLINE rarely change and are reused for
+    PUBMED_ARTICLE_TTL_SECONDS; articles still in process gain MeSH terms and
+    corrections, so they are refetched after PUBMED_UNINDEXED_ARTICLE_TTL_SECONDS.
+    """
+
+    def __init__(self, cache: PersistentCache):
+        self.cache = cache
+
+    def get_many(self, pmids: Sequence[str], allow_stale: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Return the fresh (or, with allow_stale, any) cached articles among pmids"""
+        return self._usable(self.cache.get_many_entries(list(pmids)), allow_stale)
+
+    def set_many(self, articles: Sequence[Dict[str, Any]]) -> None:
+        self.cache.set_many(self._items(articles))
+
+    # SQLite access blocks, so the async API runs it in worker threads
+
+    async def aget_many(self, pmids: Sequence[str], allow_stale: bool = False) -> Dict[str, Dict[str, Any]]:
+        return self._usable(await self.cache.aget_many_entries(list(pmids)), allow_stale)
+
+    async def aset_many(self, articles: Sequence[Dict[str, Any]]) -> None:
+        await self.cache.aset_many(self._items(articles))
+
+    def _usable(self, entries: Dict[str, Tuple[Dict[str, Any], float]], allow_stale: bool) -> Dict[str, Dict[str, Any]]:
+        return {
+            pmid: article for pmid, (article, age) in entries.items()
+            if allow_stale or age <= self._ttl(article)
+        }
+
+    @staticmethod
+    def _items(articles: Sequence[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(article["id"], article) for article in articles if article.get("id")]
+
+    @staticmethod
+    def _ttl(article: Dict[str, Any]) -> int:
+        if article.get("citation_status") in MEDLINE_STATUSES:
+            return settings.PUBMED_ARTICLE_TTL_SECONDS
+        return settings.PUBMED_UNINDEXED_ARTICLE_TTL_SECONDS
+
+
+class PubMedService:
+    """
+    Service for interacting with the PubMed API.
+
+    A search runs esearch with usehistory=y for the IDs of the matching
+    articles, then resolves them in chunks of PUBMED_FETCH_CHUNK_SIZE, up to
+    PUBMED_MAX_CONCURRENT_FETCHES chunks at a time: cached articles are taken
+    from the article store and only the others are fetched with efetch (from
+    the history server when none of a chunk is cached). Responses are parsed
+    as they stream in (see PubMedXMLParser).
+
+    Every E-utilities request of the process goes through one token bucket,
+    paced to NCBI's limit of 3 requests per second (10 with an API key).
+    """
+
+    def __init__(self, article_store: Optional[PubMedArticleStore] = None):
         self.base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
         self.db = "pubmed"
-        # Optional: Add your API key here if you have one
-        self.api_key = None
+        self.api_key = settings.NCBI_API_KEY or None
+        self.chunk_size = settings.PUBMED_FETCH_CHUNK_SIZE
+        self.max_concurrent_fetches = settings.PUBMED_MAX_CONCURRENT_FETCHES
+        self.article_store = article_store
+        rate = settings.PUBMED_REQUESTS_PER_SECOND_WITH_KEY if self.api_key else settings.PUBMED_REQUESTS_PER_SECOND
+        self._limiter = TokenBucket(rate=rate, capacity=rate)
+        # Concurrent identical searches share one set of E-utilities requests
+        self._inflight = SingleFlight("pubmed_search")
         logger.info("PubMedService initialized with base URL: %s", self.base_url)
-    
+
     async def search(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
         """
         Search PubMed for articles matching the query
-        
+
         Args:
             query: The search query
             max_results: Maximum number of results to return (default: 10)
-            
+
         Returns:
-            List of article data dictionaries
+            List of article data dictionaries, most relevant first
         """
+        key = make_flight_key(query, max_results)
+        return await self._inflight.do(key, lambda: self._search(query, max_results))
+
+    async def _search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """Collect the articles of iter_search (see search)"""
         logger.info("Starting PubMed search with query: '%s', max_results: %d", query, max_results)
         try:
-            # First get the article IDs
-            logger.debug("Fetching article IDs for query")
-            ids = await self._search_for_ids(query, max_results)
-            if not ids:
-                logger.info("No results found for query: '%s'", query)
-                return []
-            
-            logger.info("Found %d article IDs for query '%s'", len(ids), query)
-            logger.debug("Article IDs: %s", ids)
-                
-            # Then fetch the details for those IDs
-            logger.debug("Fetching article details")
-            articles = await self._fetch_article_details(ids)
+            articles = [article async for article in self.iter_search(query, max_results)]
             logger.info("Successfully retrieved %d article details", len(articles))
             return articles
-            
+
         except Exception as e:
             logger.error("Error during PubMed search: %s", str(e), exc_info=True)
             raise
-    
-    async def _search_for_ids(self, query: str, max_results: int) -> List[str]:
-        """Search for article IDs matching the query"""
+
+    async def iter_search(self, query: str, max_results: int = 10) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield the articles matching the query, most relevant first.
+
+        Suited to large sweeps (thousands of articles): at most
+        max_concurrent_fetches chunks of articles are held at a time.
+        """
+        async with aiohttp.ClientSession() as session:
+            history = await self._search_history(session, query, max_results)
+            ids = history["ids"][:max_results]
+            if not ids:
+                logger.info("No results found for query: '%s'", query)
+                return
+            logger.info("Found %d articles for query '%s', resolving %d", history["count"], query, len(ids))
+
+            starts = iter(range(0, len(ids), self.chunk_size))
+            pending: Deque[asyncio.Task] = deque()
+
+            def schedule_next() -> None:
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(asyncio.create_task(
+                        self._resolve_chunk(session, history, start, ids[start:start + self.chunk_size])
+                    ))
+
+            try:
+                for _ in range(self.max_concurrent_fetches):
+                    schedule_next()
+                # Chunks are yielded in order; the next chunk starts as soon as one is done
+                while pending:
+                    articles = await pending.popleft()
+                    schedule_next()
+                    for article in articles:
+                        yield article
+            finally:
+                for task in pending:
+                    task.cancel()
+
+    async def _resolve_chunk(self,
+                             session: aiohttp.ClientSession,
+                             history: Dict[str, Any],
+                             start: int,
+                             ids: List[str]) -> List[Dict[str, Any]]:
+        """Articles for a chunk of the search's IDs, in ID order; only cache misses are fetched"""
+        cached = await self.article_store.aget_many(ids) if self.article_store else {}
+        misses = [pmid for pmid in ids if pmid not in cached]
+        metrics.increment("pubmed_article_cache_hits", len(ids) - len(misses))
+        metrics.increment("pubmed_article_cache_misses", len(misses))
+
+        fetched: Dict[str, Dict[str, Any]] = {}
+        if misses:
+            try:
+                if len(misses) == len(ids) and history.get("webenv"):
+                    articles = await self._fetch_chunk(session, {
+                        "WebEnv": history["webenv"],
+                        "query_key": history["query_key"],
+                        "retstart": str(start),
+                        "retmax": str(len(ids))
+                    })
+                else:
+                    articles = await self._fetch_chunk(session, {"id": ",".join(misses)})
+            except Exception:
+                # Expired articles are better than none when PubMed is unavailable
+                stale = await self.article_store.aget_many(misses, allow_stale=True) if self.article_store else {}
+                if not stale:
+                    raise
+                logger.warning("PubMed fetch failed, using %d expired cached articles", len(stale))
+                articles = list(stale.values())
+            else:
+                if self.article_store:
+                    await self.article_store.aset_many(articles)
+            fetched = {article["id"]: article for article in articles}
+
+        return [cached.get(pmid) or fetched[pmid] for pmid in ids if pmid in cached or pmid in fetched]
+
+    async def _search_history(self, session: aiohttp.ClientSession, query: str, max_results: int) -> Dict[str, Any]:
+        """Run esearch for up to max_results IDs, also storing them on the history server"""
         params = {
             "db": self.db,
             "term": query,
-            "retmax": str(max_results),
+            "retmax": str(min(max_results, ESEARCH_MAX_IDS)),
             "retmode": "json",
-            "sort": "relevance"
+            "sort": "relevance",
+            "usehistory": "y"
         }
-        if self.api_key:
-            params["api_key"] = self.api_key
-            
+
         logger.debug("Making PubMed esearch API call with params: %s", params)
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{self.base_url}/esearch.fcgi", params=params) as response:
-                if response.status != 200:
-                    error_msg = f"PubMed API error: {response.status}"
-                    logger.error(error_msg)
-                    raise Exception(error_msg)
-                    
-                data = await response.json()
-                logger.debug("Received esearch response: %s", data)
-                ids = data.get("esearchresult", {}).get("idlist", [])
-                logger.info("Retrieved %d article IDs from esearch", len(ids))
-                return ids
-    
-    async def _fetch_article_details(self, ids: List[str]) -> List[Dict[str, Any]]:
-        """Fetch detailed information for a list of article IDs"""
-        params = {
-            "db": self.db,
-            "id": ",".join(ids),
-            "retmode": "xml"
-        }
+        async with self._request(session, "esearch", params) as response:
+            data = await response.json()
+            result = data.get("esearchresult", {})
+            logger.debug("Received esearch response with %s IDs", len(result.get("idlist", [])))
+            return {
+                "count": int(result.get("count", 0)),
+                "ids": result.get("idlist", []),
+                "webenv": result.get("webenv"),
+                "query_key": result.get("querykey")
+            }
+
+    async def _fetch_chunk(self, session: aiohttp.ClientSession, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Fetch and parse articles by ID or from the history server"""
+        params = {"db": self.db, "retmode": "xml", **params}
+
+        logger.debug("Making PubMed efetch API call for %s", params.get("retstart", "IDs"))
+        # IDs go in the body so long ID lists do not exceed URL limits
+        async with self._request(session, "efetch", params, post="id" in params) as response:
+            parser = PubMedXMLParser()
+            articles = []
+            async for data in response.content.iter_chunked(READ_CHUNK_BYTES):
+                articles.extend(parser.feed(data))
+            articles.extend(parser.close())
+
+        metrics.increment("pubmed_articles_fetched", len(articles))
+        logger.debug("Parsed %d articles from efetch", len(articles))
+        return articles
+
+    @asynccontextmanager
+    async def _request(self,
+                       session: aiohttp.ClientSession,
+                       endpoint: str,
+                       params: Dict[str, str],
+                       post: bool = False) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        Send an E-utilities request at the shared rate limit, retrying rate
+        limited (429) and failed (5xx) requests
+        """
         if self.api_key:
-            params["api_key"] = self.api_key
-            
-        logger.debug("Making PubMed efetch API call with params: %s", params)
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{self.base_url}/efetch.fcgi", params=params) as response:
+            params = {**params, "api_key": self.api_key}
+        url = f"{self.base_url}/{endpoint}.fcgi"
+
+        for attempt in range(settings.PUBMED_MAX_RETRIES + 1):
+            await self._wait_for_rate_limit()
+            metrics.increment("pubmed_requests", endpoint=endpoint)
+            request = session.post(url, data=params) if post else session.get(url, params=params)
+            async with request as response:
+                retryable = response.status == 429 or response.status >= 500
+                if retryable and attempt < settings.PUBMED_MAX_RETRIES:
+                    metrics.increment("pubmed_requests_retried", endpoint=endpoint, status=response.status)
+                    delay = _retry_after(response.headers.get("Retry-After"), 2 ** attempt)
+                    logger.warning("PubMed %s returned %d, retrying in %.1fs", endpoint, response.status, delay)
+                    await asyncio.sleep(delay)
+                    continue
                 if response.status != 200:
                     error_msg = f"PubMed API error: {response.status}"
                     logger.error(error_msg)
                     raise Exception(error_msg)
-                    
-                xml_data = await response.text()
-                logger.debug("Received XML response of length: %d", len(xml_data))
-                articles = self._parse_pubmed_xml(xml_data)
-                logger.info("Successfully parsed %d articles from XML", len(articles))
-                return articles
-    
-    def _parse_pubmed_xml(self, xml_data: str) -> List[Dict[str, Any]]:
-        """Parse PubMed XML response into article data"""
-        logger.debug("Starting XML parsing")
-        root = ElementTree.fromstring(xml_data)
-        articles = []
-        
-        for article in root.findall(".//PubmedArticle"):
-            try:
-                # Get basic citation info
-                citation = article.find(".//MedlineCitation")
-                if citation is None:
-                    logger.warning("Missing MedlineCitation element in article")
-                    continue
-                    
-                # Get article info
-                article_elem = citation.find("Article")
-                if article_elem is None:
-                    logger.warning("Missing Article element in citation")
-                    continue
-                    
-                # Extract data
-                pmid = citation.find("PMID")
-                title = article_elem.find("ArticleTitle")
-                abstract = article_elem.find(".//Abstract/AbstractText")
-                journal = article_elem.find("Journal/Title")
-                pub_date = article_elem.find(".//PubDate")
-                
-                # Build article data
-                article_data = {
-                    "id": pmid.text if pmid is not None else None,
-                    "title": title.text if title is not None else "No title available",
-                    "abstract": abstract.text if abstract is not None else "No abstract available",
-                    "journal": journal.text if journal is not None else "Unknown journal",
-                    "url": f"https://pubmed.ncbi.nlm.nih.gov/{pmid.text}/" if pmid is not None else None,
-                    "publication_date": self._parse_pub_date(pub_date) if pub_date is not None else None
-                }
-                
-                logger.debug("Parsed article ID %s: %s", article_data["id"], article_data["title"])
-                articles.append(article_data)
-                
-            except Exception as e:
-                logger.error("Error parsing article: %s", str(e), exc_info=True)
-                continue
-                
-        logger.info("Completed parsing %d articles from XML", len(articles))
-        return articles
-    
-    def _parse_pub_date(self, pub_date_elem: ElementTree.Element) -> str:
-        """Parse publication date from PubMed XML"""
-        try:
-            year = pub_date_elem.find("Year")
-            month = pub_date_elem.find("Month")
-            day = pub_date_elem.find("Day")
-            
-            date_parts = []
-            if year is not None:
-                date_parts.append(year.text)
-            if month is not None:
-                date_parts.append(month.text.zfill(2))
-            if day is not None:
-                date_parts.append(day.text.zfill(2))
-                
-            date_str = "-".join(date_parts)
-            logger.debug("Parsed publication date: %s", date_str)
-            return date_str
-            
-        except Exception as e:
-            logger.error("Error parsing publication date: %s", str(e))
-            return None
+                yield response
+                return
+
+    async def _wait_for_rate_limit(self) -> None:
+        while True:
+            wait = self._limiter.try_acquire()
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
 
 # Create a singleton instance
-pubmed_service = PubMedService()
+pubmed_service = PubMedService(
+    article_store=PubMedArticleStore(PersistentCache(
+        path=os.path.join(settings.CACHE_DIR, "pubmed_articles.sqlite3"),
+        table="pubmed_articles",
+        ttl_seconds=settings.PUBMED_ARTICLE_TTL_SECONDS,
+        max_entries=settings.PUBMED_ARTICLE_CACHE_MAX_ENTRIES
+    )) if settings.PUBMED_ARTICLE_CACHE_ENABLED else None
+)
 
-__all__ = ['pubmed_service'] 
\ No newline at end of file
+__all__ = ['pubmed_service', 'PubMedService', 'PubMedArticleStore', 'PubMedXMLParser']
@@ -0,0 +1,228 @@
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sqlalchemy.orm import Session
+
+from config.settings import settings
+from database import SessionLocal
+from models import ResearchMemory as ResearchMemoryRow
+from utils.metrics import metrics
+from .llm.embeddings import default_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RecalledResearch:
+    """A past research session similar to a new question"""
+    memory_id: int
+    question: str
+    similarity: float
+    created_at: datetime
+    answer: Optional[str] = None
+    checklist: List[Dict[str, Any]] = field(default_factory=list)
+    nuggets: List[Dict[str, Any]] = field(default_factory=list)
+    queries: List[str] = field(default_factory=list)
+    search_results: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def age_seconds(self) -> float:
+        return (datetime.utcnow() - self.created_at).total_seconds()
+
+
+class ResearchMemory:
+    """
+    Research sessions shared across users and threads, indexed by the
+    embedding of their (improved) question.
+
+    A new question recalls the sessions most similar to it. A past answer is
+    only reused when its question is nearly identical (answer_similarity) and
+    the answer is younger than the answer TTL; less similar sessions
+    (seed_similarity) contribute their vetted knowledge nuggets and the
+    queries that found new knowledge, to seed the new session.
+
+    Sessions are stored in the database; the in-memory index loads rows added
+    by other workers on the next recall.
+    """
+
+    def __init__(self,
+                 session_factory: Callable[[], Session] = SessionLocal,
+                 embeddings: Optional[Embeddings] = None):
+        self.session_factory = session_factory
+        self._embeddings = embeddings
+        self._index: Optional[faiss.IndexIDMap2] = None
+        self._last_loaded_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RESEARCH_MEMORY_ENABLED
+
+    @property
+    def embeddings(self) -> Embeddings:
+        if self._embeddings is None:
+            self._embeddings = default_embeddings()
+        return self._embeddings
+
+    def recall(self, question: str, k: int = 5, min_similarity: float = 0.0) -> List[RecalledResearch]:
+        """Return up to k past sessions at least min_similarity (cosine) similar to question, best first"""
+        self._load_new_rows()
+        if self._index is None or self._index.ntotal == 0:
+            return []
+
+        scores, memory_ids = self._index.search(self._embed([question]), min(k, self._index.ntotal))
+        similarity = {
+            int(memory_id): float(score)
+            for score, memory_id in zip(scores[0], memory_ids[0])
+            if memory_id != -1 and score >= min_similarity
+        }
+        if not similarity:
+            return []
+
+        with self.session_factory() as db:
+            rows = db.query(ResearchMemoryRow).filter(ResearchMemoryRow.memory_id.in_(list(similarity))).all()
+            recalled = [self._to_recalled(row, similarity[row.memory_id]) for row in rows]
+        return sorted(recalled, key=lambda item: item.similarity, reverse=True)
+
+    def reusable_answer(self, question: str) -> Optional[RecalledResearch]:
+        """The most similar past session whose answer can stand in for a new run, if any"""
+        max_age = settings.RESEARCH_MEMORY_ANSWER_TTL_SECONDS
+        for recalled in self.recall(question, min_similarity=settings.RESEARCH_MEMORY_ANSWER_SIMILARITY):
+            if recalled.answer and recalled.age_seconds <= max_age:
+                metrics.increment("research_memory_answers_reused")
+                return recalled
+        return None
+
+    def seed(self, question: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Knowledge to start a new session on question with.
+
+        Returns:
+            Vetted nuggets and previously productive queries of similar past
+            sessions, most similar session first, without repeats
+        """
+        nuggets: List[Dict[str, Any]] = []
+        queries: List[str] = []
+        seen_nuggets = set()
+        for recalled in self.recall(question,
+                                    k=settings.RESEARCH_MEMORY_SEED_SESSIONS,
+                                    min_similarity=settings.RESEARCH_MEMORY_SEED_SIMILARITY):
+            for nugget in recalled.nuggets:
+                if nugget.get("content") and nugget["content"] not in seen_nuggets:
+                    seen_nuggets.add(nugget["content"])
+                    nuggets.append(nugget)
+            for query in recalled.queries:
+                if query not in queries:
+                    queries.append(query)
+        if nuggets or queries:
+            metrics.increment("research_memory_seeded")
+        return nuggets[:settings.KB_MAX_PROMPT_NUGGETS], queries[:settings.RESEARCH_MEMORY_SEED_QUERIES]
+
+    def remember(self,
+                 question: str,
+                 answer: Optional[str],
+                 checklist: Sequence[Dict[str, Any]],
+                 nuggets: Sequence[Dict[str, Any]],
+                 queries: Sequence[str],
+                 search_results: Sequence[Dict[str, Any]] = ()) -> Optional[int]:
+        """
+        Store a finished session.
+
+        Only nuggets with at least RESEARCH_MEMORY_MIN_CONFIDENCE and no
+        unresolved conflicts are kept. Pass answer=None for answers that did
+        not meet the checklist, so they are never reused.
+
+        Returns:
+            The new memory ID, or None if there was nothing worth keeping
+        """
+        vetted = [
+            {"content": nugget["content"], "source_url": nugget.get("source_url", ""),
+             "confidence": nugget.get("confidence", 0.0)}
+            for nugget in nuggets
+            if nugget.get("confidence", 0.0) >= settings.RESEARCH_MEMORY_MIN_CONFIDENCE
+            and not nugget.get("conflicts_with")
+        ]
+        if not answer and not vetted and not queries:
+            return None
+
+        vector = self._embed([question])
+        with self.session_factory() as db:
+            row = ResearchMemoryRow(
+                question=question,
+                question_embedding=vector[0].tobytes(),
+                embedding_model=settings.EMBEDDING_MODEL,
+                answer=answer,
+                checklist=list(checklist),
+                nuggets=vetted,
+                queries=list(queries),
+                search_results=list(search_results)
+            )
+            db.add(row)
+            db.commit()
+            memory_id = row.memory_id
+            self._prune(db)
+
+        metrics.increment("research_memories_saved")
+        logger.info(f"Saved research memory {memory_id} ({len(vetted)} nuggets, {len(queries)} queries)")
+        return memory_id
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _load_new_rows(self) -> None:
+        """Add rows saved since the last load (by any worker) to the index"""
+        with self._lock:
+            with self.session_factory() as db:
+                rows = db.query(ResearchMemoryRow.memory_id, ResearchMemoryRow.question_embedding).filter(
+                    ResearchMemoryRow.memory_id > self._last_loaded_id,
+                    # Vectors of another embedding model are not comparable
+                    ResearchMemoryRow.embedding_model == settings.EMBEDDING_MODEL
+                ).order_by(ResearchMemoryRow.memory_id).all()
+            if not rows:
+                return
+            vectors = np.stack([np.frombuffer(row.question_embedding, dtype=np.float32) for row in rows])
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+            self._index.add_with_ids(vectors, np.array([row.memory_id for row in rows], dtype=np.int64))
+            self._last_loaded_id = rows[-1].memory_id
+
+    def _prune(self, db: Session) -> None:
+        """Delete the oldest sessions above RESEARCH_MEMORY_MAX_ENTRIES"""
+        cutoff = db.query(ResearchMemoryRow.memory_id).order_by(ResearchMemoryRow.memory_id.desc()) \
+            .offset(settings.RESEARCH_MEMORY_MAX_ENTRIES).first()
+        if cutoff is None:
+            return
+        db.query(ResearchMemoryRow).filter(ResearchMemoryRow.memory_id <= cutoff.memory_id) \
+            .delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            if self._index is not None:
+                self._index.remove_ids(faiss.IDSelectorRange(0, cutoff.memory_id + 1))
+
+    @staticmethod
+    def _to_recalled(row: ResearchMemoryRow, similarity: float) -> RecalledResearch:
+        return RecalledResearch(
+            memory_id=row.memory_id,
+            question=row.question,
+            similarity=similarity,
+            created_at=row.created_at,
+            answer=row.answer,
+            checklist=row.checklist or [],
+            nuggets=row.nuggets or [],
+            queries=row.queries or [],
+            search_results=row.search_results or []
+        )
+
+
+# Create a singleton instance
+research_memory = ResearchMemory()
+
+__all__ = ['research_memory', 'ResearchMemory', 'RecalledResearch']
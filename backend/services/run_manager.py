@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+import orjson
+from fastapi import Request
+
+from config.settings import settings
+from services.stream_encoder import encode_event
+from utils.metrics import metrics
+from utils.persistent_cache import PersistentCache
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+CHUNK = "chunk"
+ERROR = "error"
+END = "end"
+
+UNCLAIMED_RUN_SECONDS = 5.0  # How long a new run waits for its first client
+
+
+class RunEventsExpiredError(Exception):
+    """Raised when a reconnecting client asks for events that are no longer buffered"""
+
+
+@dataclass
+class GraphRun:
+    """A registered graph run and the replay buffer of the events it emitted"""
+    run_id: str
+    kind: str
+    thread_id: Optional[str] = None  # Checkpoint thread the run reads and writes (defaults to run_id)
+    created_at: float = field(default_factory=time.time)
+    status: str = "running"  # running, completed, failed or cancelled
+    cancel_reason: Optional[str] = None
+    # (event ID, kind, payload); IDs increase by one from 1
+    buffer: Deque[Tuple[int, str, Any]] = field(
+        default_factory=lambda: deque(maxlen=settings.RUN_REPLAY_BUFFER_EVENTS)
+    )
+    last_event_id: int = 0
+    subscribers: int = 0
+    task: Optional["asyncio.Task"] = None
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+    grace_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.status == "cancelled"
+
+    @property
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+
+class _Subscription:
+    def __init__(self):
+        self.disconnected = False
+
+
+class RunManager:
+    """
+    Registers streamed graph runs and owns their lifecycle.
+
+    Each run executes in its own task and appends its events, with increasing
+    IDs, to a bounded replay buffer. Clients stream from the buffer and can
+    reconnect from the last event ID they saw without re-running the graph.
+    When the last client goes away the run is cancelled after a grace period,
+    unless a client reconnects; runs can also be cancelled explicitly by ID.
+    Cancelling the task interrupts whichever LLM or HTTP call the graph is
+    awaiting. Finished runs are kept for a while so late reconnects can still
+    read the end of the stream.
+    """
+
+    def __init__(self, spill: Optional[PersistentCache] = None):
+        self._runs: Dict[str, GraphRun] = {}
+        self._spill = spill
+
+    def start(self,
+              kind: str,
+              stream_factory: Callable[[GraphRun], AsyncIterator[Any]],
+              run_id: Optional[str] = None,
+              thread_id: Optional[str] = None) -> GraphRun:
+        """
+        Register and start a run.
+
+        Args:
+            kind: Type of run (e.g. "bot" or "workflow"), used in logs and metrics
+            stream_factory: Returns the event stream for the run (e.g. graph.astream(...))
+            run_id: ID to register the run under (generated if not given)
+            thread_id: Checkpoint thread to run on, when resuming an earlier run
+
+        Returns:
+            The started run
+        """
+        run_id = run_id or str(uuid.uuid4())
+        run = GraphRun(run_id=run_id, kind=kind, thread_id=thread_id or run_id)
+        self._runs[run.run_id] = run
+        run.task = asyncio.create_task(self._produce(run, stream_factory))
+        # A run nobody starts streaming is abandoned like one whose clients went away
+        self._start_grace_timer(run, max(settings.RUN_DISCONNECT_GRACE_SECONDS, UNCLAIMED_RUN_SECONDS))
+
+        metrics.increment("graph_runs_started", kind=kind)
+        self._update_gauges()
+        logger.info(f"Started {kind} run {run.run_id}")
+        return run
+
+    async def events(self,
+                     run: GraphRun,
+                     request: Optional[Request] = None,
+                     after_id: int = 0) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        Yield (event ID, chunk) for the events of a run after after_id, until it ends.
+
+        When the client disconnects (or stops consuming) and no other client is
+        streaming the run, the run is cancelled after the disconnect grace period.
+
+        Raises:
+            RunEventsExpiredError: If events after after_id are no longer buffered
+            Exception: The error that made the run fail
+        """
+        subscription = _Subscription()
+        watcher = None
+        if request is not None:
+            watcher = asyncio.create_task(self._watch_disconnect(run, request, subscription))
+        self._attach(run)
+        try:
+            next_id = after_id + 1
+            while not subscription.disconnected:
+                if next_id > run.last_event_id:
+                    run.changed.clear()
+                    await run.changed.wait()
+                    continue
+                kind, payload = await self._get_event(run, next_id)
+                if kind == CHUNK:
+                    yield next_id, payload
+                elif kind == ERROR:
+                    raise payload if isinstance(payload, Exception) else RuntimeError(payload)
+                else:
+                    return
+                next_id += 1
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self._detach(run)
+
+    def get(self, run_id: str) -> Optional[GraphRun]:
+        """Return a running or recently finished run by ID"""
+        return self._runs.get(run_id)
+
+    def is_thread_active(self, thread_id: str) -> bool:
+        """Whether a run on this worker is currently using the given checkpoint thread"""
+        return any(run.thread_id == thread_id and not run.done for run in self._runs.values())
+
+    def is_cancelled(self, run_id: Optional[str]) -> bool:
+        """Whether the run with the given ID has been cancelled (for checks inside graph nodes)"""
+        run = self._runs.get(run_id) if run_id else None
+        return run is not None and run.cancelled
+
+    def cancel(self, run_id: str, reason: str = "cancelled") -> bool:
+        """
+        Cancel a run.
+
+        Returns:
+            True if the run was active and is now being cancelled
+        """
+        run = self._runs.get(run_id)
+        if run is None or run.done or run.cancelled:
+            return False
+        run.status = "cancelled"
+        run.cancel_reason = reason
+        run.task.cancel()
+        metrics.increment("graph_runs_cancelled", kind=run.kind, reason=reason)
+        logger.info(f"Cancelling {run.kind} run {run_id}: {reason}")
+        return True
+
+    def active_runs(self) -> Dict[str, Dict[str, Any]]:
+        """Return a summary of the registered runs"""
+        now = time.time()
+        return {
+            run_id: {
+                "kind": run.kind,
+                "status": run.status,
+                "age_seconds": now - run.created_at,
+                "last_event_id": run.last_event_id,
+                "subscribers": run.subscribers
+            }
+            for run_id, run in self._runs.items()
+        }
+
+    async def _produce(self, run: GraphRun, stream_factory: Callable[[GraphRun], AsyncIterator[Any]]) -> None:
+        try:
+            async for chunk in stream_factory(run):
+                await self._append(run, CHUNK, chunk)
+            run.status = "completed"
+            await self._append(run, END, None)
+        except asyncio.CancelledError:
+            run.status = "cancelled"
+            await self._append(run, END, None)
+            raise
+        except Exception as e:
+            logger.error(f"{run.kind} run {run.run_id} failed: {str(e)}")
+            run.status = "failed"
+            await self._append(run, ERROR, e)
+        finally:
+            self._cancel_grace_timer(run)
+            # Keep the finished run around for clients that reconnect late
+            asyncio.get_running_loop().call_later(
+                settings.RUN_RETENTION_SECONDS, self._runs.pop, run.run_id, None
+            )
+            metrics.increment("graph_runs_finished", kind=run.kind, status=run.status)
+            self._update_gauges()
+
+    async def _append(self, run: GraphRun, kind: str, payload: Any) -> None:
+        if len(run.buffer) == run.buffer.maxlen and self._spill is not None:
+            # The oldest event stays readable from the buffer until it is on disk
+            await self._spill_event(run, run.buffer[0])
+        run.last_event_id += 1
+        run.buffer.append((run.last_event_id, kind, payload))
+        run.changed.set()
+
+    async def _get_event(self, run: GraphRun, event_id: int) -> Tuple[str, Any]:
+        if run.buffer and event_id >= run.buffer[0][0]:
+            _, kind, payload = run.buffer[event_id - run.buffer[0][0]]
+            return kind, payload
+        if self._spill is not None:
+            spilled = await self._spill.aget(f"{run.run_id}:{event_id}")
+            if spilled is not None:
+                payload = spilled["payload"]
+                # Chunks are spilled as the JSON clients receive, so a replay encodes the same way
+                return spilled["kind"], orjson.loads(payload) if spilled["kind"] == CHUNK else payload
+        raise RunEventsExpiredError(f"Events after {event_id - 1} of run {run.run_id} are no longer available")
+
+    async def _spill_event(self, run: GraphRun, event: Tuple[int, str, Any]) -> None:
+        event_id, kind, payload = event
+        try:
+            if kind == CHUNK:
+                payload = encode_event(payload)
+            elif kind == ERROR:
+                payload = str(payload)
+        except TypeError as e:
+            logger.warning(f"Could not spill event {event_id} of run {run.run_id}: {str(e)}")
+            return
+        await self._spill.aset(f"{run.run_id}:{event_id}", {"kind": kind, "payload": payload})
+
+    def _attach(self, run: GraphRun) -> None:
+        run.subscribers += 1
+        self._cancel_grace_timer(run)
+
+    def _detach(self, run: GraphRun) -> None:
+        run.subscribers -= 1
+        if not run.subscribers and not run.done:
+            # Give the client a chance to reconnect before abandoning the run
+            self._start_grace_timer(run, settings.RUN_DISCONNECT_GRACE_SECONDS)
+
+    def _start_grace_timer(self, run: GraphRun, seconds: float) -> None:
+        self._cancel_grace_timer(run)
+        run.grace_timer = asyncio.get_running_loop().call_later(
+            seconds, self.cancel, run.run_id, "client_disconnected"
+        )
+
+    @staticmethod
+    def _cancel_grace_timer(run: GraphRun) -> None:
+        if run.grace_timer is not None:
+            run.grace_timer.cancel()
+            run.grace_timer = None
+
+    async def _watch_disconnect(self, run: GraphRun, request: Request, subscription: _Subscription) -> None:
+        while not run.done:
+            if await request.is_disconnected():
+                subscription.disconnected = True
+                run.changed.set()
+                return
+            await asyncio.sleep(settings.RUN_DISCONNECT_POLL_SECONDS)
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("graph_runs_active", sum(1 for run in self._runs.values() if not run.done))
+
+
+# Create a singleton instance
+run_manager = RunManager(
+    spill=PersistentCache(
+        path=os.path.join(settings.CACHE_DIR, "run_events.sqlite3"),
+        table="run_events",
+        ttl_seconds=settings.RUN_RETENTION_SECONDS,
+        max_entries=settings.RUN_REPLAY_SPILL_MAX_EVENTS
+    ) if settings.RUN_REPLAY_SPILL_ENABLED else None
+)
+
+__all__ = ['run_manager', 'RunManager', 'GraphRun', 'RunEventsExpiredError']
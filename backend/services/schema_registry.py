@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import SchemaError
+
+from exceptions import InvalidVariableError, VariableValidationError
+
+logger = logging.getLogger(__name__)
+
+MAX_COMPILED_SCHEMAS = 1024  # Least recently used validators are dropped above this size
+
+# JSON Schema keywords that mark a schema as already being in JSON Schema form
+JSON_SCHEMA_KEYWORDS = {"$schema", "properties", "items", "anyOf", "oneOf", "allOf", "enum", "const"}
+
+
+class SchemaRegistry:
+    """
+    Compiles workflow schemas (variable value_schema, prompt template output_schema
+    and tool signature schemas) into JSON Schema validators once, caching them by
+    schema hash so step inputs and outputs can be checked on every execution cheaply.
+    """
+
+    def __init__(self, max_entries: int = MAX_COMPILED_SCHEMAS):
+        self._validators: "OrderedDict[str, Draft7Validator]" = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = Lock()
+
+    def schema_hash(self, schema: Dict[str, Any]) -> str:
+        """Return a stable hash for a schema"""
+        canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def to_json_schema(self, schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Convert a workflow SchemaValue (type, is_array, fields, ...) into JSON Schema.
+
+        Schemas that already use JSON Schema keywords are passed through unchanged.
+        """
+        if not isinstance(schema, dict) or not schema:
+            return {}
+
+        if JSON_SCHEMA_KEYWORDS.intersection(schema.keys()):
+            return schema
+
+        # Older templates nest the object definition under a 'schema' key
+        if "fields" not in schema and isinstance(schema.get("schema"), dict):
+            return self.to_json_schema(schema["schema"])
+
+        schema_type = schema.get("type")
+        if schema_type == "string":
+            base = {"type": "string"}
+        elif schema_type == "number":
+            base = {"type": "number"}
+        elif schema_type == "boolean":
+            base = {"type": "boolean"}
+        elif schema_type == "object":
+            base = {"type": "object"}
+            fields = schema.get("fields")
+            if isinstance(fields, dict) and fields:
+                base["properties"] = {
+                    name: self.to_json_schema(field_schema)
+                    for name, field_schema in fields.items()
+                }
+        elif schema_type == "file":
+            # Files are referenced either by ID or by a file object carrying its ID
+            base = {
+                "anyOf": [
+                    {"type": "string"},
+                    {"type": "object", "required": ["file_id"]}
+                ]
+            }
+        elif schema_type == "array":
+            base = {"type": "array"}
+        else:
+            # Unknown or custom types are not enforced
+            base = {}
+
+        if schema.get("is_array"):
+            return {"type": "array", "items": base}
+        return base
+
+    def get_validator(self, schema: Optional[Dict[str, Any]]) -> Draft7Validator:
+        """
+        Get the compiled validator for a schema, compiling it on first use.
+
+        Raises:
+            InvalidVariableError: If the schema cannot be compiled
+        """
+        key = self.schema_hash(schema or {})
+        with self._lock:
+            validator = self._validators.get(key)
+            if validator is not None:
+                self._validators.move_to_end(key)
+                return validator
+
+        json_schema = self.to_json_schema(schema)
+        try:
+            Draft7Validator.check_schema(json_schema)
+        except SchemaError as e:
+            raise InvalidVariableError(f"Invalid schema: {e.message}")
+        validator = Draft7Validator(json_schema)
+
+        with self._lock:
+            self._validators[key] = validator
+            if len(self._validators) > self._max_entries:
+                self._validators.popitem(last=False)
+        logger.debug("Compiled schema validator %s", key)
+        return validator
+
+    def validate(self, name: str, schema: Optional[Dict[str, Any]], value: Any) -> None:
+        """
+        Validate a value against a schema.
+
+        Raises:
+            VariableValidationError: If the value does not match the schema
+        """
+        validator = self.get_validator(schema)
+        error = next(iter(validator.iter_errors(value)), None)
+        if error is not None:
+            path = "/".join(str(p) for p in error.absolute_path)
+            location = f" at '{path}'" if path else ""
+            raise VariableValidationError(name, f"{error.message}{location}")
+
+    def validate_parameters(self, signature: Dict[str, Any], values: Dict[str, Any]) -> None:
+        """Validate step inputs against the parameters of a tool signature"""
+        for param in signature.get("parameters", []):
+            name = param.get("name")
+            if name not in values or values[name] is None:
+                if param.get("required", True) and "default" not in param:
+                    raise VariableValidationError(name, "required input is missing")
+                continue
+            self.validate(name, self._param_schema(param), values[name])
+
+    def validate_outputs(self, signature: Dict[str, Any], values: Dict[str, Any]) -> None:
+        """Validate step outputs against the outputs of a tool signature"""
+        for output in signature.get("outputs", []):
+            name = output.get("name")
+            if name in values:
+                self.validate(name, self._param_schema(output), values[name])
+
+    def compile_signature(self, signature: Dict[str, Any]) -> None:
+        """
+        Compile the schemas of a tool signature's parameters and outputs ahead of execution.
+
+        Raises:
+            InvalidVariableError: If a schema cannot be compiled
+        """
+        for param in list(signature.get("parameters") or []) + list(signature.get("outputs") or []):
+            if isinstance(param, dict):
+                self.get_validator(self._param_schema(param))
+
+    def _param_schema(self, param: Dict[str, Any]) -> Dict[str, Any]:
+        """Signatures store parameter schemas under either 'value_schema' or 'schema'"""
+        return param.get("value_schema") or param.get("schema") or {}
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of compiled validators"""
+        with self._lock:
+            return {"compiled": len(self._validators), "max_entries": self._max_entries}
+
+
+# Create a singleton instance
+schema_registry = SchemaRegistry()
+
+__all__ = ['schema_registry', 'SchemaRegistry']
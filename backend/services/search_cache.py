@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from config.settings import settings
+from utils.metrics import metrics
+from utils.persistent_cache import PersistentCache
+from utils.singleflight import make_flight_key
+from .llm.scheduler import LLMCallContext, current_call_context
+
+logger = logging.getLogger(__name__)
+
+QUOTA_RETENTION_SECONDS = 3 * 24 * 3600  # Daily counters are kept a little past their day
+ANONYMOUS_USER = LLMCallContext().user_id
+
+_SITE_RESTRICTION = re.compile(r"(?:^|\s)(-?site:\S+)", re.IGNORECASE)
+
+
+class SearchQuotaExceededError(Exception):
+    """Raised when a paid search is needed but the daily quota is used up and nothing is cached"""
+
+    def __init__(self, provider: str, scope: str):
+        self.provider = provider
+        self.scope = scope
+        super().__init__(f"Daily {scope} search quota for {provider} is used up")
+
+
+def normalize_query(query: str) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Canonical form of a search query for cache keys: lower case, single
+    spaces, with site: restrictions split out and sorted so their order and
+    position do not matter.
+    """
+    query = " ".join((query or "").lower().split())
+    sites = tuple(sorted(match.strip() for match in _SITE_RESTRICTION.findall(query)))
+    terms = " ".join(_SITE_RESTRICTION.sub(" ", query).split())
+    return terms, sites
+
+
+class SearchQuota:
+    """
+    Daily counts of paid search requests, per provider and per user.
+
+    Days follow SEARCH_QUOTA_TIMEZONE (Google resets Custom Search quotas at
+    midnight Pacific time). Counts are kept in a local SQLite file so they
+    survive restarts; with several workers each counts its own requests.
+    """
+
+    def __init__(self, store: PersistentCache):
+        self.store = store
+        self._lock = threading.Lock()
+
+    def day(self) -> str:
+        return datetime.now(ZoneInfo(settings.SEARCH_QUOTA_TIMEZONE)).strftime("%Y-%m-%d")
+
+    def used(self, provider: str) -> int:
+        return self.store.get(self._provider_key(provider)) or 0
+
+    def used_by(self, user_id: str) -> int:
+        """Requests made for a user today, across providers"""
+        return self.store.get(self._user_key(user_id)) or 0
+
+    def limit(self, provider: str) -> Optional[int]:
+        return settings.SEARCH_DAILY_QUOTAS.get(provider)
+
+    def remaining(self, provider: str) -> Optional[int]:
+        limit = self.limit(provider)
+        return None if limit is None else max(0, limit - self.used(provider))
+
+    def try_charge(self, provider: str, user_id: str, reserve: float = 0.0) -> Optional[str]:
+        """
+        Charge a request to the provider's and the user's quota, unless either
+        has less than reserve (a fraction of it) left. Checking and charging
+        are one step, so concurrent requests cannot overshoot a quota.
+
+        Returns:
+            None if the request was charged, else the exhausted scope ("global" or "user")
+        """
+        with self._lock:
+            scope = self.exhausted_scope(provider, user_id, reserve)
+            if scope is not None:
+                return scope
+            used = self.used(provider) + 1
+            self.store.set(self._provider_key(provider), used)
+            self.store.set(self._user_key(user_id), self.used_by(user_id) + 1)
+
+        metrics.increment("search_quota_burn", provider=provider)
+        metrics.set_gauge("search_quota_used", used, provider=provider)
+        limit = self.limit(provider)
+        if limit is not None:
+            metrics.set_gauge("search_quota_remaining", max(0, limit - used), provider=provider)
+        return None
+
+    def exhausted_scope(self, provider: str, user_id: str, reserve: float = 0.0) -> Optional[str]:
+        """"global" or "user" if that quota has less than reserve (a fraction) left, else None"""
+        limit = self.limit(provider)
+        if limit is not None and self.used(provider) >= limit * (1 - reserve):
+            return "global"
+        user_limit = settings.SEARCH_USER_DAILY_QUOTA
+        # Calls made outside any user's request only count against the global quota
+        if user_limit and user_id != ANONYMOUS_USER and self.used_by(user_id) >= user_limit * (1 - reserve):
+            return "user"
+        return None
+
+    def _provider_key(self, provider: str) -> str:
+        return f"{self.day()}:provider:{provider}"
+
+    def _user_key(self, user_id: str) -> str:
+        return f"{self.day()}:user:{user_id}"
+
+
+class SearchResultCache:
+    """
+    Cache of paid search API results, with quota accounting.
+
+    Results are keyed by provider, normalized query, site restrictions and
+    request parameters (number of results, language, ...), and reused for
+    SEARCH_CACHE_TTL_SECONDS. Each request is charged to the provider's and
+    the user's daily quota before it is sent. Once a provider has used all but
+    SEARCH_QUOTA_RESERVE of its quota, or a user their own quota, expired
+    cached results are served instead of making a request; with nothing
+    cached, requests continue until the quota is used up. Expired results are
+    also served when a request fails.
+    """
+
+    def __init__(self, cache: PersistentCache, quota: SearchQuota):
+        self.cache = cache
+        self.quota = quota
+
+    def key(self, provider: str, query: str, params: Dict[str, Any]) -> str:
+        terms, sites = normalize_query(query)
+        return make_flight_key(provider, terms, sites, params)
+
+    async def get_or_search(self,
+                            provider: str,
+                            query: str,
+                            params: Dict[str, Any],
+                            search: Callable[[], Awaitable[List[Dict[str, Any]]]],
+                            user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Cached results for the query, or the results of search() (which makes
+        the paid request) if none are fresh.
+
+        Raises:
+            SearchQuotaExceededError: If a request is needed, the quota is used up and nothing is cached
+        """
+        # The cache and quota are SQLite files, so they are read and written off the event loop
+        key, stale, user_id = await asyncio.to_thread(self._lookup, provider, query, params, user_id)
+        if key is None:
+            return stale
+        try:
+            results = await search()
+        except Exception:
+            if stale is None:
+                raise
+            logger.warning(f"{provider} search for '{query}' failed, serving expired results")
+            results = []
+        return await asyncio.to_thread(self._store, provider, key, results, stale)
+
+    def get_or_search_sync(self,
+                           provider: str,
+                           query: str,
+                           params: Dict[str, Any],
+                           search: Callable[[], List[Dict[str, Any]]],
+                           user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """get_or_search for blocking search clients (RAVE's search2 node, which runs in a worker thread)"""
+        key, stale, user_id = self._lookup(provider, query, params, user_id)
+        if key is None:
+            return stale
+        try:
+            results = search()
+        except Exception:
+            if stale is None:
+                raise
+            logger.warning(f"{provider} search for '{query}' failed, serving expired results")
+            results = []
+        return self._store(provider, key, results, stale)
+
+    def _lookup(self,
+                provider: str,
+                query: str,
+                params: Dict[str, Any],
+                user_id: Optional[str]) -> Tuple[Optional[str], Optional[List[Dict[str, Any]]], str]:
+        """
+        Find cached results for the query and, if a request is needed, charge it to the quota.
+
+        Returns:
+            (key, stale results, user): key is None when the returned results
+            should be served without a request
+        """
+        user_id = str(user_id) if user_id is not None else current_call_context().user_id
+        key = self.key(provider, query, params)
+        entry = self.cache.get_entry(key) if settings.SEARCH_CACHE_ENABLED else None
+        if entry is not None and entry[1] <= settings.SEARCH_CACHE_TTL_SECONDS:
+            metrics.increment("search_cache_hits", provider=provider)
+            return None, entry[0], user_id
+        stale = entry[0] if entry is not None else None
+
+        # With expired results to fall back on, the quota reserve is kept for queries without any
+        scope = self.quota.try_charge(provider, user_id, settings.SEARCH_QUOTA_RESERVE if stale is not None else 0.0)
+        if scope is not None and stale is not None:
+            metrics.increment("search_cache_stale_served", provider=provider, reason="quota")
+            logger.info(f"Serving expired {provider} results for '{query}', {scope} quota nearly used up")
+            return None, stale, user_id
+        if scope is not None:
+            metrics.increment("search_quota_rejected", provider=provider, scope=scope)
+            raise SearchQuotaExceededError(provider, scope)
+
+        metrics.increment("search_cache_misses", provider=provider)
+        return key, stale, user_id
+
+    def _store(self,
+               provider: str,
+               key: str,
+               results: List[Dict[str, Any]],
+               stale: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        if results:
+            if settings.SEARCH_CACHE_ENABLED:
+                self.cache.set(key, results)
+            return results
+        # Providers report failures as empty results; earlier results beat none
+        if stale:
+            metrics.increment("search_cache_stale_served", provider=provider, reason="error")
+            return stale
+        return results
+
+
+# Create a singleton instance
+search_cache = SearchResultCache(
+    cache=PersistentCache(
+        path=os.path.join(settings.CACHE_DIR, "search_results.sqlite3"),
+        table="search_results",
+        ttl_seconds=settings.SEARCH_CACHE_TTL_SECONDS,
+        max_entries=settings.SEARCH_CACHE_MAX_ENTRIES
+    ),
+    quota=SearchQuota(PersistentCache(
+        path=os.path.join(settings.CACHE_DIR, "search_results.sqlite3"),
+        table="search_quota",
+        ttl_seconds=QUOTA_RETENTION_SECONDS,
+        max_entries=100000
+    ))
+)
+
+__all__ = ['search_cache', 'SearchResultCache', 'SearchQuota', 'SearchQuotaExceededError', 'normalize_query']
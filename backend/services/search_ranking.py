@@ -0,0 +1,174 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config.settings import settings
+from utils.metrics import metrics
+from .llm.embeddings import default_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RankedResult:
+    """A search result with its similarity to the question and the unmet requirements"""
+    result: Dict[str, Any]
+    url: str
+    score: float
+
+    @property
+    def relevance_score(self) -> float:
+        """score on the 0-100 scale used by the search API and URL selection"""
+        return round(max(0.0, min(1.0, self.score)) * 100, 1)
+
+
+def result_url(result: Dict[str, Any]) -> str:
+    """URL of a search result from any of the search backends (Google and SerpAPI use link, Tavily url)"""
+    return result.get("link") or result.get("url") or ""
+
+
+def result_text(result: Dict[str, Any]) -> str:
+    return " ".join(
+        str(result.get(key) or "") for key in ("title", "snippet")
+    ).strip() or str(result.get("content") or "")
+
+
+def normalize_url(url: str) -> str:
+    """URL without scheme, www., query string, fragment and trailing slash, for spotting repeated pages"""
+    parts = urlsplit(url.strip().lower())
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    return host + parts.path.rstrip("/")
+
+
+def result_domain(url: str) -> str:
+    host = urlsplit(url.strip().lower()).netloc
+    return host[4:] if host.startswith("www.") else host
+
+
+def _normalized(vectors: Any) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _score(result_vectors: np.ndarray,
+           question_vector: np.ndarray,
+           item_vectors: Optional[np.ndarray]) -> np.ndarray:
+    scores = result_vectors @ question_vector
+    if item_vectors is not None and len(item_vectors):
+        weight = settings.SEARCH_RANK_QUESTION_WEIGHT
+        # Best match to any unmet requirement, so results covering one gap well rank high
+        scores = weight * scores + (1 - weight) * (result_vectors @ item_vectors.T).max(axis=1)
+    return scores
+
+
+def _select(results: List[Dict[str, Any]],
+            result_vectors: np.ndarray,
+            scores: np.ndarray,
+            max_per_domain: int) -> List[RankedResult]:
+    ranked: List[RankedResult] = []
+    kept_vectors: List[np.ndarray] = []
+    seen_urls = set()
+    per_domain: Dict[str, int] = {}
+    for index in np.argsort(-scores):
+        result = results[index]
+        url = result_url(result)
+        domain = result_domain(url)
+        if normalize_url(url) in seen_urls or per_domain.get(domain, 0) >= max_per_domain:
+            continue
+        vector = result_vectors[index]
+        # Mirrors and syndicated copies of a page already kept
+        if kept_vectors and float(np.max(np.stack(kept_vectors) @ vector)) >= settings.SEARCH_RANK_DUPLICATE_SIMILARITY:
+            continue
+        seen_urls.add(normalize_url(url))
+        per_domain[domain] = per_domain.get(domain, 0) + 1
+        kept_vectors.append(vector)
+        ranked.append(RankedResult(result=result, url=url, score=float(scores[index])))
+
+    metrics.increment("search_results_ranked", len(results))
+    metrics.increment("search_results_dropped", len(results) - len(ranked))
+    return ranked
+
+
+def _usable(results: Sequence[Any]) -> List[Dict[str, Any]]:
+    # SerpAPI fallbacks may leave placeholders in the results
+    return [result for result in results if isinstance(result, dict) and result_url(result)]
+
+
+def rank_results(results: Sequence[Dict[str, Any]],
+                 question: str,
+                 requirements: Sequence[str] = (),
+                 max_per_domain: Optional[int] = None,
+                 embeddings: Optional[Embeddings] = None) -> List[RankedResult]:
+    """
+    Rank search results by the similarity of their title and snippet to the
+    question and the requirements (e.g. unmet checklist items) it still has.
+
+    The question, the requirements and all results are embedded in one batch.
+    Repeated URLs, pages nearly identical to a better ranked one
+    (SEARCH_RANK_DUPLICATE_SIMILARITY) and results beyond max_per_domain from
+    one site are dropped.
+
+    Returns:
+        The kept results, best first
+    """
+    results = _usable(results)
+    if not results:
+        return []
+    requirements = [item for item in requirements if item]
+    embeddings = embeddings or default_embeddings()
+    vectors = _normalized(embeddings.embed_documents(
+        [question] + requirements + [result_text(result) for result in results]
+    ))
+    return _rank(results, vectors, len(requirements), max_per_domain)
+
+
+async def arank_results(results: Sequence[Dict[str, Any]],
+                        question: str,
+                        requirements: Sequence[str] = (),
+                        max_per_domain: Optional[int] = None,
+                        embeddings: Optional[Embeddings] = None) -> List[RankedResult]:
+    """Async version of rank_results"""
+    results = _usable(results)
+    if not results:
+        return []
+    requirements = [item for item in requirements if item]
+    embeddings = embeddings or default_embeddings()
+    vectors = _normalized(await embeddings.aembed_documents(
+        [question] + requirements + [result_text(result) for result in results]
+    ))
+    return _rank(results, vectors, len(requirements), max_per_domain)
+
+
+def _rank(results: List[Dict[str, Any]],
+          vectors: np.ndarray,
+          requirement_count: int,
+          max_per_domain: Optional[int]) -> List[RankedResult]:
+    question_vector = vectors[0]
+    item_vectors = vectors[1:1 + requirement_count]
+    result_vectors = vectors[1 + requirement_count:]
+    scores = _score(result_vectors, question_vector, item_vectors)
+    return _select(results, result_vectors, scores, max_per_domain or settings.SEARCH_RANK_MAX_PER_DOMAIN)
+
+
+def is_confident(ranked: Sequence[RankedResult], count: Optional[int] = None) -> bool:
+    """Whether the top count results all clear SEARCH_RANK_CONFIDENT_SCORE, so no model is needed to pick among them"""
+    count = count or settings.SEARCH_RANK_CONFIDENT_URLS
+    return len(ranked) >= count and all(
+        item.score >= settings.SEARCH_RANK_CONFIDENT_SCORE for item in ranked[:count]
+    )
+
+
+__all__ = [
+    'RankedResult',
+    'rank_results',
+    'arank_results',
+    'is_confident',
+    'result_url',
+    'normalize_url'
+]
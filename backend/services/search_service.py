@@ -3,18 +3,26 @@ import logging
 from typing import List, Dict, Optional
 import aiohttp
 from config.settings import settings
-from schemas import SearchResult, URLContent
+from schemas import SearchResult, URLContent, BatchSearchResponse, BatchSearchResult, QuerySearchResults
 from services.ai_service import ai_service
+from services.search_ranking import arank_results, normalize_url
+from services.search_cache import search_cache, normalize_query
+from services.llm.scheduler import current_call_context
 import ssl
 import certifi
 from bs4 import BeautifulSoup
+import bleach
 import asyncio
 import httpx
 from fastapi import HTTPException
+from utils.singleflight import SingleFlight, make_flight_key
 NUM_RESULTS = settings.GOOGLE_SEARCH_NUM_RESULTS
 
 logger = logging.getLogger(__name__)
 
+# Concurrent identical searches share one Custom Search API request
+_search_flights = SingleFlight("google_search")
+
 
 async def search(db: Session, query: str, user_id: int = 0) -> List[SearchResult]:
     """
@@ -32,7 +40,7 @@ async def search(db: Session, query: str, user_id: int = 0) -> List[SearchResult
     logger.info(f"Performing web search for query: {query}")
 
     try:
-        results = await google_search(query)
+        results = await google_search(query, user_id=str(user_id) if user_id else None)
 
         # Transform results to match our SearchResult schema
         search_results = [
@@ -54,15 +62,131 @@ async def search(db: Session, query: str, user_id: int = 0) -> List[SearchResult
         return []
 
 
+async def search_and_rank(db: Session, query: str, user_id: int = 0) -> List[SearchResult]:
+    """
+    Perform web search for the given query and rank the results by the
+    similarity of their title and snippet to the query
+
+    Args:
+        db (Session): Database session
+        query (str): Search query
+        user_id (int): ID of the user performing the search
+
+    Returns:
+        List[SearchResult]: Results with relevance_score (0-100), best first;
+        repeated and near-duplicate pages are dropped
+    """
+    logger.info(f"Performing ranked web search for query: {query}")
+
+    try:
+        results = await google_search(query, user_id=str(user_id) if user_id else None)
+        ranked = await arank_results(results, query)
+        return [
+            SearchResult(
+                title=item.result["title"],
+                link=item.result["link"],
+                snippet=item.result["snippet"],
+                displayLink=item.result["displayLink"],
+                pagemap=item.result["pagemap"],
+                relevance_score=item.relevance_score
+            )
+            for item in ranked
+        ]
+
+    except Exception as e:
+        logger.error(f"Error performing ranked search: {str(e)}")
+        return []
+
+
+async def batch_search(db: Session,
+                       queries: List[str],
+                       user_id: int = 0,
+                       num_results: int = NUM_RESULTS,
+                       fetch_top_n: int = 0) -> BatchSearchResponse:
+    """
+    Run several web searches concurrently and merge their results
+
+    Args:
+        db (Session): Database session
+        queries (List[str]): Search queries; queries that normalize to the same
+            search are sent once
+        user_id (int): ID of the user performing the searches
+        num_results (int): Number of results per query
+        fetch_top_n (int): Also fetch the content of this many top unique results
+
+    Returns:
+        BatchSearchResponse: Results per query, the results of all queries
+        deduplicated by canonical URL (best ranked first, with the queries that
+        returned them) and the fetched contents
+    """
+    logger.info(f"Performing batch web search for {len(queries)} queries")
+
+    # One upstream search per distinct normalized query
+    distinct: Dict[tuple, str] = {}
+    for query in queries:
+        distinct.setdefault(normalize_query(query), query)
+
+    semaphore = asyncio.Semaphore(settings.SEARCH_BATCH_MAX_CONCURRENCY)
+
+    async def run(query: str) -> QuerySearchResults:
+        async with semaphore:
+            try:
+                results = await google_search(query, num_results=num_results,
+                                              user_id=str(user_id) if user_id else None)
+            except Exception as e:
+                logger.error(f"Error performing Google search for '{query}': {str(e)}")
+                return QuerySearchResults(query=query, results=[], error=str(e))
+        return QuerySearchResults(query=query, results=[
+            SearchResult(
+                title=result["title"],
+                link=result["link"],
+                snippet=result["snippet"],
+                displayLink=result["displayLink"],
+                pagemap=result["pagemap"]
+            )
+            for result in results
+        ])
+
+    searched = dict(zip(distinct, await asyncio.gather(*[run(query) for query in distinct.values()])))
+    searches = [
+        searched[normalize_query(query)].model_copy(update={"query": query})
+        for query in queries
+    ]
+
+    # Merge by canonical URL, ranking each result by its best position in any query
+    unique: Dict[str, BatchSearchResult] = {}
+    best_rank: Dict[str, tuple] = {}
+    for query_index, search in enumerate(searches):
+        for position, result in enumerate(search.results):
+            url = normalize_url(result.link)
+            if url not in unique:
+                unique[url] = BatchSearchResult(**result.model_dump(), queries=[])
+                best_rank[url] = (position, query_index)
+            if search.query not in unique[url].queries:
+                unique[url].queries.append(search.query)
+            best_rank[url] = min(best_rank[url], (position, query_index))
+    unique_results = [unique[url] for url in sorted(unique, key=best_rank.get)]
+
+    contents = []
+    if fetch_top_n and unique_results:
+        contents = await fetch_urls_content([result.link for result in unique_results[:fetch_top_n]])
+
+    return BatchSearchResponse(searches=searches, unique_results=unique_results, contents=contents)
+
+
 async def google_search(query: str,
                         api_key: str = settings.GOOGLE_SEARCH_API_KEY,
                         cx: str = settings.GOOGLE_SEARCH_ENGINE_ID,
                         num_results: int = NUM_RESULTS,
                         language: str = 'en',
-                        safe: str = 'off') -> List[Dict]:
+                        safe: str = 'off',
+                        user_id: Optional[str] = None) -> List[Dict]:
     """
     Perform a Google search using the Custom Search API.
 
+    Results are cached (see search_cache) and each request that reaches the
+    API is charged to the daily search quota.
+
     Args:
         query (str): The search query
         api_key (str): Your Google API key (defaults to settings.GOOGLE_SEARCH_API_KEY)
@@ -70,9 +194,41 @@ async def google_search(query: str,
         num_results (int): Number of results to return (max 10 per request)
         language (str): Language code for results (e.g., 'en' for English)
         safe (str): Safe search setting ('off', 'medium', or 'high')
+        user_id (str): User charged for the request (defaults to the current call context's user)
 
     Returns:
         List[Dict]: List of search results, each containing 'title', 'link', and 'snippet'
+
+    Raises:
+        SearchQuotaExceededError: If the daily quota is used up and the query is not cached
+        aiohttp.ClientError: If the request fails and the query is not cached
+    """
+    # Searches are shared per user, so each user's quota is charged for the searches they make
+    user_id = str(user_id) if user_id is not None else current_call_context().user_id
+    key = make_flight_key(query, cx, num_results, language, safe, user_id)
+    return await _search_flights.do(
+        key,
+        lambda: search_cache.get_or_search(
+            "google",
+            query,
+            {"cx": cx, "num": num_results, "hl": language, "safe": safe},
+            lambda: _google_search(query, api_key, cx, num_results, language, safe),
+            user_id=user_id
+        )
+    )
+
+
+async def _google_search(query: str,
+                         api_key: str,
+                         cx: str,
+                         num_results: int,
+                         language: str,
+                         safe: str) -> List[Dict]:
+    """
+    Perform the Custom Search API request (see google_search).
+
+    Request errors are raised, so the cache can serve expired results and
+    callers can report the failure instead of an empty result list.
     """
     base_url = "https://www.googleapis.com/customsearch/v1"
 
@@ -85,40 +241,32 @@ async def google_search(query: str,
         'safe': safe
     }
 
-    try:
-        # Create SSL context with verified certificates
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-
-        # Use the SSL context in the ClientSession
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-            async with session.get(base_url, params=params) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                # Check if there are search results
-                if 'items' not in data:
-                    return []
-
-                # Extract relevant information from each result
-                results = []
-                for item in data['items']:
-                    result = {
-                        'title': item.get('title', ''),
-                        'link': item.get('link', ''),
-                        'snippet': item.get('snippet', ''),
-                        'displayLink': item.get('displayLink', ''),
-                        'pagemap': item.get('pagemap', {})
-                    }
-                    results.append(result)
-
-                return results
-
-    except aiohttp.ClientError as e:
-        logger.error(f"API request failed: {str(e)}")
-        return []
-    except Exception as e:
-        logger.error(f"An error occurred during Google search: {str(e)}")
-        return []
+    # Create SSL context with verified certificates
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+    # Use the SSL context in the ClientSession
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
+        async with session.get(base_url, params=params) as response:
+            response.raise_for_status()
+            data = await response.json()
+
+            # Check if there are search results
+            if 'items' not in data:
+                return []
+
+            # Extract relevant information from each result
+            results = []
+            for item in data['items']:
+                result = {
+                    'title': item.get('title', ''),
+                    'link': item.get('link', ''),
+                    'snippet': item.get('snippet', ''),
+                    'displayLink': item.get('displayLink', ''),
+                    'pagemap': item.get('pagemap', {})
+                }
+                results.append(result)
+
+            return results
 
 async def fetch_url_content(url: str) -> URLContent:
 
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StepResultCache:
+    """
+    Memoizes workflow step results so re-running a workflow only re-executes
+    the steps whose tool, prompt template version or resolved inputs changed.
+
+    Entries expire after a TTL and the least recently used entries are evicted
+    once the cache reaches its maximum size.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self._cache: TTLCache = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        logger.info("StepResultCache initialized with ttl=%ss, max_entries=%d", ttl_seconds, max_entries)
+
+    def make_key(self,
+                 tool_id: str,
+                 inputs: Dict[str, Any],
+                 prompt_template_id: Optional[str] = None,
+                 template_version: Optional[str] = None) -> str:
+        """
+        Build a cache key from the tool, the prompt template version and a hash of the resolved inputs.
+
+        Args:
+            tool_id: ID (or type) of the tool executed by the step
+            inputs: The fully resolved step inputs
+            prompt_template_id: Optional prompt template used by LLM steps
+            template_version: Optional version marker of the template (e.g. its updated_at)
+
+        Returns:
+            The cache key string
+        """
+        canonical_inputs = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+        inputs_hash = hashlib.sha256(canonical_inputs.encode("utf-8")).hexdigest()
+        return f"{tool_id}:{prompt_template_id or '-'}:{template_version or '-'}:{inputs_hash}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for a key, or None if missing or expired"""
+        with self._lock:
+            result = self._cache.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logger.debug("Step cache %s for key %s", "hit" if result is not None else "miss", key)
+        return result
+
+    def set(self, key: str, result: Any) -> None:
+        """Store a step result"""
+        if result is None:
+            return
+        with self._lock:
+            self._cache[key] = result
+
+    def clear(self) -> None:
+        """Remove all cached step results"""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache size and hit/miss counts"""
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_entries": int(self._cache.maxsize),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Create a singleton instance
+step_cache = StepResultCache(
+    ttl_seconds=settings.STEP_CACHE_TTL_SECONDS,
+    max_entries=settings.STEP_CACHE_MAX_ENTRIES
+)
+
+__all__ = ['step_cache', 'StepResultCache']
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import orjson
+
+from config.settings import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Chunk key carrying streamed answer text
+TOKEN_DELTA = "token_delta"
+
+# Items passed from the reading task to the consumer
+_CHUNK = "chunk"
+_ERROR = "error"
+_END = "end"
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    # Pydantic models and other objects that slip into custom stream chunks
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "dict"):
+        return value.dict()
+    return str(value)
+
+
+def encode_event(chunk: Any) -> str:
+    """Encode a stream chunk as compact JSON for an SSE data field"""
+    return orjson.dumps(chunk, default=_default, option=ORJSON_OPTIONS).decode()
+
+
+def _delta_field(chunk: Any) -> Tuple[bool, Optional[str]]:
+    """
+    Return (True, field) if the chunk is a bare {"token_delta": ..., "field": ...}
+    chunk that can be merged with its neighbours of the same field, else (False, None).
+    """
+    if not isinstance(chunk, dict) or not isinstance(chunk.get(TOKEN_DELTA), str):
+        return False, None
+    if any(key not in (TOKEN_DELTA, "field") for key in chunk):
+        return False, None
+    return True, chunk.get("field")
+
+
+class _PendingText:
+    """Text of consecutive token deltas of one field waiting to be sent as one frame"""
+
+    def __init__(self, field: Optional[str]):
+        self.field = field
+        self.parts = []
+        self.size = 0
+        self.merged = 0
+
+    def add(self, text: str) -> None:
+        self.parts.append(text)
+        self.size += len(text)
+        self.merged += 1
+
+    def chunk(self) -> Dict[str, Any]:
+        chunk = {TOKEN_DELTA: "".join(self.parts)}
+        if self.field is not None:
+            chunk["field"] = self.field
+        return chunk
+
+
+async def coalesce_tokens(stream: AsyncIterator[Any],
+                          window_seconds: Optional[float] = None,
+                          max_chars: Optional[int] = None) -> AsyncIterator[Any]:
+    """
+    Merge runs of streamed token deltas into fewer, larger chunks.
+
+    Consecutive {"token_delta": text, "field": field} chunks of the same field
+    are buffered until window_seconds have passed since the first of them,
+    max_chars characters are buffered, or a different chunk arrives; they are
+    then sent as a single chunk of the same shape. All other chunks, including
+    "token" chunks and their metadata, pass through unchanged and in order.
+
+    Args:
+        stream: Chunks from graph.astream(..., stream_mode="custom")
+        window_seconds: Longest time a token is held back (default STREAM_COALESCE_SECONDS)
+        max_chars: Buffered text size that forces a flush (default STREAM_COALESCE_MAX_CHARS)
+    """
+    window_seconds = settings.STREAM_COALESCE_SECONDS if window_seconds is None else window_seconds
+    max_chars = settings.STREAM_COALESCE_MAX_CHARS if max_chars is None else max_chars
+
+    if window_seconds <= 0:
+        async for chunk in stream:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    output: asyncio.Queue = asyncio.Queue()
+    pending: Optional[_PendingText] = None
+    timer: Optional[asyncio.TimerHandle] = None
+
+    def flush() -> None:
+        nonlocal pending, timer
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        if pending is not None:
+            metrics.increment("stream_tokens_coalesced", pending.merged - 1)
+            output.put_nowait((_CHUNK, pending.chunk()))
+            pending = None
+
+    async def pump() -> None:
+        # Reads the source in its own task so held-back tokens can be flushed by a timer
+        nonlocal pending, timer
+        try:
+            async for chunk in stream:
+                mergeable, field = _delta_field(chunk)
+                if not mergeable:
+                    flush()
+                    output.put_nowait((_CHUNK, chunk))
+                    continue
+
+                text = chunk[TOKEN_DELTA]
+                if not text:
+                    continue
+                if pending is not None and pending.field != field:
+                    flush()
+                if pending is None:
+                    pending = _PendingText(field)
+                    timer = loop.call_later(window_seconds, flush)
+                pending.add(text)
+                if pending.size >= max_chars:
+                    flush()
+            flush()
+            output.put_nowait((_END, None))
+        except Exception as e:
+            flush()
+            output.put_nowait((_ERROR, e))
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        while True:
+            kind, payload = await output.get()
+            if kind == _CHUNK:
+                yield payload
+            elif kind == _ERROR:
+                raise payload
+            else:
+                return
+    finally:
+        # Stops the source stream when the consumer is cancelled or closes early
+        pump_task.cancel()
+        if timer is not None:
+            timer.cancel()
+
+
+__all__ = ['coalesce_tokens', 'encode_event']
@@ -418,7 +418,20 @@ class WorkflowService:
             return {'parameters': [], 'outputs': []}
         
         print(f"Found prompt template: {prompt_template.template_id}")
+        return self._build_llm_signature(prompt_template)
+
+    def _build_llm_signature(self, prompt_template: PromptTemplate) -> Dict:
+        """
+        Build the tool signature for an already loaded prompt template.
         
+        Args:
+            prompt_template: The prompt template to build the signature from
+            
+        Returns:
+            A dictionary with 'parameters' and 'outputs' lists defining the tool signature
+        """
+        prompt_template_id = prompt_template.template_id
+
         # Convert tokens to parameters
         parameters = []
         for token in prompt_template.tokens:
@@ -1,6 +1,9 @@
 import pytest
 import os
+import re
+import zlib
 from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
 
 # Load environment variables for testing
 load_dotenv()
@@ -8,4 +11,31 @@ load_dotenv()
 # Ensure we have the required environment variables
 @pytest.fixture(autouse=True)
 def check_env():
-    assert os.getenv('ANTHROPIC_API_KEY'), "ANTHROPIC_API_KEY environment variable is required" 
\ No newline at end of file
+    assert os.getenv('ANTHROPIC_API_KEY'), "ANTHROPIC_API_KEY environment variable is required" 
+
+
+class WordEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings: texts are as similar as the words they share"""
+
+    dimensions = 512
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text):
+        vector = [0.0] * self.dimensions
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode()) % self.dimensions] += 1.0
+        return vector
+
+
+@pytest.fixture
+def embeddings():
+    return WordEmbeddings()
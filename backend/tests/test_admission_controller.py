@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from services.admission_controller import AdmissionController, AdmissionRejected
+
+
+async def positions(ticket, timeout=1.0):
+    return [position async for position in ticket.wait(timeout=timeout)]
+
+
+def test_admits_up_to_the_caps():
+    controller = AdmissionController(max_active=2, max_per_user=1, max_queued=5)
+
+    assert controller.enter("alice").admitted
+    assert controller.enter("bob").admitted
+    assert not controller.enter("alice").admitted
+    assert controller.stats() == {"active": 2, "queued": 1, "users_active": 2}
+
+
+def test_rejects_when_the_queue_is_full():
+    controller = AdmissionController(max_active=1, max_per_user=1, max_queued=1)
+    controller.enter("alice")
+    controller.enter("bob")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.enter("carol")
+    assert rejected.value.retry_after >= 1
+
+
+async def test_release_admits_the_next_queued_run():
+    controller = AdmissionController(max_active=1, max_per_user=1, max_queued=5)
+    running = controller.enter("alice")
+    queued = controller.enter("bob")
+
+    waiter = asyncio.create_task(positions(queued))
+    await asyncio.sleep(0)
+    running.release()
+
+    assert await waiter == [1]
+    assert queued.admitted
+    assert controller.stats()["active"] == 1
+
+
+async def test_release_is_idempotent():
+    controller = AdmissionController(max_active=2, max_per_user=2, max_queued=5)
+    first = controller.enter("alice")
+    controller.enter("alice")
+
+    first.release()
+    first.release()
+    assert controller.stats()["active"] == 1
+
+
+async def test_queue_timeout_leaves_the_queue():
+    controller = AdmissionController(max_active=1, max_per_user=1, max_queued=5)
+    controller.enter("alice")
+    queued = controller.enter("bob")
+
+    with pytest.raises(asyncio.TimeoutError):
+        await positions(queued, timeout=0.05)
+    assert controller.stats()["queued"] == 0
+    assert not queued.admitted
+
+
+async def test_abandoned_wait_leaves_the_queue():
+    controller = AdmissionController(max_active=1, max_per_user=1, max_queued=5)
+    controller.enter("alice")
+    queued = controller.enter("bob")
+
+    waiting = queued.wait(timeout=1.0)
+    assert await waiting.__anext__() == 1
+    await waiting.aclose()
+    assert controller.stats()["queued"] == 0
+
+
+async def test_queued_run_of_a_user_at_the_cap_is_skipped():
+    controller = AdmissionController(max_active=2, max_per_user=1, max_queued=5)
+    controller.enter("alice")
+    bob = controller.enter("bob")
+    alice_again = controller.enter("alice")
+    carol = controller.enter("carol")
+
+    bob.release()
+    assert carol.admitted
+    assert not alice_again.admitted
+    assert alice_again.position == 1
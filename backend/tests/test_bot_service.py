@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from services.bot_service import BotService
+
+TOOL_CALL = {"name": "search", "parameters": {"query": "weather"}}
+# The tool object is complete before the trailing commas break the document
+BROKEN_TOOL_RESPONSE = '{"type": "tool", "tool": {"name": "search", "parameters": {"query": "weather"}}, "notes": [1,],}'
+
+
+class FakeAIService:
+    def __init__(self, chunks, repaired):
+        self.chunks = chunks
+        self.repaired = repaired
+        self.repairs = []
+
+    async def stream_messages(self, messages, system, call_site):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def send_structured(self, messages, schema, name, system, call_site):
+        self.repairs.append(messages[0]["content"])
+        return self.repaired
+
+
+def make_bot(response, repaired, chunk_size=8):
+    bot = BotService(db=None)
+    bot.ai_service = FakeAIService(
+        [response[i:i + chunk_size] for i in range(0, len(response), chunk_size)], repaired
+    )
+    bot._fit_prompt = lambda messages, assets: (messages, "system")
+    bot.tools_started, bot.tools_cancelled = [], []
+
+    async def execute_tool(tool_call):
+        bot.tools_started.append(tool_call)
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            bot.tools_cancelled.append(tool_call)
+            raise
+
+    bot._execute_tool = execute_tool
+    return bot
+
+
+async def test_valid_response_is_parsed_while_streaming():
+    bot = make_bot('{"type": "final_response", "response": "Hi"}', repaired=None)
+
+    response, tool_task = await bot._get_ai_response([{"role": "user", "content": "Hello"}], [])
+    assert response == {"type": "final_response", "response": "Hi"}
+    assert tool_task is None
+    assert bot.ai_service.repairs == []
+
+
+async def test_broken_json_is_repaired_and_unused_tool_cancelled():
+    bot = make_bot(BROKEN_TOOL_RESPONSE, repaired={"type": "final_response", "response": "Sunny"})
+
+    response, tool_task = await bot._get_ai_response([{"role": "user", "content": "Weather?"}], [])
+    await asyncio.sleep(0)
+
+    assert response == {"type": "final_response", "response": "Sunny"}
+    assert tool_task is None
+    assert bot.tools_started == bot.tools_cancelled == [TOOL_CALL]
+    # The repair sees the whole broken response
+    assert BROKEN_TOOL_RESPONSE in bot.ai_service.repairs[0]
+
+
+async def test_early_tool_is_kept_when_the_repair_asks_for_it():
+    bot = make_bot(BROKEN_TOOL_RESPONSE, repaired={"type": "tool", "tool": TOOL_CALL})
+
+    response, tool_task = await bot._get_ai_response([{"role": "user", "content": "Weather?"}], [])
+    assert response["tool"] == TOOL_CALL
+    assert tool_task is not None and not tool_task.done()
+    assert bot.tools_started == [TOOL_CALL]
+    assert bot.tools_cancelled == []
+    tool_task.cancel()
+
+
+@pytest.mark.parametrize("response", ["{'type': 'final_response', 'response': 'Hi'}", '{"type": "final_response" "response": "Hi"}'])
+async def test_malformed_json_reaches_the_repair(response):
+    bot = make_bot(response, repaired={"type": "final_response", "response": "Hi"})
+
+    repaired, _ = await bot._get_ai_response([{"role": "user", "content": "Hello"}], [])
+    assert repaired == {"type": "final_response", "response": "Hi"}
+    assert len(bot.ai_service.repairs) == 1
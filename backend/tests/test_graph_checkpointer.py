@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, GraphCheckpoint, GraphCheckpointWrite
+from services.graph_checkpointer import SQLAlchemyCheckpointSaver
+
+
+@pytest.fixture
+def saver():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[GraphCheckpoint.__table__, GraphCheckpointWrite.__table__])
+    return SQLAlchemyCheckpointSaver(session_factory=sessionmaker(bind=engine), ttl_seconds=3600, sweep_seconds=3600)
+
+
+def save(saver, thread_id):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    saved = saver.put(config, empty_checkpoint(), {"step": 0}, {})
+    saver.put_writes(saved, [("messages", "hello")], task_id="task")
+    return saved
+
+
+def age(saver, thread_id, seconds):
+    with saver.session_factory() as db:
+        db.query(GraphCheckpoint).filter(GraphCheckpoint.thread_id == thread_id).update(
+            {"created_at": datetime.utcnow() - timedelta(seconds=seconds)}
+        )
+        db.commit()
+
+
+def test_delete_thread_removes_checkpoints_and_writes(saver):
+    saved = save(saver, "done")
+    save(saver, "other")
+
+    saver.delete_thread("done")
+    assert saver.get_tuple(saved) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "other"}}) is not None
+
+
+def test_expired_threads_are_deleted(saver):
+    save(saver, "old")
+    save(saver, "new")
+    age(saver, "old", 7200)
+
+    assert saver.delete_expired() == 1
+    assert saver.get_tuple({"configurable": {"thread_id": "old"}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "new"}}) is not None
+
+
+def test_saving_sweeps_when_due(saver):
+    save(saver, "old")
+    age(saver, "old", 7200)
+    saver._last_sweep -= 3600
+
+    save(saver, "new")
+    assert saver.get_tuple({"configurable": {"thread_id": "old"}}) is None
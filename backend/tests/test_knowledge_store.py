@@ -0,0 +1,90 @@
+import pytest
+from agents import knowledge_store as knowledge_store_module
+from agents.knowledge_store import KnowledgeStore, KnowledgeStoreRegistry
+from agents.prompts.prompts import KnowledgeNugget, KnowledgeNuggetUpdate
+
+
+def nugget(content, nugget_id="", confidence=1.0, conflicts_with=None):
+    return KnowledgeNugget(
+        content=content, source_url="https://example.com", confidence=confidence,
+        conflicts_with=conflicts_with or [], nugget_id=nugget_id
+    )
+
+
+@pytest.fixture
+def store(embeddings):
+    return KnowledgeStore(embeddings, merge_threshold=0.9)
+
+
+def test_near_duplicates_are_merged(store):
+    first, other = store.add_many([nugget("Aspirin lowers fever", confidence=0.5), nugget("Ibuprofen treats pain")])
+    merged, = store.add_many([nugget("aspirin lowers FEVER", confidence=0.8, conflicts_with=[other.nugget_id, "K99"])])
+
+    assert [first.nugget_id, other.nugget_id] == ["K1", "K2"]
+    assert merged is first
+    assert first.confidence == 0.8
+    # Conflicts are only kept for nuggets the store holds
+    assert first.conflicts_with == [other.nugget_id]
+    assert len(store) == 2
+
+
+def test_duplicates_within_one_batch_are_merged(store):
+    stored = store.add_many([nugget("Aspirin lowers fever"), nugget("Aspirin lowers fever")])
+
+    assert stored[0] is stored[1]
+    assert len(store) == 1
+
+
+def test_updated_content_is_re_embedded(store):
+    stored = store.add(nugget("Aspirin lowers fever"))
+    store.add(nugget("Ibuprofen treats pain"))
+
+    assert store.update(KnowledgeNuggetUpdate(nugget_id=stored.nugget_id, content="Paracetamol reduces headaches"))
+    (best, score), = store.search("paracetamol reduces headaches", k=1)
+    assert best is stored and score == pytest.approx(1.0)
+    assert store.search("aspirin lowers fever", k=2)[0][1] < 0.5
+    assert store._index.ntotal == 2
+    assert not store.update(KnowledgeNuggetUpdate(nugget_id="K99", confidence=0.1))
+
+
+def test_rebuild_renames_colliding_ids(embeddings):
+    saved = [nugget("Aspirin lowers fever", "a1b2"), nugget("Ibuprofen treats pain", "a1b2"), nugget("Rest helps", "K3")]
+
+    store = KnowledgeStore.from_nuggets(saved, embeddings)
+    assert [stored.nugget_id for stored in store.nuggets] == ["a1b2", "K4", "K3"]
+    assert store.search("ibuprofen treats pain", k=1)[0][0].nugget_id == "K4"
+    # New nuggets continue after the highest sequential ID
+    assert store.add(nugget("Sleep matters")).nugget_id == "K5"
+
+
+def test_retrieve_keeps_the_best_nuggets_without_repeats(store):
+    store.add_many([nugget(f"fact {word} alpha") for word in ("red", "green", "blue", "black")])
+
+    retrieved = store.retrieve(["red alpha", "green alpha", "blue alpha"], k_per_query=2, limit=3)
+    assert [stored.content for stored in retrieved] == ["fact red alpha", "fact green alpha", "fact blue alpha"]
+    assert len(store.retrieve(["alpha"], k_per_query=1, limit=10)) == 1
+    assert len(store.retrieve(["alpha"], k_per_query=10, limit=2)) == 2
+
+def test_registry_rebuilds_stores_that_are_out_of_step(embeddings, monkeypatch):
+    monkeypatch.setattr(knowledge_store_module, "default_embeddings", lambda: embeddings)
+    registry = KnowledgeStoreRegistry(max_sessions=1)
+    saved = [nugget("Aspirin lowers fever", "K1")]
+
+    store = registry.get("thread-1", saved)
+    assert registry.get("thread-1", saved) is store
+    # State moved on (e.g. another worker added a nugget): the store is rebuilt
+    rebuilt = registry.get("thread-1", saved + [nugget("Ibuprofen treats pain", "K2")])
+    assert rebuilt is not store and len(rebuilt) == 2
+
+    registry.get("thread-2", saved)
+    assert registry.get("thread-1", saved) is not rebuilt
+
+
+def test_registry_reuses_a_rebuilt_store_once_state_has_its_ids(embeddings, monkeypatch):
+    monkeypatch.setattr(knowledge_store_module, "default_embeddings", lambda: embeddings)
+    registry = KnowledgeStoreRegistry()
+    saved = [nugget("Aspirin lowers fever", "a1b2"), nugget("Ibuprofen treats pain", "a1b2")]
+
+    store = registry.get("thread-1", saved)
+    # Graph nodes write store.nuggets back to state, renamed IDs included
+    assert registry.get("thread-1", store.nuggets) is store
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from config.settings import settings
+from services.llm.router import CLOSED, HALF_OPEN, OPEN, AllProvidersFailedError, LLMRouter, RoutePolicy
+from services.llm.structured_output import StructuredOutputError
+from utils.metrics import metrics
+
+
+class FakeProvider:
+    def __init__(self, name):
+        self.name = name
+
+    def get_default_model(self):
+        return f"{self.name}-model"
+
+
+def make_router(monkeypatch, policy=None, failure_threshold=3):
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", failure_threshold)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_RESET_SECONDS", 60)
+    policy = policy or RoutePolicy(targets=[("primary", None), ("backup", None)])
+    return LLMRouter({"primary": FakeProvider("primary"), "backup": FakeProvider("backup")}, {"default": policy}, "primary")
+
+
+def scripted(behaviour, calls):
+    """Provider call that answers, fails or hangs according to behaviour[provider name]"""
+    async def fn(provider, model):
+        calls.append(provider.name)
+        outcome = behaviour[provider.name]
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == "hang":
+            await asyncio.Event().wait()
+        return f"{provider.name} answer"
+    return fn
+
+
+async def test_errors_fail_over_to_the_next_target(monkeypatch):
+    router, calls = make_router(monkeypatch), []
+    failovers = metrics.get_counter("llm_router_failovers", call_site="failover")
+
+    result = await router.call("failover", scripted({"primary": ConnectionError("down"), "backup": "ok"}, calls))
+    assert result == "backup answer"
+    assert calls == ["primary", "backup"]
+    assert router.breakers["primary"].failures == 1
+    assert metrics.get_counter("llm_router_failovers", call_site="failover") == failovers + 1
+
+
+async def test_content_errors_are_not_failed_over(monkeypatch):
+    router, calls = make_router(monkeypatch), []
+
+    with pytest.raises(StructuredOutputError):
+        await router.call("content", scripted({"primary": StructuredOutputError("bad output"), "backup": "ok"}, calls))
+    assert calls == ["primary"]
+    assert router.breakers["primary"].failures == 0
+
+
+async def test_all_targets_failing_raises(monkeypatch):
+    router = make_router(monkeypatch)
+
+    with pytest.raises(AllProvidersFailedError) as raised:
+        await router.call("failing", scripted({"primary": ConnectionError("down"), "backup": TimeoutError("slow")}, []))
+    assert [name for name, _ in raised.value.errors] == ["primary", "backup"]
+
+
+async def test_slow_calls_are_hedged(monkeypatch):
+    router = make_router(monkeypatch, RoutePolicy(targets=[("primary", None), ("backup", None)], hedge=True, hedge_after_seconds=0.01))
+    calls = []
+    wins = metrics.get_counter("llm_router_hedge_wins", call_site="hedged", provider="backup")
+
+    result = await router.call("hedged", scripted({"primary": "hang", "backup": "ok"}, calls))
+    assert result == "backup answer"
+    assert calls == ["primary", "backup"]
+    # The losing request is cancelled without counting against its provider
+    assert router.breakers["primary"].failures == 0
+    assert metrics.get_counter("llm_router_hedge_wins", call_site="hedged", provider="backup") == wins + 1
+
+
+async def test_open_circuits_are_skipped_until_a_trial_succeeds(monkeypatch):
+    router = make_router(monkeypatch, failure_threshold=2)
+    breaker = router.breakers["primary"]
+    for _ in range(2):
+        await router.call("breaker", scripted({"primary": ConnectionError("down"), "backup": "ok"}, []))
+    assert breaker.state == OPEN
+
+    calls = []
+    await router.call("breaker", scripted({"primary": "ok", "backup": "ok"}, calls))
+    assert calls == ["backup"]
+
+    # After the reset period one trial call is let through; its success closes the breaker
+    breaker.opened_at -= 60
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.release()
+    calls = []
+    await router.call("breaker", scripted({"primary": "ok", "backup": "ok"}, calls))
+    assert calls == ["primary"]
+    assert breaker.state == CLOSED
+
+
+def scripted_stream(behaviour, calls):
+    async def fn(provider, model):
+        calls.append(provider.name)
+        outcome = behaviour[provider.name]
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome == "hang":
+            await asyncio.Event().wait()
+        for chunk in ("Hello", " world"):
+            yield chunk
+    return fn
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+async def test_streams_fail_over_before_the_first_chunk(monkeypatch):
+    router, calls = make_router(monkeypatch), []
+
+    chunks = await collect(router.stream("stream", scripted_stream({"primary": ConnectionError("down"), "backup": "ok"}, calls)))
+    assert chunks == ["Hello", " world"]
+    assert calls == ["primary", "backup"]
+
+
+async def test_stream_first_chunk_latency_is_kept_apart_from_call_latency(monkeypatch):
+    router = make_router(monkeypatch, RoutePolicy(targets=[("primary", None), ("backup", None)], hedge=True, hedge_after_seconds=0.01))
+
+    chunks = await collect(router.stream("stream", scripted_stream({"primary": "hang", "backup": "ok"}, [])))
+    assert chunks == ["Hello", " world"]
+    assert router.first_chunk_latency._samples[("backup", "")]
+    assert not router.latency._samples
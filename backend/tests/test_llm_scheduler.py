@@ -0,0 +1,97 @@
+import asyncio
+
+from services.llm.scheduler import LLMScheduler, LLMCallContext, INTERACTIVE, BATCH
+
+MODEL = "test-model"
+
+
+def make_scheduler(requests_per_second=50):
+    scheduler = LLMScheduler(
+        model_limits={MODEL: {"rpm": requests_per_second * 60, "tpm": 10_000_000}},
+        default_rpm=60,
+        default_tpm=10_000,
+        priority_weights={INTERACTIVE: 4.0, BATCH: 1.0}
+    )
+    # Start with an empty request bucket so calls queue and are released one at a time
+    requests, _ = scheduler._get_buckets(MODEL)
+    requests._tokens = 0
+    return scheduler
+
+
+async def test_interactive_calls_overtake_queued_batch_calls():
+    scheduler = make_scheduler()
+    released = []
+
+    async def call(name, context):
+        await scheduler.acquire(MODEL, 100, context)
+        released.append(name)
+
+    batch = LLMCallContext(user_id="reporter", priority=BATCH)
+    chat = LLMCallContext(user_id="alice", priority=INTERACTIVE)
+    tasks = [asyncio.create_task(call(f"batch{i}", batch)) for i in range(3)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(call(f"chat{i}", chat)) for i in range(3)]
+    await asyncio.wait_for(asyncio.gather(*tasks), 2)
+
+    assert released[:2] == ["chat0", "chat1"]
+    assert released.index("chat2") < released.index("batch1")
+
+
+async def test_users_in_one_priority_class_share_capacity():
+    scheduler = make_scheduler()
+    released = []
+
+    async def call(name, context):
+        await scheduler.acquire(MODEL, 100, context)
+        released.append(name)
+
+    heavy = LLMCallContext(user_id="heavy", priority=INTERACTIVE)
+    light = LLMCallContext(user_id="light", priority=INTERACTIVE)
+    tasks = [asyncio.create_task(call("heavy", heavy)) for _ in range(4)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call("light", light)))
+    await asyncio.wait_for(asyncio.gather(*tasks), 2)
+
+    assert released.index("light") <= 1
+
+
+async def test_try_acquire_waits_behind_queued_calls():
+    scheduler = make_scheduler(requests_per_second=1)
+    queued = asyncio.create_task(scheduler.acquire(MODEL, 100))
+    await asyncio.sleep(0)
+
+    # Capacity is back, but the queued call goes first
+    requests, _ = scheduler._get_buckets(MODEL)
+    requests._tokens = requests.capacity
+    assert scheduler.try_acquire(MODEL, 100) > 0
+    queued.cancel()
+
+
+async def test_sync_calls_join_the_fair_queue():
+    scheduler = make_scheduler()
+    released = []
+
+    async def call(name):
+        await scheduler.acquire(MODEL, 100, LLMCallContext(user_id="alice", priority=INTERACTIVE))
+        released.append(name)
+
+    tasks = [asyncio.create_task(call(f"chat{i}")) for i in range(3)]
+    await asyncio.sleep(0)
+
+    def sync_call():
+        scheduler.acquire_sync(MODEL, 100, LLMCallContext(user_id="researcher", priority=BATCH))
+        released.append("sync")
+
+    await asyncio.wait_for(asyncio.gather(asyncio.to_thread(sync_call), *tasks), 2)
+    assert released[-1] == "sync"
+
+
+async def test_cancelled_call_is_skipped():
+    scheduler = make_scheduler()
+    cancelled = asyncio.create_task(scheduler.acquire(MODEL, 100))
+    waiting = asyncio.create_task(scheduler.acquire(MODEL, 100))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    await asyncio.wait_for(waiting, 1)
+    assert scheduler.queued() == 0
@@ -0,0 +1,99 @@
+from uuid import uuid4
+
+import pytest
+from langchain_core.outputs import LLMResult
+from agents import model_router as model_router_module
+from agents.model_router import COST, LATENCY_SLO, LOAD, PREFERRED, PROBE, QUALITY, NodeModelRouter
+from config.settings import settings
+
+POLICIES = {"answer_model": {"models": ["big", "small"], "latency_slo_seconds": 5.0, "max_cost_per_call": 0.01}}
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.waits = {}
+
+    def estimated_wait(self, model, tokens):
+        return self.waits.get(model, 0.0)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(model_router_module, "llm_scheduler", scheduler)
+    return scheduler
+
+
+@pytest.fixture
+def router(scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "RAVE_ROUTING_PROBE_EVERY", 1000)
+    monkeypatch.setattr(settings, "RAVE_ROUTING_MIN_SUCCESS_RATE", 0.8)
+    monkeypatch.setattr(settings, "RAVE_ROUTING_LOAD_WAIT_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "LLM_MODEL_COSTS", {"big": {"input": 10.0, "output": 30.0}})
+    return NodeModelRouter(POLICIES)
+
+
+def record_calls(router, count, seconds=1.0, ok=True, **usage):
+    for _ in range(count):
+        router.record("answer_model", "big", seconds, ok=ok, **usage)
+
+
+def test_preferred_model_is_used_while_it_is_healthy(router):
+    record_calls(router, 30, prompt_tokens=100, completion_tokens=100)
+
+    decision = router.choose("answer_model")
+    assert (decision.model, decision.reason, decision.skipped) == ("big", PREFERRED, {})
+    assert router.choose("unknown_node") is None
+
+
+def test_slow_models_are_skipped(router):
+    record_calls(router, 30, seconds=8.0)
+
+    decision = router.choose("answer_model")
+    assert (decision.model, decision.reason) == ("small", LATENCY_SLO)
+    assert router.recent_decisions()[-1] is decision
+
+
+def test_failing_models_are_skipped(router):
+    record_calls(router, 8)
+    record_calls(router, 4, ok=False)
+
+    assert router.choose("answer_model").reason == QUALITY
+
+
+def test_expensive_models_are_skipped(router):
+    record_calls(router, 3, prompt_tokens=1000, completion_tokens=1000)
+
+    assert router.choose("answer_model").reason == COST
+
+
+def test_loaded_models_are_skipped_even_by_probes(router, scheduler, monkeypatch):
+    monkeypatch.setattr(settings, "RAVE_ROUTING_PROBE_EVERY", 1)
+    scheduler.waits["big"] = 10.0
+
+    assert router.choose("answer_model").reason == LOAD
+
+
+def test_probes_retry_a_demoted_model(router, monkeypatch):
+    monkeypatch.setattr(settings, "RAVE_ROUTING_PROBE_EVERY", 2)
+    record_calls(router, 30, seconds=8.0)
+
+    assert router.choose("answer_model").model == "small"
+    decision = router.choose("answer_model")
+    assert (decision.model, decision.reason) == ("big", PROBE)
+
+
+def callback_call(callback, llm_output):
+    run_id = uuid4()
+    callback.on_chat_model_start({}, [], run_id=run_id)
+    callback.on_llm_end(LLMResult(generations=[], llm_output=llm_output), run_id=run_id)
+
+
+def test_callback_skips_cached_responses(router):
+    callback = router.callback("answer_model", "big")
+
+    callback_call(callback, None)
+    assert ("answer_model", "big") not in router._stats
+    callback_call(callback, {"token_usage": {"prompt_tokens": 10, "completion_tokens": 5}})
+    stats = router._stats[("answer_model", "big")]
+    assert (len(stats.outcomes), stats.prompt_tokens, stats.completion_tokens) == (1, 10, 5)
@@ -0,0 +1,58 @@
+import pytest
+from agents.knowledge_store import KnowledgeStore
+from agents.passage_retrieval import estimate_passage_tokens, select_passages, split_passages
+from agents.prompts.prompts import KnowledgeNugget
+from config.settings import settings
+from langchain_core.documents import Document
+
+
+@pytest.fixture(autouse=True)
+def small_passages(monkeypatch):
+    monkeypatch.setattr(settings, "PASSAGE_CHUNK_CHARS", 40)
+    monkeypatch.setattr(settings, "PASSAGE_CHUNK_OVERLAP", 0)
+
+
+def page(url, *paragraphs):
+    return Document(page_content="\n\n".join(paragraphs), metadata={"source": url})
+
+
+PAGES = [
+    page("https://a.example", "aspirin lowers fever quickly", "aspirin lowers fever in adults", "aspirin dosage for fever"),
+    page("https://b.example", "fever is common in children", "unrelated gardening advice here")
+]
+
+
+def test_repeated_passages_are_kept_once():
+    passages = split_passages([page("https://a.example", "shared menu text"), page("https://b.example", "shared  menu text")])
+
+    assert passages == [{"content": "shared menu text", "source_url": "https://a.example"}]
+
+
+def test_passages_are_capped_per_source(embeddings):
+    selected = select_passages(PAGES, ["aspirin fever"], token_budget=1000, max_per_source=2, embeddings=embeddings)
+
+    assert [passage["source_url"] for passage in selected].count("https://a.example") == 2
+    assert selected[0]["content"].startswith("aspirin")
+    assert [passage["score"] for passage in selected] == sorted((passage["score"] for passage in selected), reverse=True)
+
+
+def test_passages_fit_the_token_budget(embeddings):
+    budget = estimate_passage_tokens("aspirin lowers fever quickly") + estimate_passage_tokens("fever is common in children")
+
+    selected = select_passages(PAGES, ["aspirin fever"], token_budget=budget, max_per_source=10, embeddings=embeddings)
+    assert sum(estimate_passage_tokens(passage["content"]) for passage in selected) <= budget
+    assert len(selected) == 2
+
+
+def test_selected_passage_vectors_are_reused_for_retrieval(embeddings):
+    store = KnowledgeStore(embeddings)
+    store.add_many([
+        KnowledgeNugget(content="aspirin lowers fever", source_url="https://a.example"),
+        KnowledgeNugget(content="gardening in spring", source_url="https://c.example")
+    ])
+    selected = select_passages(PAGES, ["aspirin"], token_budget=1000, max_per_source=1, embeddings=embeddings)
+    embeddings.calls.clear()
+
+    related = store.retrieve([], k_per_query=1, query_vectors=[selected[0]["vector"]])
+    assert [nugget.content for nugget in related] == ["aspirin lowers fever"]
+    assert embeddings.calls == []
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+from utils.persistent_cache import PersistentCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PersistentCache(path=str(tmp_path / "cache.sqlite3"), table="entries", ttl_seconds=60, max_entries=10)
+    yield cache
+    cache.close()
+
+
+def age(cache, key, seconds):
+    cache._conn.execute(f"UPDATE {cache.table} SET created_at = ? WHERE key = ?", (time.time() - seconds, key))
+
+
+def touch(cache, key, accessed_at):
+    cache._conn.execute(f"UPDATE {cache.table} SET accessed_at = ? WHERE key = ?", (accessed_at, key))
+
+
+def test_values_round_trip(cache):
+    cache.set("key", {"answer": [1, 2]})
+    assert cache.get("key") == {"answer": [1, 2]}
+    assert cache.get("missing") is None
+
+
+def test_expired_entries_are_only_returned_as_stale(cache):
+    cache.set("key", "value")
+    age(cache, "key", 120)
+
+    assert cache.get("key") is None
+    assert cache.get("key", allow_stale=True) == "value"
+    value, entry_age = cache.get_entry("key")
+    assert value == "value" and entry_age >= 120
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for index in range(10):
+        cache.set(f"key{index}", index)
+        touch(cache, f"key{index}", index)
+    # Reading an entry makes it recently used
+    cache.get("key0")
+
+    for index in range(10, 12):
+        cache.set(f"key{index}", index)
+    assert len(cache) == 10
+    assert cache.get("key0") == 0
+    assert cache.get("key1") is None
+    assert cache.get("key11") == 11
+
+
+def test_eviction_waits_for_the_slack(cache):
+    for index in range(11):
+        cache.set(f"key{index}", index)
+    # One entry over max_entries is within the slack, so nothing is counted or evicted yet
+    assert len(cache) == 11
+
+    cache.set("key11", 11)
+    assert len(cache) == 10
+
+
+def test_batch_reads_and_writes(cache):
+    cache.set_many([("a", 1), ("b", 2)])
+    entries = cache.get_many_entries(["a", "b", "c"])
+    assert {key: value for key, (value, _) in entries.items()} == {"a": 1, "b": 2}
+
+
+def test_unreadable_entries_are_discarded(cache):
+    cache._conn.execute(
+        f"INSERT INTO {cache.table} (key, value, created_at, accessed_at) VALUES ('bad', 'not json', 0, 0)"
+    )
+    assert cache.get("bad") is None
+    assert len(cache) == 0
+
+
+def test_row_estimate_survives_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = PersistentCache(path=path, table="entries", ttl_seconds=60, max_entries=10)
+    first.set_many([(f"key{index}", index) for index in range(5)])
+    first.close()
+
+    reopened = PersistentCache(path=path, table="entries", ttl_seconds=60, max_entries=10)
+    assert reopened._row_estimate == 5
+    reopened.close()
+
+
+async def test_async_variants(cache):
+    await cache.aset("key", "value")
+    await cache.aset_many([("other", 1)])
+    assert await cache.aget("key") == "value"
+    assert (await cache.aget_entry("other"))[0] == 1
+    assert list(await cache.aget_many_entries(["key"])) == ["key"]
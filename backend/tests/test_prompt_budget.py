@@ -0,0 +1,66 @@
+from services.llm.prompt_budget import KEEP_WHOLE, TRUNCATION_MARKER, PromptBudget, PromptSection
+
+MODEL = "gpt-4o"
+
+
+def make_budget(max_prompt_tokens):
+    return PromptBudget(MODEL, max_prompt_tokens=max_prompt_tokens, reserved_output_tokens=0)
+
+
+def words(count, word="word"):
+    return " ".join(f"{word}{index}" for index in range(count))
+
+
+def test_sections_that_fit_are_untouched():
+    budget = make_budget(10_000)
+    sections = [PromptSection("system", "You are helpful"), PromptSection("context", words(50))]
+
+    prompt = budget.fit(sections)
+    assert prompt.sections == {"system": "You are helpful", "context": words(50)}
+    assert prompt.trimmed == []
+    assert not prompt.over_budget
+
+
+def test_lowest_priority_is_trimmed_first():
+    system, assets = words(100, "rule"), words(40, "asset")
+    budget = make_budget(make_budget(10_000).count(system + assets) + 100)
+
+    prompt = budget.fit([
+        PromptSection("system", system, priority=2, min_tokens=KEEP_WHOLE),
+        PromptSection("assets", assets, priority=1),
+        PromptSection("context", words(400), priority=0)
+    ])
+    assert prompt["system"] == system
+    assert prompt["assets"] == assets
+    assert prompt["context"].endswith(TRUNCATION_MARKER)
+    assert prompt.trimmed == ["context"]
+    assert not prompt.over_budget
+
+
+def test_truncation_keeps_the_requested_end():
+    budget = make_budget(50)
+
+    prompt = budget.fit([PromptSection("log", words(400), keep="end")])
+    assert prompt["log"].startswith(TRUNCATION_MARKER)
+    assert prompt["log"].endswith("word399")
+
+
+def test_history_loses_its_oldest_messages():
+    history = [{"role": "user" if index % 2 == 0 else "assistant", "content": words(20, f"m{index}_")} for index in range(20)]
+    budget = make_budget(make_budget(10_000).count(history[-5:]))
+
+    prompt = budget.fit([PromptSection("history", history)])
+    assert prompt["history"] == history[-len(prompt["history"]):]
+    assert 0 < len(prompt["history"]) < len(history)
+
+
+def test_sections_are_not_trimmed_below_min_tokens():
+    budget = make_budget(20)
+
+    prompt = budget.fit([
+        PromptSection("question", words(100), min_tokens=KEEP_WHOLE),
+        PromptSection("context", words(100), min_tokens=30)
+    ])
+    assert prompt["question"] == words(100)
+    assert prompt.section_tokens["context"] >= 30
+    assert prompt.over_budget
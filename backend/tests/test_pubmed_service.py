@@ -0,0 +1,149 @@
+import time
+from email.utils import formatdate
+
+import aiohttp
+import pytest
+from services.pubmed_service import PubMedArticleStore, PubMedService, PubMedXMLParser, _retry_after
+from utils.persistent_cache import PersistentCache
+
+EFETCH_XML = b"""<?xml version="1.0" ?>
+<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2024//EN" "https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">
+<PubmedArticleSet>
+  <PubmedArticle>
+    <MedlineCitation Status="MEDLINE" Owner="NLM">
+      <PMID Version="1">111</PMID>
+      <DateRevised><Year>2024</Year><Month>3</Month><Day>5</Day></DateRevised>
+      <Article PubModel="Print">
+        <Journal>
+          <Title>Journal of Tests</Title>
+          <JournalIssue><PubDate><Year>2023</Year><Month>11</Month></PubDate></JournalIssue>
+        </Journal>
+        <ArticleTitle>Effect of <i>X</i> on Y</ArticleTitle>
+        <Abstract>
+          <AbstractText Label="BACKGROUND" NlmCategory="BACKGROUND">Y is common.</AbstractText>
+          <AbstractText Label="METHODS" NlmCategory="METHODS">We gave <i>X</i> to
+            120 patients.</AbstractText>
+          <AbstractText Label="RESULTS" NlmCategory="RESULTS">Y fell by 10<sup>2</sup> units.</AbstractText>
+          <AbstractText Label="CONCLUSIONS" NlmCategory="CONCLUSIONS"></AbstractText>
+        </Abstract>
+      </Article>
+      <MeshHeadingList>
+        <MeshHeading><DescriptorName UI="D1">Humans</DescriptorName></MeshHeading>
+      </MeshHeadingList>
+    </MedlineCitation>
+  </PubmedArticle>
+  <PubmedArticle>
+    <MedlineCitation Status="In-Process" Owner="NLM">
+      <PMID Version="1">222</PMID>
+      <Article PubModel="Print">
+        <Journal>
+          <Title>Journal of Tests</Title>
+          <JournalIssue><PubDate><MedlineDate>1998 Dec-1999 Jan</MedlineDate></PubDate></JournalIssue>
+        </Journal>
+        <ArticleTitle>Unstructured</ArticleTitle>
+        <Abstract><AbstractText>One paragraph.</AbstractText></Abstract>
+      </Article>
+    </MedlineCitation>
+  </PubmedArticle>
+</PubmedArticleSet>
+"""
+
+
+def parse(data, chunk_size):
+    parser = PubMedXMLParser()
+    articles = []
+    for start in range(0, len(data), chunk_size):
+        articles += parser.feed(data[start:start + chunk_size])
+    return articles + parser.close()
+
+
+def test_multi_section_abstract():
+    article = parse(EFETCH_XML, len(EFETCH_XML))[0]
+
+    assert article["id"] == "111"
+    assert article["title"] == "Effect of X on Y"
+    assert article["abstract_sections"] == [
+        {"label": "BACKGROUND", "text": "Y is common."},
+        {"label": "METHODS", "text": "We gave X to 120 patients."},
+        {"label": "RESULTS", "text": "Y fell by 102 units."}
+    ]
+    assert article["abstract"] == (
+        "BACKGROUND: Y is common.\n\nMETHODS: We gave X to 120 patients.\n\nRESULTS: Y fell by 102 units."
+    )
+    assert article["publication_date"] == "2023-11"
+    assert article["revised_date"] == "2024-03-05"
+    assert article["mesh_terms"] == ["Humans"]
+    assert article["citation_status"] == "MEDLINE"
+
+
+def test_unstructured_abstract_and_free_form_date():
+    article = parse(EFETCH_XML, len(EFETCH_XML))[1]
+
+    assert article["abstract_sections"] == [{"label": None, "text": "One paragraph."}]
+    assert article["abstract"] == "One paragraph."
+    assert article["publication_date"] == "1998 Dec-1999 Jan"
+
+
+def test_articles_split_across_chunks():
+    assert parse(EFETCH_XML, 7) == parse(EFETCH_XML, len(EFETCH_XML))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PubMedArticleStore(PersistentCache(
+        path=str(tmp_path / "articles.sqlite3"), table="articles", ttl_seconds=3600, max_entries=100
+    ))
+
+
+def make_article(pmid, status="MEDLINE"):
+    return {"id": pmid, "title": f"Article {pmid}", "citation_status": status}
+
+
+def age(store, seconds):
+    store.cache._conn.execute(f"UPDATE {store.cache.table} SET created_at = ?", (time.time() - seconds,))
+
+
+async def test_store_keeps_indexed_articles_longer(store):
+    await store.aset_many([make_article("1"), make_article("2", status="In-Process")])
+    age(store, 2 * 24 * 3600)
+
+    assert list(await store.aget_many(["1", "2", "3"])) == ["1"]
+    assert sorted(await store.aget_many(["1", "2", "3"], allow_stale=True)) == ["1", "2"]
+
+
+async def test_only_uncached_articles_are_fetched(store):
+    await store.aset_many([make_article("1")])
+    service = PubMedService(article_store=store)
+    requests = []
+
+    async def fetch_chunk(session, params):
+        requests.append(params)
+        return [make_article("2")]
+
+    service._fetch_chunk = fetch_chunk
+    articles = await service._resolve_chunk(None, {"webenv": "env", "query_key": "1"}, 0, ["2", "1"])
+
+    assert [article["id"] for article in articles] == ["2", "1"]
+    assert requests == [{"id": "2"}]
+    assert list(await store.aget_many(["2"])) == ["2"]
+
+
+async def test_expired_articles_are_used_when_pubmed_fails(store):
+    await store.aset_many([make_article("1", status="In-Process")])
+    age(store, 2 * 24 * 3600)
+    service = PubMedService(article_store=store)
+
+    async def fetch_chunk(session, params):
+        raise aiohttp.ClientError("unavailable")
+
+    service._fetch_chunk = fetch_chunk
+    articles = await service._resolve_chunk(None, {}, 0, ["1"])
+    assert [article["id"] for article in articles] == ["1"]
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert _retry_after("3", default=1) == 3
+    assert _retry_after(formatdate(time.time() + 30, usegmt=True), default=1) == pytest.approx(30, abs=2)
+    assert _retry_after(formatdate(time.time() - 30, usegmt=True), default=1) == 0
+    assert _retry_after(None, default=4) == 4
+    assert _retry_after("soon", default=4) == 4
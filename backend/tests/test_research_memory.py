@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from config.settings import settings
+from models import Base, ResearchMemory as ResearchMemoryRow
+from services.research_memory import ResearchMemory
+
+QUESTION = "What lowers a fever?"
+
+
+@pytest.fixture
+def memory(embeddings, monkeypatch):
+    monkeypatch.setattr(settings, "RESEARCH_MEMORY_MIN_CONFIDENCE", 0.7)
+    monkeypatch.setattr(settings, "RESEARCH_MEMORY_SEED_SIMILARITY", 0.5)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[ResearchMemoryRow.__table__])
+    return ResearchMemory(session_factory=sessionmaker(bind=engine), embeddings=embeddings)
+
+
+def nugget(content, confidence=0.9, conflicts_with=None):
+    return {"content": content, "source_url": "https://example.com", "confidence": confidence,
+            "conflicts_with": conflicts_with or []}
+
+
+def age(memory, memory_id, seconds):
+    with memory.session_factory() as db:
+        db.query(ResearchMemoryRow).filter(ResearchMemoryRow.memory_id == memory_id).update(
+            {"created_at": datetime.utcnow() - timedelta(seconds=seconds)}
+        )
+        db.commit()
+
+
+def test_only_vetted_nuggets_are_remembered(memory):
+    memory_id = memory.remember(QUESTION, "Aspirin.", [], [
+        nugget("Aspirin lowers fever"), nugget("Guess", confidence=0.3), nugget("Disputed", conflicts_with=["K1"])
+    ], queries=["fever medicine"])
+
+    recalled, = memory.recall(QUESTION)
+    assert recalled.memory_id == memory_id
+    assert [item["content"] for item in recalled.nuggets] == ["Aspirin lowers fever"]
+    assert memory.remember("Unanswered", None, [], [nugget("Guess", confidence=0.3)], queries=[]) is None
+
+
+def test_answers_are_reused_for_nearly_identical_questions_only(memory):
+    memory.remember(QUESTION, "Aspirin.", [], [], queries=[])
+
+    assert memory.reusable_answer("what lowers a FEVER").answer == "Aspirin."
+    assert memory.reusable_answer("What lowers a fever in adults?") is None
+
+
+def test_expired_or_failed_answers_are_not_reused(memory):
+    old = memory.remember(QUESTION, "Aspirin.", [], [], queries=[])
+    age(memory, old, settings.RESEARCH_MEMORY_ANSWER_TTL_SECONDS + 60)
+    assert memory.reusable_answer(QUESTION) is None
+
+    memory.remember(QUESTION, None, [], [nugget("Aspirin lowers fever")], queries=[])
+    assert memory.reusable_answer(QUESTION) is None
+    memory.remember(QUESTION, "Paracetamol.", [], [], queries=[])
+    assert memory.reusable_answer(QUESTION).answer == "Paracetamol."
+
+
+def test_seed_merges_similar_sessions_without_repeats(memory):
+    memory.remember(QUESTION, None, [], [nugget("Aspirin lowers fever")], queries=["fever medicine"])
+    memory.remember("What lowers a fever in adults?", None, [],
+                    [nugget("Aspirin lowers fever"), nugget("Rest helps")], queries=["fever medicine", "adult fever"])
+    memory.remember("How do tides work?", None, [], [nugget("The moon pulls the sea")], queries=["tides"])
+
+    nuggets, queries = memory.seed(QUESTION)
+    assert [item["content"] for item in nuggets] == ["Aspirin lowers fever", "Rest helps"]
+    assert queries == ["fever medicine", "adult fever"]
+
+
+def test_pruning_keeps_the_index_in_step_with_the_database(memory, monkeypatch):
+    monkeypatch.setattr(settings, "RESEARCH_MEMORY_MAX_ENTRIES", 2)
+    first = memory.remember(QUESTION, "Aspirin.", [], [], queries=[])
+    memory.recall(QUESTION)
+    memory.remember("How do tides work?", "The moon.", [], [], queries=[])
+    memory.remember("Why is the sky blue?", "Scattering.", [], [], queries=[])
+
+    assert memory.reusable_answer(QUESTION) is None
+    assert memory._index.ntotal == 2
+    assert first not in [recalled.memory_id for recalled in memory.recall(QUESTION, k=5)]
+    with memory.session_factory() as db:
+        assert db.query(ResearchMemoryRow).count() == 2
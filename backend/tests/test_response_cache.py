@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.outputs import Generation
+from services.llm.response_cache import LangChainResponseCache, LLMResponseCache
+from utils.metrics import metrics
+from utils.persistent_cache import PersistentCache
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    return LLMResponseCache(
+        PersistentCache(path=str(tmp_path / "llm.sqlite3"), table="responses", ttl_seconds=60, max_entries=10)
+    )
+
+
+def test_keys_cover_every_request_parameter(response_cache):
+    key = response_cache.make_key("openai", "gpt-4o", MESSAGES, system="Be brief", max_tokens=100, temperature=0)
+
+    assert key == response_cache.make_key("openai", "gpt-4o", MESSAGES, system="Be brief", max_tokens=100, temperature=0)
+    assert key != response_cache.make_key("anthropic", "gpt-4o", MESSAGES, system="Be brief", max_tokens=100, temperature=0)
+    assert key != response_cache.make_key("openai", "gpt-4o-mini", MESSAGES, system="Be brief", max_tokens=100, temperature=0)
+    assert key != response_cache.make_key("openai", "gpt-4o", MESSAGES, system="Be brief", max_tokens=100, temperature=0.7)
+    assert key != response_cache.make_key("openai", "gpt-4o", MESSAGES, system=None, max_tokens=100, temperature=0)
+
+
+async def test_hits_and_misses_are_counted(response_cache):
+    key = response_cache.make_key("openai", "gpt-4o", MESSAGES)
+    misses = metrics.get_counter("llm_cache_misses", provider="test")
+    hits = metrics.get_counter("llm_cache_hits", provider="test")
+
+    assert await response_cache.aget(key, provider="test") is None
+    await response_cache.aset(key, "Hi there")
+    assert await response_cache.aget(key, provider="test") == "Hi there"
+
+    assert metrics.get_counter("llm_cache_misses", provider="test") == misses + 1
+    assert metrics.get_counter("llm_cache_hits", provider="test") == hits + 1
+
+
+def test_backend_failures_are_treated_as_misses(response_cache):
+    response_cache.backend.close()
+
+    response_cache.set("key", "value")
+    assert response_cache.get("key") is None
+
+
+def test_langchain_adapter_round_trips_generations(response_cache):
+    adapter = LangChainResponseCache(response_cache)
+
+    assert adapter.lookup("prompt", "llm-config") is None
+    adapter.update("prompt", "llm-config", [Generation(text="answer")])
+    assert [generation.text for generation in adapter.lookup("prompt", "llm-config")] == ["answer"]
+    assert adapter.lookup("prompt", "other-llm-config") is None
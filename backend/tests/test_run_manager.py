@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from config.settings import settings
+from pydantic import BaseModel
+from services import run_manager as run_manager_module
+from services.run_manager import RunEventsExpiredError, RunManager
+from services.stream_encoder import encode_event
+from utils.persistent_cache import PersistentCache
+
+
+@pytest.fixture(autouse=True)
+def short_timers(monkeypatch):
+    monkeypatch.setattr(settings, "RUN_DISCONNECT_GRACE_SECONDS", 0.05)
+    monkeypatch.setattr(run_manager_module, "UNCLAIMED_RUN_SECONDS", 0.05)
+
+
+def graph_stream(chunks, started=None, cancelled=None):
+    async def stream(run):
+        if started is not None:
+            started.set()
+        try:
+            for chunk in chunks:
+                yield chunk
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.set()
+            raise
+    return stream
+
+
+async def read(manager, run, count, after_id=0):
+    events = []
+    async for event in manager.events(run, after_id=after_id):
+        events.append(event)
+        if len(events) == count:
+            break
+    return events
+
+
+async def test_cancel_interrupts_the_run():
+    manager = RunManager()
+    started, cancelled = asyncio.Event(), asyncio.Event()
+    run = manager.start("bot", graph_stream([], started, cancelled))
+    await started.wait()
+
+    assert manager.cancel(run.run_id, reason="user_request")
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert manager.is_cancelled(run.run_id)
+    assert not manager.cancel(run.run_id)
+
+
+async def test_unclaimed_run_is_cancelled():
+    manager = RunManager()
+    cancelled = asyncio.Event()
+    run = manager.start("bot", graph_stream([], cancelled=cancelled))
+
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert run.cancel_reason == "client_disconnected"
+
+
+async def test_run_survives_reconnect_within_grace_period():
+    manager = RunManager()
+    run = manager.start("bot", graph_stream([{"token": "a"}, {"token": "b"}]))
+
+    assert await read(manager, run, 1) == [(1, {"token": "a"})]
+    # The first client went away; a reconnect replays what it missed
+    assert await read(manager, run, 1, after_id=1) == [(2, {"token": "b"})]
+    assert not run.cancelled
+
+    await asyncio.sleep(0.1)
+    assert run.cancelled
+
+
+async def test_events_end_when_the_run_completes():
+    manager = RunManager()
+
+    async def stream(run):
+        yield {"token": "done"}
+
+    run = manager.start("bot", stream)
+    events = [event async for event in manager.events(run)]
+    assert events == [(1, {"token": "done"})]
+    assert run.status == "completed"
+
+
+class Source(BaseModel):
+    title: str
+
+
+@pytest.fixture
+def spilling_manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RUN_REPLAY_BUFFER_EVENTS", 2)
+    return RunManager(spill=PersistentCache(
+        path=str(tmp_path / "events.sqlite3"), table="run_events", ttl_seconds=60, max_entries=100
+    ))
+
+
+async def test_spilled_events_replay_as_they_were_sent(spilling_manager):
+    chunks = [{"sources": [Source(title="A")]}, {"token": "b"}, {"token": "c"}, {"token": "d"}]
+    run = spilling_manager.start("bot", graph_stream(chunks))
+
+    live = await read(spilling_manager, run, 4)
+    assert [event[0] for event in run.buffer] == [3, 4]
+    replayed = await read(spilling_manager, run, 4)
+    assert [encode_event(chunk) for _, chunk in replayed] == [encode_event(chunk) for _, chunk in live]
+    assert replayed[0][1] == {"sources": [{"title": "A"}]}
+    spilling_manager.cancel(run.run_id)
+    await asyncio.gather(run.task, return_exceptions=True)
+
+
+async def test_events_that_were_not_spilled_have_expired(monkeypatch):
+    monkeypatch.setattr(settings, "RUN_REPLAY_BUFFER_EVENTS", 1)
+    manager = RunManager()
+    run = manager.start("bot", graph_stream([{"token": "a"}, {"token": "b"}]))
+    await read(manager, run, 1, after_id=1)
+
+    with pytest.raises(RunEventsExpiredError):
+        await read(manager, run, 1)
+    manager.cancel(run.run_id)
+    await asyncio.gather(run.task, return_exceptions=True)
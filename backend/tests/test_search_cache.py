@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import pytest
+from config.settings import settings
+from services.llm.scheduler import llm_call_context
+from services.search_cache import SearchQuota, SearchQuotaExceededError, SearchResultCache
+from utils.persistent_cache import PersistentCache
+
+RESULTS = [{"title": "Result", "link": "https://example.com"}]
+
+
+@pytest.fixture
+def search_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "SEARCH_CACHE_TTL_SECONDS", 3600)
+    monkeypatch.setattr(settings, "SEARCH_DAILY_QUOTAS", {"google": 10})
+    monkeypatch.setattr(settings, "SEARCH_USER_DAILY_QUOTA", 0)
+    monkeypatch.setattr(settings, "SEARCH_QUOTA_RESERVE", 0.2)
+    path = str(tmp_path / "search.sqlite3")
+    return SearchResultCache(
+        cache=PersistentCache(path=path, table="results", ttl_seconds=3600, max_entries=100),
+        quota=SearchQuota(PersistentCache(path=path, table="quota", ttl_seconds=3600, max_entries=100))
+    )
+
+
+def counting_search(calls, results=RESULTS):
+    async def search():
+        calls.append(1)
+        return results
+    return search
+
+
+async def failing_search():
+    raise ConnectionError("provider unavailable")
+
+
+def expire(search_cache):
+    search_cache.cache._conn.execute(f"UPDATE {search_cache.cache.table} SET created_at = ?", (time.time() - 7200,))
+
+
+def use_quota(search_cache, requests, user_id="alice"):
+    for _ in range(requests):
+        assert search_cache.quota.try_charge("google", user_id) is None
+
+
+async def test_fresh_results_are_reused_without_charging(search_cache):
+    calls = []
+    for _ in range(2):
+        assert await search_cache.get_or_search("google", "Python  Tips", {}, counting_search(calls), user_id="alice") == RESULTS
+    # Queries that normalize to the same search share the entry
+    assert await search_cache.get_or_search("google", "python tips", {}, counting_search(calls), user_id="alice") == RESULTS
+
+    assert len(calls) == 1
+    assert search_cache.quota.used("google") == 1
+    assert search_cache.quota.used_by("alice") == 1
+
+
+async def test_expired_results_are_served_when_the_request_fails(search_cache):
+    await search_cache.get_or_search("google", "query", {}, counting_search([]), user_id="alice")
+    expire(search_cache)
+
+    assert await search_cache.get_or_search("google", "query", {}, failing_search, user_id="alice") == RESULTS
+    with pytest.raises(ConnectionError):
+        await search_cache.get_or_search("google", "other", {}, failing_search, user_id="alice")
+
+
+async def test_expired_results_are_served_near_the_quota(search_cache):
+    await search_cache.get_or_search("google", "query", {}, counting_search([]), user_id="alice")
+    expire(search_cache)
+    use_quota(search_cache, 7)
+
+    calls = []
+    assert await search_cache.get_or_search("google", "query", {}, counting_search(calls), user_id="alice") == RESULTS
+    assert calls == []
+    # Queries with nothing cached may still use the reserve
+    await search_cache.get_or_search("google", "new query", {}, counting_search(calls), user_id="alice")
+    assert calls == [1]
+
+
+async def test_requests_fail_once_the_quota_is_used_up(search_cache):
+    use_quota(search_cache, 10)
+
+    with pytest.raises(SearchQuotaExceededError) as exceeded:
+        await search_cache.get_or_search("google", "query", {}, counting_search([]), user_id="alice")
+    assert exceeded.value.scope == "global"
+
+
+async def test_user_quota(search_cache, monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_USER_DAILY_QUOTA", 2)
+    use_quota(search_cache, 2, user_id="alice")
+
+    with pytest.raises(SearchQuotaExceededError) as exceeded:
+        await search_cache.get_or_search("google", "query", {}, counting_search([]), user_id="alice")
+    assert exceeded.value.scope == "user"
+    assert await search_cache.get_or_search("google", "query", {}, counting_search([]), user_id="bob") == RESULTS
+
+
+async def test_concurrent_misses_do_not_overshoot_the_quota(search_cache):
+    use_quota(search_cache, 7)
+    gate, calls = asyncio.Event(), []
+
+    async def search():
+        calls.append(1)
+        await gate.wait()
+        return RESULTS
+
+    searches = [
+        asyncio.create_task(search_cache.get_or_search("google", f"query {index}", {}, search, user_id="alice"))
+        for index in range(6)
+    ]
+    await asyncio.sleep(0)
+    gate.set()
+    results = await asyncio.gather(*searches, return_exceptions=True)
+
+    assert len(calls) == 3
+    assert sum(isinstance(result, SearchQuotaExceededError) for result in results) == 3
+    assert search_cache.quota.used("google") == 10
+
+
+async def test_requests_are_charged_to_the_user_of_the_call_context(search_cache):
+    with llm_call_context(user_id="carol"):
+        await search_cache.get_or_search("google", "query", {}, counting_search([]))
+
+    assert search_cache.quota.used_by("carol") == 1
@@ -0,0 +1,74 @@
+import pytest
+from config.settings import settings
+from services.search_ranking import RankedResult, arank_results, is_confident, normalize_url, rank_results
+
+
+@pytest.fixture(autouse=True)
+def ranking_settings(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_RANK_QUESTION_WEIGHT", 0.5)
+    monkeypatch.setattr(settings, "SEARCH_RANK_DUPLICATE_SIMILARITY", 0.95)
+    monkeypatch.setattr(settings, "SEARCH_RANK_MAX_PER_DOMAIN", 2)
+
+
+def result(link, title, snippet=""):
+    return {"link": link, "title": title, "snippet": snippet}
+
+
+def test_normalize_url():
+    assert normalize_url("HTTPS://www.Example.com/Page/?utm=1#top") == "example.com/page"
+    assert normalize_url("http://example.com/page") == normalize_url("https://www.example.com/page/")
+
+
+def test_results_are_ranked_by_similarity_to_the_question(embeddings):
+    ranked = rank_results([
+        result("https://a.example/tides", "How tides work"),
+        result("https://b.example/fever", "What lowers a fever", "aspirin and rest"),
+        result("https://c.example/fever", "Fever in children")
+    ], "what lowers a fever", embeddings=embeddings)
+
+    assert [item.url for item in ranked] == ["https://b.example/fever", "https://c.example/fever", "https://a.example/tides"]
+    assert ranked[0].relevance_score == round(ranked[0].score * 100, 1)
+
+
+def test_requirements_lift_results_that_cover_them(embeddings):
+    results = [result("https://a.example/dose", "Fever aspirin dosage"), result("https://b.example/cause", "Fever causes")]
+
+    assert rank_results(results, "fever", requirements=["causes"], embeddings=embeddings)[0].url == "https://b.example/cause"
+    assert rank_results(results, "fever", requirements=["dosage", ""], embeddings=embeddings)[0].url == "https://a.example/dose"
+
+
+def test_repeated_urls_and_near_duplicates_are_dropped(embeddings):
+    ranked = rank_results([
+        result("https://a.example/fever", "What lowers a fever"),
+        result("https://www.a.example/fever/", "Lowering fever at home"),
+        result("https://mirror.example/copy", "What lowers a fever"),
+        result("https://c.example/other", "Fever and rest")
+    ], "what lowers a fever", embeddings=embeddings)
+
+    assert [item.url for item in ranked] == ["https://a.example/fever", "https://c.example/other"]
+
+
+def test_results_per_domain_are_capped(embeddings):
+    results = [result(f"https://a.example/{index}", f"fever page {index}") for index in range(4)]
+    results.append(result("https://b.example/1", "fever elsewhere"))
+
+    ranked = rank_results(results, "fever", max_per_domain=1, embeddings=embeddings)
+    assert sorted(item.url.split("/")[2] for item in ranked) == ["a.example", "b.example"]
+    assert len(rank_results(results, "fever", embeddings=embeddings)) == 3
+
+
+async def test_placeholder_results_are_ignored(embeddings):
+    results = ["No results found", {"title": "No link"}, None, result("https://a.example/fever", "fever")]
+
+    ranked = await arank_results(results, "fever", embeddings=embeddings)
+    assert [item.url for item in ranked] == ["https://a.example/fever"]
+    assert await arank_results(["No results found"], "fever", embeddings=embeddings) == []
+
+
+def test_is_confident(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_RANK_CONFIDENT_SCORE", 0.6)
+    ranked = [RankedResult(result={}, url=f"https://{index}.example", score=score) for index, score in enumerate((0.9, 0.7, 0.4))]
+
+    assert is_confident(ranked, count=2)
+    assert not is_confident(ranked, count=3)
+    assert not is_confident(ranked[:1], count=2)
@@ -0,0 +1,74 @@
+import pytest
+from schemas import URLContent
+from services import search_service
+
+
+def google_result(link, title="Result"):
+    return {"title": title, "link": link, "snippet": "", "displayLink": None, "pagemap": None}
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Google search stand-in answering from a dict of query -> links (or an exception)"""
+    responses, calls = {}, []
+
+    async def google_search(query, num_results, user_id=None):
+        calls.append(query)
+        response = responses[" ".join(query.lower().split())]
+        if isinstance(response, Exception):
+            raise response
+        return [google_result(link) for link in response]
+
+    monkeypatch.setattr(search_service, "google_search", google_search)
+    return responses, calls
+
+
+async def test_queries_that_normalize_alike_are_searched_once(searches):
+    responses, calls = searches
+    responses["python tips"] = ["https://a.example/1"]
+
+    batch = await search_service.batch_search(None, ["Python  tips", "python tips"])
+    assert calls == ["Python  tips"]
+    assert [search.query for search in batch.searches] == ["Python  tips", "python tips"]
+    assert batch.searches[1].results == batch.searches[0].results
+    assert [result.link for result in batch.unique_results] == ["https://a.example/1"]
+
+
+async def test_results_are_merged_by_canonical_url_at_their_best_rank(searches):
+    responses, _ = searches
+    responses["first"] = ["https://a.example/1", "https://www.b.example/2/"]
+    responses["second"] = ["http://b.example/2", "https://c.example/3"]
+
+    batch = await search_service.batch_search(None, ["first", "second"])
+    assert [result.link for result in batch.unique_results] == [
+        "https://a.example/1", "https://www.b.example/2/", "https://c.example/3"
+    ]
+    assert batch.unique_results[1].queries == ["first", "second"]
+
+
+async def test_failed_queries_are_reported_per_query(searches):
+    responses, _ = searches
+    responses["works"] = ["https://a.example/1"]
+    responses["fails"] = ConnectionError("quota exceeded")
+
+    batch = await search_service.batch_search(None, ["works", "fails"])
+    assert batch.searches[0].error is None
+    assert batch.searches[1].results == []
+    assert "quota exceeded" in batch.searches[1].error
+    assert [result.link for result in batch.unique_results] == ["https://a.example/1"]
+
+
+async def test_top_unique_results_are_fetched(searches, monkeypatch):
+    responses, _ = searches
+    responses["query"] = ["https://a.example/1", "https://a.example/1#top", "https://b.example/2", "https://c.example/3"]
+    fetched = []
+
+    async def fetch_urls_content(urls):
+        fetched.extend(urls)
+        return [URLContent(url=url, title="", text="page") for url in urls]
+
+    monkeypatch.setattr(search_service, "fetch_urls_content", fetch_urls_content)
+    batch = await search_service.batch_search(None, ["query"], fetch_top_n=2)
+    assert fetched == ["https://a.example/1", "https://b.example/2"]
+    assert [content.url for content in batch.contents] == fetched
+    assert (await search_service.batch_search(None, ["query"])).contents == []
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from utils.singleflight import SingleFlight, make_flight_key
+
+
+def make_call(calls, gate, result="result"):
+    async def call():
+        calls.append(1)
+        await gate.wait()
+        return result
+    return call
+
+
+async def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    calls, gate = [], asyncio.Event()
+
+    callers = [asyncio.create_task(flight.do("key", make_call(calls, gate))) for _ in range(5)]
+    await asyncio.sleep(0)
+    gate.set()
+
+    assert await asyncio.gather(*callers) == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+async def test_later_calls_go_upstream_again():
+    flight = SingleFlight("test")
+    calls, gate = [], asyncio.Event()
+    gate.set()
+
+    await flight.do("key", make_call(calls, gate))
+    await flight.do("key", make_call(calls, gate))
+    assert len(calls) == 2
+
+
+async def test_errors_reach_every_caller():
+    flight = SingleFlight("test")
+    gate = asyncio.Event()
+
+    async def fail():
+        await gate.wait()
+        raise ValueError("upstream failed")
+
+    callers = [asyncio.create_task(flight.do("key", fail)) for _ in range(3)]
+    await asyncio.sleep(0)
+    gate.set()
+
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+async def test_cancelled_caller_does_not_cancel_shared_call():
+    flight = SingleFlight("test")
+    calls, gate = [], asyncio.Event()
+
+    first = asyncio.create_task(flight.do("key", make_call(calls, gate)))
+    second = asyncio.create_task(flight.do("key", make_call(calls, gate)))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    gate.set()
+
+    assert await second == "result"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert len(calls) == 1
+
+
+async def test_upstream_call_cancelled_when_last_caller_leaves():
+    flight = SingleFlight("test")
+    upstream_cancelled = asyncio.Event()
+
+    async def hang():
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            upstream_cancelled.set()
+            raise
+
+    callers = [asyncio.create_task(flight.do("key", hang)) for _ in range(2)]
+    await asyncio.sleep(0)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert upstream_cancelled.is_set()
+    assert flight.in_flight() == 0
+
+
+def test_flight_key_ignores_dict_order():
+    assert make_flight_key("q", {"a": 1, "b": 2}) == make_flight_key("q", {"b": 2, "a": 1})
+    assert make_flight_key("q", 1) != make_flight_key("q", 2)
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+from services.stream_encoder import coalesce_tokens, encode_event
+
+
+def delta(text, field="answer"):
+    return {"token_delta": text, "field": field}
+
+
+def source(chunks, then=None):
+    """Stream of chunks, followed by an error or a wait that never ends"""
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+        if isinstance(then, Exception):
+            raise then
+        if then == "hang":
+            await asyncio.Event().wait()
+    return stream()
+
+
+async def collect(stream, count=None):
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+        if len(chunks) == count:
+            break
+    return chunks
+
+
+async def test_deltas_are_merged_until_the_stream_ends():
+    chunks = [{"status": "routing"}, delta("Hel"), delta("lo"), {"token": "Hello"}]
+
+    assert await collect(coalesce_tokens(source(chunks), window_seconds=10)) == [
+        {"status": "routing"}, delta("Hello"), {"token": "Hello"}
+    ]
+
+
+async def test_held_back_deltas_are_sent_when_the_window_passes():
+    coalesced = coalesce_tokens(source([delta("a"), delta("b")], then="hang"), window_seconds=0.01)
+
+    assert await asyncio.wait_for(collect(coalesced, count=1), 1) == [delta("ab")]
+    await coalesced.aclose()
+
+
+async def test_deltas_are_sent_once_max_chars_are_buffered():
+    chunks = [delta("abc"), delta("def"), delta("g")]
+
+    assert await collect(coalesce_tokens(source(chunks), window_seconds=10, max_chars=5)) == [delta("abcdef"), delta("g")]
+
+
+async def test_deltas_of_different_fields_are_not_merged():
+    chunks = [delta("a", "thought"), delta("b", "thought"), delta("c"), delta("", "thought")]
+
+    assert await collect(coalesce_tokens(source(chunks), window_seconds=10)) == [delta("ab", "thought"), delta("c")]
+
+
+async def test_errors_are_raised_after_the_buffered_text():
+    coalesced = coalesce_tokens(source([delta("a")], then=ConnectionError("model failed")), window_seconds=10)
+
+    assert await coalesced.__anext__() == delta("a")
+    with pytest.raises(ConnectionError):
+        await coalesced.__anext__()
+
+
+async def test_source_is_stopped_when_the_consumer_stops():
+    stopped = asyncio.Event()
+
+    async def stream():
+        try:
+            yield {"status": "routing"}
+            await asyncio.Event().wait()
+        finally:
+            stopped.set()
+
+    coalesced = coalesce_tokens(stream(), window_seconds=10)
+    assert await coalesced.__anext__() == {"status": "routing"}
+    await coalesced.aclose()
+    await asyncio.wait_for(stopped.wait(), 1)
+
+
+async def test_zero_window_passes_chunks_through():
+    chunks = [delta("a"), delta("b")]
+
+    assert await collect(coalesce_tokens(source(chunks), window_seconds=0)) == chunks
+
+
+class Source(BaseModel):
+    title: str
+
+
+def test_encode_event_handles_models_and_non_string_keys():
+    assert encode_event({"sources": [Source(title="A")], 1: "one"}) == '{"sources":[{"title":"A"}],"1":"one"}'
@@ -0,0 +1,59 @@
+import pytest
+from services.llm.streaming_json import StreamingJSONParser, parse_json_response
+
+TOOL_RESPONSE = '```json\n{"type": "tool", "tool": {"name": "search", "parameters": {"query": "line one\nline two", "num_results": 5}}}\n```'
+
+
+def feed_in_chunks(parser, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1000])
+def test_parses_fenced_response_with_raw_newlines(chunk_size):
+    parser = StreamingJSONParser()
+    feed_in_chunks(parser, TOOL_RESPONSE, chunk_size)
+    assert parser.close() == {
+        "type": "tool",
+        "tool": {"name": "search", "parameters": {"query": "line one\nline two", "num_results": 5}}
+    }
+
+
+def test_emits_fields_before_document_completes():
+    parser = StreamingJSONParser()
+    events = parser.feed('{"type": "tool", "tool": {"name": "search", "parameters": {}}, "note": "unfin')
+
+    completed = [event.path for event in events if event.type == "field"]
+    assert ("type",) in completed
+    assert ("tool",) in completed
+    assert not parser.done
+    assert parser.partial["note"] == "unfin"
+
+
+def test_streams_text_deltas():
+    parser = StreamingJSONParser()
+    events = feed_in_chunks(parser, '{"response": "Hello, \\"world\\""}', 3)
+    deltas = "".join(event.value for event in events if event.type == "text_delta")
+    assert deltas == 'Hello, "world"'
+
+
+def test_incomplete_response_raises():
+    with pytest.raises(ValueError):
+        parse_json_response('{"type": "final_response", "response": "cut off')
+
+
+@pytest.mark.parametrize("response", ['{"a": [1,2,],}', "{'a': 1}", '{"a": 1 "b": 2}'])
+def test_try_feed_stops_on_malformed_output(response):
+    parser = StreamingJSONParser()
+    with pytest.raises(ValueError):
+        feed_in_chunks(parser, response, 1000)
+
+    parser = StreamingJSONParser()
+    for i in range(len(response)):
+        parser.try_feed(response[i])
+    assert parser.error is not None
+    assert parser.try_feed('"more"') == []
+    with pytest.raises(ValueError):
+        parser.close()
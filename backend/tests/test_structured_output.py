@@ -0,0 +1,104 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from pydantic import BaseModel
+from services.ai_service import AIService
+from services.llm.structured_output import REPAIR_SYSTEM_PROMPT, StructuredOutputError, ainvoke_structured, invoke_structured
+from utils.metrics import metrics
+
+PROMPT = [HumanMessage(content="Name a colour")]
+
+
+class Colour(BaseModel):
+    name: str
+
+
+def valid(name="red"):
+    return {"raw": AIMessage(content="", tool_calls=[{"name": "Colour", "args": {"name": name}, "id": "1"}]),
+            "parsed": Colour(name=name), "parsing_error": None}
+
+
+def invalid(error="name: field required"):
+    return {"raw": AIMessage(content="", tool_calls=[{"name": "Colour", "args": {"colour": "red"}, "id": "1"}]),
+            "parsed": None, "parsing_error": ValueError(error)}
+
+
+class FakeChatModel:
+    """Answers each structured call with the next scripted result"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.requests = []
+
+    def with_structured_output(self, schema, method, include_raw):
+        return self
+
+    def invoke(self, messages):
+        self.requests.append(messages)
+        return self.results.pop(0)
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+
+def test_valid_output_is_returned():
+    llm = FakeChatModel(valid())
+
+    assert invoke_structured(llm, PROMPT, Colour, name="colour") == Colour(name="red")
+    assert llm.requests == [PROMPT]
+
+
+async def test_invalid_output_is_repaired_from_the_error_only():
+    llm = FakeChatModel(invalid(), valid("blue"))
+    repairs = metrics.get_counter("structured_output_repairs", call_site="colour_repair", outcome="ok")
+
+    assert await ainvoke_structured(llm, PROMPT, Colour, name="colour_repair") == Colour(name="blue")
+    system, repair = llm.requests[1]
+    assert system.content == REPAIR_SYSTEM_PROMPT
+    assert '{"colour": "red"}' in repair.content
+    assert "name: field required" in repair.content
+    # The original prompt is not sent again
+    assert "Name a colour" not in repair.content
+    assert metrics.get_counter("structured_output_repairs", call_site="colour_repair", outcome="ok") == repairs + 1
+
+
+@pytest.mark.parametrize("max_repairs", [0, 2])
+def test_output_that_stays_invalid_raises(max_repairs):
+    llm = FakeChatModel(*[invalid()] * (max_repairs + 1))
+
+    with pytest.raises(StructuredOutputError) as raised:
+        invoke_structured(llm, PROMPT, Colour, name="colour", max_repairs=max_repairs)
+    assert raised.value.raw_output == '{"colour": "red"}'
+    assert len(llm.requests) == max_repairs + 1
+
+
+class FakeProvider:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.requests = []
+
+    async def create_structured_completion(self, messages, schema, name, description, model, max_tokens, system):
+        self.requests.append((messages, system))
+        return self.results.pop(0)
+
+
+class FakeRouter:
+    def __init__(self, provider):
+        self.provider = provider
+
+    async def call(self, call_site, create, model=None):
+        return await create(self.provider, model)
+
+
+async def test_send_structured_repairs_with_the_shared_steps():
+    schema = {"type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]}
+    provider = FakeProvider({"colour": "red"}, {"name": "blue"})
+    service = AIService()
+    service.router = FakeRouter(provider)
+    failures = metrics.get_counter("structured_output_parse_failures", call_site="send_colour")
+
+    result = await service.send_structured([{"role": "user", "content": "Name a colour"}], schema, name="send_colour")
+    assert result == {"name": "blue"}
+    messages, system = provider.requests[1]
+    assert system == REPAIR_SYSTEM_PROMPT
+    assert '{"colour": "red"}' in messages[0]["content"]
+    assert metrics.get_counter("structured_output_parse_failures", call_site="send_colour") == failures + 1
@@ -0,0 +1,91 @@
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Deque, Dict, Tuple
+
+SUMMARY_WINDOW = 1000  # Number of recent observations kept per summary for quantiles
+
+
+def _metric_key(name: str, labels: Dict[str, Any]) -> str:
+    """Build a Prometheus-style key such as llm_cache_hits{provider=openai}"""
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{label_str}}}"
+
+
+class MetricsRegistry:
+    """
+    In-process metrics registry with counters, gauges and summaries.
+
+    Example:
+        metrics.increment("llm_cache_hits", provider="anthropic")
+        metrics.observe("llm_queue_wait_ms", 12.5, priority="interactive")
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, Tuple[int, float, Deque[float]]] = {}
+        self._lock = Lock()
+        self._started_at = time.time()
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Increment a counter"""
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """Set a gauge to the given value"""
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record an observation in a summary"""
+        key = _metric_key(name, labels)
+        with self._lock:
+            count, total, window = self._summaries.get(key, (0, 0.0, deque(maxlen=SUMMARY_WINDOW)))
+            window.append(value)
+            self._summaries[key] = (count + 1, total + value, window)
+
+    def get_counter(self, name: str, **labels: Any) -> float:
+        """Return the current value of a counter"""
+        with self._lock:
+            return self._counters.get(_metric_key(name, labels), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics as a JSON-serializable dictionary"""
+        with self._lock:
+            summaries = {}
+            for key, (count, total, window) in self._summaries.items():
+                ordered = sorted(window)
+                summaries[key] = {
+                    "count": count,
+                    "sum": total,
+                    "avg": total / count if count else 0.0,
+                    "p50": self._quantile(ordered, 0.50),
+                    "p95": self._quantile(ordered, 0.95),
+                    "p99": self._quantile(ordered, 0.99),
+                    "max": ordered[-1] if ordered else 0.0
+                }
+            return {
+                "uptime_seconds": time.time() - self._started_at,
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": summaries
+            }
+
+    @staticmethod
+    def _quantile(ordered: list, q: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+
+# Create a singleton instance
+metrics = MetricsRegistry()
+
+__all__ = ['metrics', 'MetricsRegistry']
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVICTION_SLACK = 0.1  # Evict down to max_entries once the table exceeds it by this fraction
+BATCH_SIZE = 500  # Keys per statement in batch reads (SQLite caps bound parameters)
+
+
+class PersistentCache:
+    """
+    Local SQLite-backed key/value cache with TTL expiry and size-bounded LRU eviction.
+
+    Values must be JSON-serializable. Each cache instance uses its own table so
+    several caches can share one database file.
+
+    Calls block on SQLite; async code should use the a* variants, which run
+    them in a worker thread.
+    """
+
+    def __init__(self, path: str, table: str, ttl_seconds: int, max_entries: int):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed ON {table} (accessed_at)")
+        # Upper bound of the row count (replaced keys count as new rows), so
+        # writes only count the table once it may have outgrown max_entries
+        self._row_estimate = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        logger.info("PersistentCache '%s' opened at %s (ttl=%ss, max_entries=%d)", table, path, ttl_seconds, max_entries)
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        """
+        Return the cached value for a key, or None if missing or expired.
+
+        Args:
+            key: The cache key
+            allow_stale: Return expired entries instead of treating them as missing
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        value, age = entry
+        if age > self.ttl_seconds and not allow_stale:
+            return None
+        return value
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, age in seconds) for a key regardless of expiry, or None if missing"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        try:
+            return json.loads(row[0]), now - row[1]
+        except json.JSONDecodeError:
+            logger.warning("Discarding unreadable cache entry %s in %s", key, self.table)
+            self.delete(key)
+            return None
+
+    def get_many_entries(self, keys: Sequence[str]) -> Dict[str, Tuple[Any, float]]:
+        """Return {key: (value, age in seconds)} for the keys present, regardless of expiry"""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for start in range(0, len(keys), BATCH_SIZE):
+                batch = list(keys[start:start + BATCH_SIZE])
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._conn.execute(
+                    f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({placeholders})", batch
+                ).fetchall())
+                self._conn.execute(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key IN ({placeholders})", [now] + batch
+                )
+
+        entries = {}
+        for key, value, created_at in rows:
+            try:
+                entries[key] = (json.loads(value), now - created_at)
+            except json.JSONDecodeError:
+                logger.warning("Discarding unreadable cache entry %s in %s", key, self.table)
+                self.delete(key)
+        return entries
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entries if the cache is full"""
+        now = time.time()
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now)
+            )
+            self._row_estimate += 1
+            self._evict_if_needed()
+
+    def set_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """Store several values in one transaction"""
+        now = time.time()
+        rows = [(key, json.dumps(value, default=str), now, now) for key, value in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self._row_estimate += len(rows)
+            self._evict_if_needed()
+
+    def delete(self, key: str) -> None:
+        """Remove a single entry"""
+        with self._lock:
+            deleted = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount
+            self._row_estimate = max(0, self._row_estimate - deleted)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._row_estimate = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evict_if_needed(self) -> None:
+        """Trim the table back to max_entries, least recently used first (caller holds the lock)"""
+        if self._row_estimate <= self.max_entries * (1 + EVICTION_SLACK):
+            return
+
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        # Trimming whenever the table is above max_entries leaves EVICTION_SLACK
+        # worth of writes before the next count
+        overflow = max(0, count - self.max_entries)
+        if overflow:
+            # Expired entries are kept for stale reads until they fall out of the LRU window
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+            logger.debug("Evicted %d entries from %s", overflow, self.table)
+        self._row_estimate = count - overflow
+
+    async def aget(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key, allow_stale)
+
+    async def aget_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        return await asyncio.to_thread(self.get_entry, key)
+
+    async def aget_many_entries(self, keys: Sequence[str]) -> Dict[str, Tuple[Any, float]]:
+        return await asyncio.to_thread(self.get_many_entries, keys)
+
+    async def aset(self, key: str, value: Any) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    async def aset_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        await asyncio.to_thread(self.set_many, list(items))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+__all__ = ['PersistentCache']
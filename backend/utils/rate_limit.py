@@ -0,0 +1,57 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    The bucket holds up to capacity tokens and refills at rate tokens per second.
+    Acquiring is non-blocking: callers get back how long to wait instead, so they
+    can decide how to wait (sleep, reschedule, or give up).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    @classmethod
+    def per_minute(cls, limit: float, burst: Optional[float] = None) -> "TokenBucket":
+        """Create a bucket allowing limit tokens per minute (bursting up to burst, default limit)"""
+        return cls(rate=limit / 60.0, capacity=burst if burst is not None else limit)
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def wait_time(self, amount: float = 1.0) -> float:
+        """Seconds until amount tokens are available (0 if available now)"""
+        self._refill()
+        # Requests larger than the bucket are allowed once it is full
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.rate
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """
+        Take amount tokens if available.
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds to wait before retrying
+        """
+        wait = self.wait_time(amount)
+        if wait == 0.0:
+            self._tokens -= min(amount, self.capacity)
+        return wait
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+__all__ = ['TokenBucket']
@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def make_flight_key(*parts: Any) -> str:
+    """Build a canonical hash key from call arguments"""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """An in-flight upstream call and the number of callers waiting on it"""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical async calls into a single upstream request.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight await the same task and receive the same result (or exception).
+    The key is released as soon as the call finishes, so later calls go
+    upstream again. Results are shared between callers and must be treated
+    as read-only.
+
+    A caller being cancelled does not cancel the shared call for the others;
+    the upstream call is only cancelled once every waiting caller has gone.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn for the key, or join the identical call already in flight.
+
+        Args:
+            key: Identifies identical calls (see make_flight_key)
+            fn: Zero-argument coroutine function performing the upstream call
+
+        Returns:
+            The result of the shared call
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, k=key, f=flight: self._release(k, f))
+            metrics.increment("singleflight_calls", group=self.name)
+        else:
+            metrics.increment("singleflight_shared", group=self.name)
+            logger.debug("Joining in-flight %s call %s", self.name, key)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _release(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the exception as retrieved when nobody was left waiting for it
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def in_flight(self) -> int:
+        """Return the number of distinct calls currently in flight"""
+        return len(self._flights)
+
+
+__all__ = ['SingleFlight', 'make_flight_key']
@@ -310,6 +310,7 @@ export function createWorkflowVariable(
 // Chat message types
 export type DataFromLine = {
     token: string | null;
+    token_delta?: string | null;
     status: string | null;
     mission_proposal: MissionProposal | null;
     error: string | null;
@@ -3,6 +3,7 @@ import { v4 as uuidv4 } from 'uuid';
 
 interface DataFromLine {
     token: string | null;
+    token_delta: string | null;
     status: string | null;
     mission_proposal: MissionProposal | null;
     error: string | null;
@@ -13,6 +14,7 @@ interface DataFromLine {
 export function getDataFromLine(line: string): DataFromLine {
     const res: DataFromLine = {
         token: null,
+        token_delta: null,
         status: null,
         mission_proposal: null,
         error: null,
@@ -31,6 +33,9 @@ export function getDataFromLine(line: string): DataFromLine {
         if (data.token) {
             res.token = data.token;
         }
+        if (data.token_delta) {
+            res.token_delta = data.token_delta;
+        }
         if (data.status) {
             res.status = data.status;
         }
@@ -1,4 +1,4 @@
-import React, { createContext, useContext, useReducer, useCallback, useEffect } from 'react';
+import React, { createContext, useContext, useReducer, useCallback, useEffect, useRef } from 'react';
 import { Asset, ChatMessage, Mission as MissionType, Workflow as WorkflowType, Workspace as WorkspaceType, WorkspaceState, ItemView as ItemViewType, MissionProposal, DataFromLine, StageGeneratorResult, Step, WorkflowVariable } from '@/components/fractal-bot/types/index';
 import { Tool, ToolType } from '@/components/fractal-bot/types/tools';
 import { availableTools } from '@/components/fractal-bot/types/tools';
@@ -532,9 +532,19 @@ export function FractalBotProvider({ children }: { children: React.ReactNode })
         });
     }, [state.currentItemView, setItemView]);
 
+    // Answer text streamed so far, shown until the complete token arrives
+    const streamedTextRef = useRef('');
+
     // Business logic functions
     const processBotMessage = useCallback((data: DataFromLine) => {
+        if (data.token_delta) {
+            streamedTextRef.current += data.token_delta;
+            setStreamingMessage(streamedTextRef.current);
+        }
+
         if (data.token) {
+            streamedTextRef.current = '';
+            setStreamingMessage('');
             const newMessage: ChatMessage = {
                 id: (Date.now() + 1).toString(),
                 role: 'assistant',
@@ -575,7 +585,7 @@ export function FractalBotProvider({ children }: { children: React.ReactNode })
         }
 
         return data.token || "";
-    }, [state, setWorkspace, addStatusRecord, setMission, setMissionProposal, addMessage]);
+    }, [state, setWorkspace, addStatusRecord, setMission, setMissionProposal, addMessage, setStreamingMessage]);
 
     const sendMessage = useCallback(async (message: ChatMessage) => {
         addMessage(message);
@@ -625,6 +635,7 @@ export function FractalBotProvider({ children }: { children: React.ReactNode })
         } catch (error) {
             console.error('Error streaming message:', error);
         } finally {
+            streamedTextRef.current = '';
             setStreamingMessage('');
         }
     }, [state, processBotMessage, setWorkspace, setStreamingMessage, addMessage]);